@@ -1,15 +1,59 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify
+from flask import Flask, Response, abort, render_template, request, redirect, url_for, jsonify, stream_with_context
 import os
-import re
 import json
-import base64
-from urllib.error import HTTPError, URLError
-from urllib.parse import urlencode
-from urllib import request as urllib_request
+import time
+import uuid
+import click
+from sqlalchemy.exc import IntegrityError
+from werkzeug.datastructures import MultiDict
 from datetime import datetime, timedelta
-from sqlalchemy import text
-from database import db
+from database import db, migrate, opcoes_engine, configurar_sqlite
 from models import Profissional, Servico, ProfissionalServico, Agendamento
+from utils import ler_env
+from fila_whatsapp import (
+    enfileirar_mensagem,
+    enfileirar_lembretes,
+    executar_worker,
+    executar_agendador,
+    iniciar_drenagem_em_segundo_plano,
+    iniciar_agendador_em_segundo_plano,
+    resumo_lote
+)
+from lembretes_agendados import reprogramar_todos, agora_na_agenda
+from disponibilidade import (
+    carregar_indice_do_dia,
+    calcular_disponibilidade,
+    carregar_bitmaps_periodo,
+    buscar_proximos_horarios,
+    buscar_combos
+)
+from consulta_agendamentos import (
+    STATUS_AGENDAMENTO,
+    ESTADOS_LEMBRETE,
+    ler_filtros_agendamentos,
+    paginar_agendamentos
+)
+from entrada_whatsapp import (
+    extrair_eventos_meta,
+    extrair_evento_twilio,
+    registrar_eventos,
+    iniciar_aplicacao_em_segundo_plano,
+    executar_aplicador
+)
+from cache_referencia import obter_referencias, incrementar_versao, profissionais_da_agenda
+from versao_agenda import (
+    ler_versao_dia,
+    ultimo_id_alteracao,
+    carregar_alteracoes,
+    limpar_alteracoes_antigas,
+    obter_html_em_cache,
+    guardar_html_em_cache
+)
+from exportacao import FORMATOS_EXPORTACAO, gerar_exportacao
+from importacao import importar_agendamentos
+from conflito_horario import MENSAGEM_CONFLITO, eh_conflito_horario
+from metricas import instalar_metricas, metricas_ativas, gerar_texto_metricas
+from perfil_consultas import instalar_perfil_consultas
 
 def create_app():
     app = Flask(__name__)
@@ -36,20 +80,21 @@ def create_app():
     # CONFIGURAÇÃO DO BANCO
     app.config['SQLALCHEMY_DATABASE_URI'] = obter_database_uri()
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = opcoes_engine(app.config['SQLALCHEMY_DATABASE_URI'])
 
     db.init_app(app)
+    # O esquema é mantido pelas migrações: `flask --app app db upgrade`.
+    migrate.init_app(
+        app,
+        db,
+        directory=os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations"),
+        render_as_batch=True
+    )
 
     with app.app_context():
-        db.create_all()
-
-        def ler_env(nome, padrao=""):
-            valor = os.environ.get(nome, padrao)
-            if valor is None:
-                return ""
-            texto = str(valor).strip()
-            if len(texto) >= 2 and ((texto[0] == '"' and texto[-1] == '"') or (texto[0] == "'" and texto[-1] == "'")):
-                texto = texto[1:-1].strip()
-            return texto
+        configurar_sqlite(db.engine)
+        instalar_metricas(app, db.engine)
+        instalar_perfil_consultas(app, db.engine)
 
         def converter_hora_str_para_time(valor_hora):
             return datetime.strptime(valor_hora, "%H:%M").time()
@@ -58,324 +103,172 @@ def create_app():
             base = datetime.combine(datetime.today(), hora_inicio)
             return (base + timedelta(minutes=duracao_minutos)).time()
 
-        def verificar_conflito(profissional_id, data_agendamento, hora_inicio, hora_fim):
-            agendamentos = Agendamento.query.filter_by(
-                profissional_id=profissional_id,
-                data=data_agendamento
-            ).all()
-
-            for agendamento in agendamentos:
-                if hora_inicio < agendamento.hora_fim and hora_fim > agendamento.hora_inicio:
-                    return True
-
-            return False
-
         def buscar_disponibilidade(servico_id, data_texto):
             disponibilidade = {}
 
             if not servico_id or not data_texto:
                 return disponibilidade
 
-            servico = Servico.query.get(servico_id)
+            referencias = obter_referencias()
+            servico = referencias.servicos_por_id.get(servico_id)
             if not servico:
                 return disponibilidade
 
             data_agendamento = datetime.strptime(data_texto, "%Y-%m-%d").date()
 
-            vinculos = ProfissionalServico.query.filter_by(servico_id=servico.id).all()
-            profissional_ids = [v.profissional_id for v in vinculos]
-            profissionais = Profissional.query.filter(Profissional.id.in_(profissional_ids)).all() if profissional_ids else []
-
-            for profissional in profissionais:
-                inicio_turno = converter_hora_str_para_time(profissional.horario_inicio)
-                fim_turno = converter_hora_str_para_time(profissional.horario_fim)
-
-                cursor = datetime.combine(datetime.today(), inicio_turno)
-                limite = datetime.combine(datetime.today(), fim_turno)
-
-                while True:
-                    inicio_slot = cursor.time()
-                    fim_slot = calcular_hora_fim(inicio_slot, servico.duracao)
-
-                    if datetime.combine(datetime.today(), fim_slot) > limite:
-                        break
-
-                    if not verificar_conflito(
-                        profissional.id,
-                        data_agendamento,
-                        inicio_slot,
-                        fim_slot
-                    ):
-                        chave_hora = inicio_slot.strftime("%H:%M")
-                        if chave_hora not in disponibilidade:
-                            disponibilidade[chave_hora] = []
-
-                        disponibilidade[chave_hora].append(
-                            {
-                                "id": profissional.id,
-                                "nome": profissional.nome
-                            }
-                        )
-
-                    cursor += timedelta(minutes=30)
-
-            return disponibilidade
-
-        def normalizar_telefone(telefone):
-            digitos = re.sub(r"\D", "", telefone or "")
-            if not digitos:
-                return ""
-
-            if digitos.startswith("55"):
-                return digitos
-
-            if len(digitos) in (10, 11):
-                return f"55{digitos}"
-
-            return digitos
-
-        def telefone_para_twilio(telefone):
-            digitos = normalizar_telefone(telefone)
-            if not digitos:
-                return ""
-            return f"+{digitos}"
-
-        def montar_mensagem_confirmacao(agendamento):
-            return (
-                f"Olá, {agendamento.cliente_nome}! "
-                f"Lembrete do seu agendamento no dia {agendamento.data.strftime('%d/%m/%Y')}, "
-                f"às {agendamento.hora_inicio.strftime('%H:%M')}. "
-                "Responda 1 para confirmar ou 2 para cancelar."
-            )
-
-        def enviar_whatsapp_cloud_api(telefone, mensagem, api_token, phone_number_id):
-            api_version = ler_env("WHATSAPP_API_VERSION", "v21.0")
-            api_url = f"https://graph.facebook.com/{api_version}/{phone_number_id}/messages"
-
-            payload = json.dumps({
-                "messaging_product": "whatsapp",
-                "to": telefone,
-                "type": "text",
-                "text": {"body": mensagem}
-            }).encode("utf-8")
-
-            req = urllib_request.Request(
-                api_url,
-                data=payload,
-                headers={
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {api_token}"
-                },
-                method="POST"
-            )
-
-            try:
-                with urllib_request.urlopen(req, timeout=20) as response:
-                    return 200 <= response.status < 300
-            except Exception:
-                return False
-
-        def enviar_whatsapp_twilio(telefone, mensagem):
-            account_sid = ler_env("TWILIO_ACCOUNT_SID")
-            auth_token = ler_env("TWILIO_AUTH_TOKEN")
-            numero_origem = ler_env("TWILIO_WHATSAPP_FROM")
-
-            if not account_sid or not auth_token or not numero_origem:
-                return False
-
-            destino = telefone_para_twilio(telefone)
-            if not destino:
-                return False
-
-            api_url = f"https://api.twilio.com/2010-04-01/Accounts/{account_sid}/Messages.json"
-            payload = urlencode({
-                "To": f"whatsapp:{destino}",
-                "From": numero_origem,
-                "Body": mensagem
-            }).encode("utf-8")
-
-            credenciais = f"{account_sid}:{auth_token}".encode("utf-8")
-            auth_header = base64.b64encode(credenciais).decode("utf-8")
-
-            req = urllib_request.Request(
-                api_url,
-                data=payload,
-                headers={
-                    "Content-Type": "application/x-www-form-urlencoded",
-                    "Authorization": f"Basic {auth_header}"
-                },
-                method="POST"
-            )
-
-            try:
-                with urllib_request.urlopen(req, timeout=20) as response:
-                    return 200 <= response.status < 300
-            except HTTPError as erro_http:
-                try:
-                    detalhe = erro_http.read().decode("utf-8")
-                except Exception:
-                    detalhe = "sem detalhe"
-                print(f"[WHATSAPP TWILIO] HTTP {erro_http.code} | detalhe: {detalhe}")
-                return False
-            except URLError as erro_url:
-                print(f"[WHATSAPP TWILIO] Falha de conexão: {erro_url}")
-                return False
-            except Exception as erro_geral:
-                print(f"[WHATSAPP TWILIO] Erro inesperado: {erro_geral}")
-                return False
-
-        def enviar_whatsapp_confirmacao(agendamento):
-            modo_simulado = ler_env("WHATSAPP_SIMULADO", "1") == "1"
-            provider = ler_env("WHATSAPP_PROVIDER", "").lower()
-            telefone = normalizar_telefone(agendamento.cliente_telefone)
-            mensagem = montar_mensagem_confirmacao(agendamento)
-
-            twilio_configurado = bool(
-                ler_env("TWILIO_ACCOUNT_SID") and
-                ler_env("TWILIO_AUTH_TOKEN") and
-                ler_env("TWILIO_WHATSAPP_FROM")
-            )
-
-            if not provider:
-                provider = "twilio" if twilio_configurado else "meta"
-
-            if not telefone:
-                return False
-
-            if modo_simulado:
-                print(f"[WHATSAPP SIMULADO] Para: {telefone} | Msg: {mensagem}")
-                return True
-
-            if provider == "twilio":
-                return enviar_whatsapp_twilio(telefone, mensagem)
-
-            api_url = ler_env("WHATSAPP_API_URL")
-            api_token = ler_env("WHATSAPP_API_TOKEN")
-            phone_number_id = ler_env("WHATSAPP_PHONE_NUMBER_ID")
-
-            if phone_number_id and api_token:
-                return enviar_whatsapp_cloud_api(telefone, mensagem, api_token, phone_number_id)
-
-            if not api_url or not api_token:
-                return False
-
-            payload = json.dumps({
-                "phone": telefone,
-                "message": mensagem
-            }).encode("utf-8")
-
-            req = urllib_request.Request(
-                api_url,
-                data=payload,
-                headers={
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {api_token}"
-                },
-                method="POST"
-            )
-
-            try:
-                with urllib_request.urlopen(req, timeout=20) as response:
-                    return 200 <= response.status < 300
-            except Exception:
-                return False
-
-        def atualizar_status_por_resposta_whatsapp(remetente, texto_resposta):
-            resposta = (texto_resposta or "").strip()
-            if resposta not in ("1", "2"):
-                return False
-
-            telefone = normalizar_telefone(remetente)
-            if not telefone:
-                return False
-
-            hoje = datetime.today().date()
-            candidatos = Agendamento.query.filter(
-                Agendamento.data >= hoje
-            ).order_by(Agendamento.data.asc(), Agendamento.hora_inicio.asc()).all()
-
-            agendamento_alvo = None
-            for agendamento in candidatos:
-                if normalizar_telefone(agendamento.cliente_telefone) == telefone:
-                    agendamento_alvo = agendamento
-                    break
-
-            if not agendamento_alvo:
-                return False
-
-            agendamento_alvo.status = "confirmado" if resposta == "1" else "cancelado"
-            db.session.commit()
-            return True
-
-        def processar_lembretes_whatsapp():
-            amanha = datetime.today().date() + timedelta(days=1)
-
-            pendentes = Agendamento.query.filter(
-                Agendamento.data == amanha,
-                Agendamento.lembrete_whatsapp_ativo == True,
-                Agendamento.lembrete_whatsapp_enviado_em.is_(None)
-            ).all()
-
-            enviados = 0
-            falhas = 0
+            profissionais = referencias.profissionais_por_servico.get(servico.id, ())
+            indice = carregar_indice_do_dia(data_agendamento, [p.id for p in profissionais])
 
-            for agendamento in pendentes:
-                ok = enviar_whatsapp_confirmacao(agendamento)
-                if ok:
-                    agendamento.lembrete_whatsapp_enviado_em = datetime.utcnow()
-                    enviados += 1
-                else:
-                    falhas += 1
+            return calcular_disponibilidade(profissionais, indice, servico.duracao)
 
+        def processar_lembretes_whatsapp(lote_id=None):
+            amanha = agora_na_agenda().date() + timedelta(days=1)
+            total = enfileirar_lembretes(amanha, lote_id)
             db.session.commit()
-            return enviados, falhas
-
-        def garantir_colunas_agendamento():
-            db.session.execute(
-                text(
-                    """
-                    CREATE TABLE IF NOT EXISTS agendamento (
-                        id INTEGER NOT NULL,
-                        cliente_nome VARCHAR(100) NOT NULL DEFAULT '',
-                        cliente_telefone VARCHAR(20) NOT NULL DEFAULT '',
-                        profissional_id INTEGER,
-                        servico_id INTEGER,
-                        data DATE NOT NULL,
-                        hora_inicio TIME NOT NULL,
-                        hora_fim TIME NOT NULL,
-                        status VARCHAR(20),
-                        criado_em DATETIME,
-                        PRIMARY KEY (id),
-                        FOREIGN KEY(profissional_id) REFERENCES profissional (id),
-                        FOREIGN KEY(servico_id) REFERENCES servico (id)
-                    )
-                    """
-                )
-            )
-
-            colunas = db.session.execute(text("PRAGMA table_info(agendamento)")).fetchall()
-            nomes_colunas = [coluna[1] for coluna in colunas]
+            return total
 
-            if "cliente_nome" not in nomes_colunas:
-                db.session.execute(text("ALTER TABLE agendamento ADD COLUMN cliente_nome VARCHAR(100) NOT NULL DEFAULT ''"))
+        def ler_celulas_agenda(celulas):
+            pedidos = []
+            for celula in celulas:
+                try:
+                    profissional_id = int(celula.get("profissional_id") or 0)
+                except (TypeError, ValueError):
+                    profissional_id = 0
+                if not profissional_id:
+                    continue
 
-            if "cliente_telefone" not in nomes_colunas:
-                db.session.execute(text("ALTER TABLE agendamento ADD COLUMN cliente_telefone VARCHAR(20) NOT NULL DEFAULT ''"))
+                hora_inicio_texto = str(celula.get("hora_inicio") or "")[:5]
+                pedidos.append((
+                    profissional_id,
+                    hora_inicio_texto,
+                    converter_hora_str_para_time(hora_inicio_texto),
+                    str(celula.get("cliente_nome") or "").strip(),
+                    str(celula.get("cliente_telefone") or "").strip()
+                ))
+
+            return pedidos
+
+        def aplicar_celulas_agenda(data_agendamento, pedidos):
+            # Uma leitura dos agendamentos do dia para todas as células e um
+            # único commit; devolve só as células que mudaram de fato.
+            if not pedidos:
+                return []
+
+            existentes = {
+                (agendamento.profissional_id, agendamento.hora_inicio): agendamento
+                for agendamento in Agendamento.query.filter(
+                    Agendamento.data == data_agendamento,
+                    Agendamento.profissional_id.in_({pedido[0] for pedido in pedidos}),
+                    Agendamento.hora_inicio.in_({pedido[2] for pedido in pedidos})
+                ).all()
+            }
 
-            if "lembrete_whatsapp_ativo" not in nomes_colunas:
-                db.session.execute(text("ALTER TABLE agendamento ADD COLUMN lembrete_whatsapp_ativo BOOLEAN NOT NULL DEFAULT 0"))
+            alteradas = []
+            for profissional_id, hora_inicio_texto, hora_inicio, cliente_nome, cliente_telefone in pedidos:
+                chave = (profissional_id, hora_inicio)
+                existente = existentes.get(chave)
+                acao = None
 
-            if "lembrete_whatsapp_enviado_em" not in nomes_colunas:
-                db.session.execute(text("ALTER TABLE agendamento ADD COLUMN lembrete_whatsapp_enviado_em DATETIME"))
+                if cliente_nome:
+                    hora_fim = calcular_hora_fim(hora_inicio, 30)
+                    if existente:
+                        existente.cliente_nome = cliente_nome
+                        existente.cliente_telefone = cliente_telefone
+                        existente.hora_fim = hora_fim
+                        existente.status = "agendado"
+                        if db.session.is_modified(existente):
+                            acao = "atualizado"
+                    else:
+                        novo = Agendamento(
+                            cliente_nome=cliente_nome,
+                            cliente_telefone=cliente_telefone,
+                            profissional_id=profissional_id,
+                            servico_id=None,
+                            data=data_agendamento,
+                            hora_inicio=hora_inicio,
+                            hora_fim=hora_fim,
+                            status="agendado"
+                        )
+                        db.session.add(novo)
+                        existentes[chave] = novo
+                        acao = "criado"
+                elif existente:
+                    db.session.delete(existente)
+                    del existentes[chave]
+                    acao = "removido"
+
+                if acao:
+                    alteradas.append({
+                        "profissional_id": profissional_id,
+                        "hora_inicio": hora_inicio_texto,
+                        "cliente_nome": cliente_nome,
+                        "cliente_telefone": cliente_telefone,
+                        "acao": acao
+                    })
 
             db.session.commit()
+            return alteradas
 
-        garantir_colunas_agendamento()
+        def salvar_celulas_agenda(data_agendamento, celulas):
+            pedidos = ler_celulas_agenda(celulas)
+            try:
+                return aplicar_celulas_agenda(data_agendamento, pedidos), []
+            except IntegrityError as erro_banco:
+                db.session.rollback()
+                if not eh_conflito_horario(erro_banco):
+                    raise
+
+            # Alguma célula colidiu com outro agendamento (de outra tela ou
+            # de duração maior). Só nesse caso o lote é refeito célula a
+            # célula, para salvar as demais e apontar quais conflitaram.
+            alteradas = []
+            conflitos = []
+            for pedido in pedidos:
+                try:
+                    alteradas.extend(aplicar_celulas_agenda(data_agendamento, [pedido]))
+                except IntegrityError as erro_banco:
+                    db.session.rollback()
+                    if not eh_conflito_horario(erro_banco):
+                        raise
+                    conflitos.append({
+                        "profissional_id": pedido[0],
+                        "hora_inicio": pedido[1],
+                        "erro": MENSAGEM_CONFLITO
+                    })
+            return alteradas, conflitos
+
+        def responder_grade_em_cache(rota, data_agendamento, versao_referencias, renderizar):
+            # ETag forte a partir da versão do dia e dos cadastros: recarregar
+            # sem mudanças responde 304 sem consultar a tabela de agendamentos,
+            # e o HTML fica guardado por (rota, dia, versões).
+            versao_dia = ler_versao_dia(data_agendamento)
+            data_texto = data_agendamento.strftime("%Y-%m-%d")
+            etag = f"{rota}-{data_texto}-{versao_dia}-{versao_referencias}"
+
+            if request.if_none_match.contains(etag):
+                resposta = app.response_class(status=304)
+            else:
+                chave = (str(db.engine.url), rota, data_texto, versao_dia, versao_referencias)
+                html = obter_html_em_cache(chave)
+                if html is None:
+                    html = renderizar()
+                    guardar_html_em_cache(chave, html)
+                resposta = app.response_class(html, mimetype="text/html")
+
+            resposta.set_etag(etag)
+            resposta.headers["Cache-Control"] = "no-cache"
+            return resposta
 
         # =========================
         # ROTAS
         # =========================
 
+        @app.before_request
+        def garantir_agendador_de_lembretes():
+            # Sobe na primeira requisição, não no create_app: comandos como
+            # `flask db upgrade` não devem disparar o agendador.
+            iniciar_agendador_em_segundo_plano(app)
+
         @app.route("/")
         def index():
             return """
@@ -391,24 +284,38 @@ def create_app():
         def healthz():
             return "ok", 200
 
+        @app.route("/metrics")
+        def metrics():
+            if not metricas_ativas():
+                abort(404)
+
+            # Rota fechada por padrão: exige METRICAS_TOKEN, a não ser que
+            # METRICAS_PUBLICAS=1 (rede interna, coletor sem credencial).
+            if ler_env("METRICAS_PUBLICAS", "0") != "1":
+                token = ler_env("METRICAS_TOKEN", "")
+                if not token:
+                    abort(404)
+                if request.headers.get("Authorization", "") != f"Bearer {token}":
+                    abort(401)
+
+            return Response(gerar_texto_metricas(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
         # =========================
         # PROFISSIONAIS
         # =========================
 
         @app.route("/profissionais")
         def listar_profissionais():
-            profissionais = Profissional.query.all()
-            vinculos = ProfissionalServico.query.all()
-            servicos = Servico.query.all()
-
-            servicos_por_id = {servico.id: servico.nome for servico in servicos}
-            profissionais_servicos = {profissional.id: [] for profissional in profissionais}
-
-            for vinculo in vinculos:
-                if vinculo.profissional_id in profissionais_servicos:
-                    nome_servico = servicos_por_id.get(vinculo.servico_id)
-                    if nome_servico:
-                        profissionais_servicos[vinculo.profissional_id].append(nome_servico)
+            referencias = obter_referencias()
+            profissionais = referencias.profissionais
+            profissionais_servicos = {
+                profissional.id: [
+                    referencias.nomes_servicos[servico_id]
+                    for servico_id in referencias.servicos_por_profissional.get(profissional.id, ())
+                    if servico_id in referencias.nomes_servicos
+                ]
+                for profissional in profissionais
+            }
 
             return render_template(
                 "profissionais.html",
@@ -418,7 +325,7 @@ def create_app():
 
         @app.route("/profissionais/novo", methods=["GET", "POST"])
         def novo_profissional():
-            servicos = Servico.query.all()
+            servicos = obter_referencias().servicos
 
             if request.method == "POST":
                 nome = request.form["nome"]
@@ -441,6 +348,7 @@ def create_app():
                             servico_id=servico_id
                         )
                     )
+                incrementar_versao()
                 db.session.commit()
 
                 return redirect(url_for("listar_profissionais"))
@@ -449,9 +357,9 @@ def create_app():
         @app.route("/profissionais/<int:profissional_id>/editar", methods=["GET", "POST"])
         def editar_profissional(profissional_id):
             profissional = Profissional.query.get_or_404(profissional_id)
-            servicos = Servico.query.all()
-            vinculos_atuais = ProfissionalServico.query.filter_by(profissional_id=profissional_id).all()
-            servicos_selecionados = [vinculo.servico_id for vinculo in vinculos_atuais]
+            referencias = obter_referencias()
+            servicos = referencias.servicos
+            servicos_selecionados = list(referencias.servicos_por_profissional.get(profissional_id, ()))
 
             if request.method == "POST":
                 profissional.nome = request.form["nome"]
@@ -468,6 +376,7 @@ def create_app():
                         )
                     )
 
+                incrementar_versao()
                 db.session.commit()
                 return redirect(url_for("listar_profissionais"))
 
@@ -483,6 +392,7 @@ def create_app():
             profissional = Profissional.query.get_or_404(profissional_id)
             ProfissionalServico.query.filter_by(profissional_id=profissional_id).delete()
             db.session.delete(profissional)
+            incrementar_versao()
             db.session.commit()
             return redirect(url_for("listar_profissionais"))
 
@@ -492,7 +402,7 @@ def create_app():
 
         @app.route("/servicos")
         def listar_servicos():
-            servicos = Servico.query.all()
+            servicos = obter_referencias().servicos
             return render_template("servicos.html", servicos=servicos)
 
         @app.route("/servicos/novo", methods=["GET", "POST"])
@@ -505,6 +415,7 @@ def create_app():
                     duracao=duracao
                 )
                 db.session.add(novo)
+                incrementar_versao()
                 db.session.commit()
                 return redirect(url_for("listar_servicos"))
             return render_template("novo_servico.html")
@@ -515,24 +426,84 @@ def create_app():
 
         @app.route("/agendamentos")
         def listar_agendamentos():
-            agendamentos = Agendamento.query.order_by(Agendamento.data.asc(), Agendamento.hora_inicio.asc()).all()
-            profissionais = {p.id: p.nome for p in Profissional.query.all()}
-            servicos = {s.id: s.nome for s in Servico.query.all()}
+            filtros, erro = ler_filtros_agendamentos(request.args, agora_na_agenda().date())
+            por_pagina = min(max(request.args.get("por_pagina", default=50, type=int), 1), 200)
+            pagina = paginar_agendamentos(
+                filtros,
+                por_pagina,
+                depois=request.args.get("depois"),
+                antes=request.args.get("antes")
+            )
+            referencias = obter_referencias()
+            opcoes_profissionais = sorted(referencias.profissionais, key=lambda p: p.nome)
             whatsapp_modo_simulado = ler_env("WHATSAPP_SIMULADO", "1") == "1"
 
             enviados = request.args.get("enviados")
             falhas = request.args.get("falhas")
+            enfileirados = request.args.get("enfileirados")
+
+            # Mantém os filtros nos links de paginação.
+            parametros_filtro = {
+                "data_inicio": filtros["data_inicio"].strftime("%Y-%m-%d") if filtros["data_inicio"] else "",
+                "data_fim": filtros["data_fim"].strftime("%Y-%m-%d") if filtros["data_fim"] else "",
+                "profissional_id": filtros["profissional_id"] or "",
+                "status": filtros["status"] or "",
+                "lembrete": filtros["lembrete"] or "",
+                "por_pagina": por_pagina
+            }
 
             return render_template(
                 "agendamentos.html",
-                agendamentos=agendamentos,
-                profissionais=profissionais,
-                servicos=servicos,
+                agendamentos=pagina["agendamentos"],
+                proximo=pagina["proximo"],
+                anterior=pagina["anterior"],
+                profissionais=referencias.nomes_profissionais,
+                servicos=referencias.nomes_servicos,
+                opcoes_profissionais=opcoes_profissionais,
+                status_opcoes=STATUS_AGENDAMENTO,
+                lembrete_opcoes=ESTADOS_LEMBRETE,
+                filtros=parametros_filtro,
+                erro=erro,
                 whatsapp_modo_simulado=whatsapp_modo_simulado,
                 enviados=enviados,
-                falhas=falhas
+                falhas=falhas,
+                enfileirados=enfileirados
+            )
+
+        @app.route("/agendamentos/exportar")
+        def exportar_agendamentos():
+            formato = request.args.get("formato", "csv").lower()
+            if formato not in FORMATOS_EXPORTACAO:
+                return jsonify({"erro": "Formato deve ser csv ou ndjson."}), 400
+
+            # Sem data_inicio a exportação cobre todo o histórico.
+            filtros, erro = ler_filtros_agendamentos(request.args)
+            if erro:
+                return jsonify({"erro": erro}), 400
+
+            nome_arquivo = f"agendamentos.{formato}"
+            return Response(
+                stream_with_context(gerar_exportacao(filtros, formato)),
+                mimetype=FORMATOS_EXPORTACAO[formato],
+                headers={"Content-Disposition": f"attachment; filename={nome_arquivo}"}
             )
 
+        @app.route("/agendamentos/importar", methods=["POST"])
+        def importar_agendamentos_csv():
+            # Aceita o CSV como arquivo de formulário (`arquivo`) ou no corpo.
+            arquivo = request.files.get("arquivo")
+            dados = arquivo.read() if arquivo else request.get_data()
+            if not dados:
+                return jsonify({"erro": "Envie o CSV no campo 'arquivo' ou no corpo da requisição."}), 400
+
+            try:
+                texto = dados.decode("utf-8")
+            except UnicodeDecodeError:
+                texto = dados.decode("latin-1")
+
+            relatorio = importar_agendamentos(texto, simular=request.args.get("simular") == "1")
+            return jsonify(relatorio), 200
+
         @app.route("/agendamentos/<int:agendamento_id>/lembrete-whatsapp/ativar", methods=["POST"])
         def ativar_lembrete_whatsapp(agendamento_id):
             agendamento = Agendamento.query.get_or_404(agendamento_id)
@@ -551,21 +522,33 @@ def create_app():
 
         @app.route("/notificacoes/whatsapp/processar", methods=["POST"])
         def processar_notificacoes_whatsapp():
-            enviados, falhas = processar_lembretes_whatsapp()
-            return redirect(url_for("listar_agendamentos", enviados=enviados, falhas=falhas))
+            lote_id = uuid.uuid4().hex
+            total = processar_lembretes_whatsapp(lote_id)
+            iniciar_drenagem_em_segundo_plano(app)
+
+            return jsonify({
+                "tarefa_id": lote_id,
+                "total": total,
+                "progresso_url": url_for("progresso_tarefa_lembretes", tarefa_id=lote_id)
+            }), 202
+
+        @app.route("/notificacoes/whatsapp/tarefas/<tarefa_id>")
+        def progresso_tarefa_lembretes(tarefa_id):
+            resumo = resumo_lote(tarefa_id)
+            if not resumo["total"]:
+                return jsonify({"erro": "Tarefa não encontrada ou sem mensagens."}), 404
+
+            resumo["tarefa_id"] = tarefa_id
+            return jsonify(resumo), 200
 
         @app.route("/agendamentos/<int:agendamento_id>/lembrete-whatsapp/enviar", methods=["POST"])
         def enviar_lembrete_whatsapp_agendamento(agendamento_id):
             agendamento = Agendamento.query.get_or_404(agendamento_id)
-            ok = enviar_whatsapp_confirmacao(agendamento)
-
-            if ok:
-                agendamento.lembrete_whatsapp_ativo = True
-                agendamento.lembrete_whatsapp_enviado_em = datetime.utcnow()
-                db.session.commit()
-                return redirect(url_for("listar_agendamentos", enviados=1, falhas=0))
+            enfileirar_mensagem(agendamento, "manual")
+            db.session.commit()
+            iniciar_drenagem_em_segundo_plano(app)
 
-            return redirect(url_for("listar_agendamentos", enviados=0, falhas=1))
+            return redirect(url_for("listar_agendamentos", enfileirados=1))
 
         @app.route("/webhooks/whatsapp", methods=["GET", "POST"])
         def webhook_whatsapp():
@@ -581,39 +564,24 @@ def create_app():
                     return challenge, 200
                 return "Token inválido", 403
 
+            # Só grava a caixa de entrada e responde; as respostas são
+            # aplicadas em lote logo depois, fora da requisição.
             if provider == "twilio":
-                remetente = request.form.get("From", "")
-                texto = request.form.get("Body", "")
-
-                if remetente.lower().startswith("whatsapp:"):
-                    remetente = remetente.split(":", 1)[1]
-
-                atualizar_status_por_resposta_whatsapp(remetente, texto)
+                registrar_eventos([extrair_evento_twilio(request.form)])
+                iniciar_aplicacao_em_segundo_plano(app)
                 return "", 200
 
             payload = request.get_json(silent=True) or {}
-
-            entries = payload.get("entry", [])
-            for entry in entries:
-                changes = entry.get("changes", [])
-                for change in changes:
-                    value = change.get("value", {})
-                    messages = value.get("messages", [])
-
-                    for mensagem in messages:
-                        if mensagem.get("type") != "text":
-                            continue
-
-                        remetente = mensagem.get("from", "")
-                        texto = mensagem.get("text", {}).get("body", "")
-                        atualizar_status_por_resposta_whatsapp(remetente, texto)
+            registrar_eventos(extrair_eventos_meta(payload))
+            iniciar_aplicacao_em_segundo_plano(app)
 
             return jsonify({"status": "ok"}), 200
 
         @app.route("/agendamentos/novo", methods=["GET", "POST"])
         def novo_agendamento():
-            servicos = Servico.query.all()
-            profissionais = Profissional.query.all()
+            referencias = obter_referencias()
+            servicos = referencias.servicos
+            profissionais = referencias.profissionais
 
             servico_id_query = request.args.get("servico_id", type=int)
             data_query = request.args.get("data", default="")
@@ -655,21 +623,19 @@ def create_app():
                         erro=erro
                     )
 
-                servico = Servico.query.get_or_404(servico_id)
+                servico = referencias.servicos_por_id.get(servico_id)
+                if not servico:
+                    abort(404)
                 data_agendamento = datetime.strptime(data_texto, "%Y-%m-%d").date()
                 hora_inicio = converter_hora_str_para_time(hora_inicio_texto)
                 hora_fim = calcular_hora_fim(hora_inicio, servico.duracao)
 
-                vinculo = ProfissionalServico.query.filter_by(
-                    profissional_id=profissional_id,
-                    servico_id=servico_id
-                ).first()
-
-                if not vinculo:
+                if (profissional_id, servico_id) not in referencias.vinculos:
                     erro = "Esse profissional não está vinculado ao serviço selecionado."
-                elif verificar_conflito(profissional_id, data_agendamento, hora_inicio, hora_fim):
-                    erro = "Conflito de horário: já existe agendamento nesse intervalo."
                 else:
+                    # Inserção otimista: quem garante que não há sobreposição é
+                    # a restrição do banco, então duas reservas simultâneas
+                    # não passam juntas.
                     novo = Agendamento(
                         cliente_nome=cliente_nome,
                         cliente_telefone=cliente_telefone,
@@ -681,8 +647,15 @@ def create_app():
                         status="agendado"
                     )
                     db.session.add(novo)
-                    db.session.commit()
-                    return redirect(url_for("listar_agendamentos"))
+                    try:
+                        db.session.commit()
+                    except IntegrityError as erro_banco:
+                        db.session.rollback()
+                        if not eh_conflito_horario(erro_banco):
+                            raise
+                        erro = MENSAGEM_CONFLITO
+                    else:
+                        return redirect(url_for("listar_agendamentos"))
 
                 disponibilidade = buscar_disponibilidade(servico_id, data_texto)
 
@@ -696,144 +669,398 @@ def create_app():
                 erro=erro
             )
 
+        @app.route("/disponibilidade/proximos")
+        def proximos_horarios_livres():
+            servico_id = request.args.get("servico_id", type=int)
+            profissional_id = request.args.get("profissional_id", type=int)
+            limite = min(max(request.args.get("limite", default=10, type=int), 1), 100)
+
+            if not servico_id:
+                return jsonify({"erro": "Informe o serviço."}), 400
+
+            referencias = obter_referencias()
+            servico = referencias.servicos_por_id.get(servico_id)
+            if not servico:
+                return jsonify({"erro": "Serviço não encontrado."}), 404
+
+            agora = agora_na_agenda()
+            try:
+                data_inicio_texto = request.args.get("data_inicio") or agora.strftime("%Y-%m-%d")
+                data_inicio = datetime.strptime(data_inicio_texto, "%Y-%m-%d").date()
+                data_fim_texto = request.args.get("data_fim")
+                data_fim = (
+                    datetime.strptime(data_fim_texto, "%Y-%m-%d").date()
+                    if data_fim_texto else data_inicio + timedelta(days=60)
+                )
+            except ValueError:
+                return jsonify({"erro": "Datas devem estar no formato AAAA-MM-DD."}), 400
+
+            if data_fim < data_inicio:
+                return jsonify({"erro": "A data final deve ser posterior à data inicial."}), 400
+
+            if (data_fim - data_inicio).days > 180:
+                data_fim = data_inicio + timedelta(days=180)
+
+            profissionais = referencias.profissionais_por_servico.get(servico.id, ())
+            if profissional_id:
+                profissionais = [p for p in profissionais if p.id == profissional_id]
+                if not profissionais:
+                    return jsonify({"erro": "Esse profissional não está vinculado ao serviço selecionado."}), 400
+
+            bitmaps = carregar_bitmaps_periodo(data_inicio, data_fim, [p.id for p in profissionais])
+            datas = [data_inicio + timedelta(days=i) for i in range((data_fim - data_inicio).days + 1)]
+            minuto_minimo = {agora.date(): agora.hour * 60 + agora.minute + 1}
+
+            horarios = buscar_proximos_horarios(
+                profissionais,
+                bitmaps,
+                datas,
+                servico.duracao,
+                limite,
+                minuto_minimo=minuto_minimo
+            )
+
+            return jsonify({
+                "servico": {"id": servico.id, "nome": servico.nome, "duracao": servico.duracao},
+                "data_inicio": data_inicio.strftime("%Y-%m-%d"),
+                "data_fim": data_fim.strftime("%Y-%m-%d"),
+                "horarios": horarios
+            }), 200
+
+        @app.route("/disponibilidade/combo")
+        def disponibilidade_combo():
+            servico_ids = [
+                int(parte)
+                for valor in request.args.getlist("servico_ids")
+                for parte in valor.split(",")
+                if parte.strip().isdigit()
+            ]
+            limite = min(max(request.args.get("limite", default=20, type=int), 1), 100)
+
+            if not servico_ids:
+                return jsonify({"erro": "Informe ao menos um serviço."}), 400
+
+            if len(servico_ids) > 5:
+                return jsonify({"erro": "Informe no máximo 5 serviços por combo."}), 400
+
+            agora = agora_na_agenda()
+            try:
+                data_texto = request.args.get("data") or agora.strftime("%Y-%m-%d")
+                data_agendamento = datetime.strptime(data_texto, "%Y-%m-%d").date()
+            except ValueError:
+                return jsonify({"erro": "Data deve estar no formato AAAA-MM-DD."}), 400
+
+            referencias = obter_referencias()
+            if any(servico_id not in referencias.servicos_por_id for servico_id in servico_ids):
+                return jsonify({"erro": "Serviço não encontrado."}), 404
+
+            etapas = [
+                (
+                    referencias.servicos_por_id[servico_id],
+                    list(referencias.profissionais_por_servico.get(servico_id, ()))
+                )
+                for servico_id in servico_ids
+            ]
+
+            profissional_ids = sorted({p.id for _, profissionais in etapas for p in profissionais})
+            bitmaps = carregar_bitmaps_periodo(data_agendamento, data_agendamento, profissional_ids)
+            minuto_minimo = agora.hour * 60 + agora.minute + 1 if data_agendamento == agora.date() else 0
+
+            opcoes = buscar_combos(etapas, bitmaps, data_agendamento, limite, minuto_minimo=minuto_minimo)
+
+            return jsonify({
+                "data": data_agendamento.strftime("%Y-%m-%d"),
+                "servicos": [
+                    {"id": servico.id, "nome": servico.nome, "duracao": servico.duracao}
+                    for servico, _ in etapas
+                ],
+                "opcoes": opcoes
+            }), 200
+
         @app.route("/agenda/manual", methods=["GET", "POST"])
         def agenda_manual():
-            data_texto = request.args.get("data") or request.form.get("data") or datetime.today().strftime("%Y-%m-%d")
-            data_agendamento = datetime.strptime(data_texto, "%Y-%m-%d").date()
+            payload = None
+            if request.method == "POST" and request.is_json:
+                payload = request.get_json(silent=True)
+                if not isinstance(payload, dict):
+                    return jsonify({"erro": "Envie um objeto JSON com \"data\" e \"celulas\"."}), 400
+
+            def recusar(mensagem):
+                if payload is not None:
+                    return jsonify({"erro": mensagem}), 400
+                return mensagem, 400
+
+            data_texto = str(
+                request.args.get("data")
+                or (payload or {}).get("data")
+                or request.form.get("data")
+                or agora_na_agenda().strftime("%Y-%m-%d")
+            )
+            try:
+                data_agendamento = datetime.strptime(data_texto, "%Y-%m-%d").date()
+            except ValueError:
+                return recusar("Data deve estar no formato AAAA-MM-DD.")
 
-            profissionais_reais = Profissional.query.order_by(Profissional.nome.asc()).limit(5).all()
+            referencias = obter_referencias()
+            profissionais_reais = profissionais_da_agenda(referencias)
             profissionais = [{"id": p.id, "nome": p.nome} for p in profissionais_reais]
 
             while len(profissionais) < 5:
                 profissionais.append({"id": None, "nome": "(sem profissional)"})
 
             if request.method == "POST":
-                profissional_id = request.form.get("profissional_id", type=int)
-                hora_inicio_texto = request.form["hora_inicio"]
-                cliente_nome = request.form.get("cliente_nome", "").strip()
-                cliente_telefone = request.form.get("cliente_telefone", "").strip()
+                # Uma ou várias células por envio: o formulário de cada célula
+                # manda um valor de cada campo; o modo em lote manda listas
+                # paralelas ou JSON com "celulas".
+                if payload is not None:
+                    celulas = payload.get("celulas") or []
+                    if not isinstance(celulas, list) or not all(isinstance(celula, dict) for celula in celulas):
+                        return recusar("\"celulas\" deve ser uma lista de objetos.")
+                else:
+                    campos = ("profissional_id", "hora_inicio", "cliente_nome", "cliente_telefone")
+                    colunas = [request.form.getlist(campo) for campo in campos]
+                    # zip cortaria em silêncio as células de um campo faltando.
+                    if len({len(coluna) for coluna in colunas}) > 1:
+                        return recusar("Formulário incompleto: cada célula precisa de todos os campos.")
+                    celulas = [dict(zip(campos, valores)) for valores in zip(*colunas)]
 
-                if profissional_id:
-                    hora_inicio = converter_hora_str_para_time(hora_inicio_texto)
-                    hora_fim = calcular_hora_fim(hora_inicio, 30)
+                try:
+                    alteradas, conflitos = salvar_celulas_agenda(data_agendamento, celulas)
+                except ValueError:
+                    return recusar("Horários devem estar no formato HH:MM.")
 
-                    existente = Agendamento.query.filter_by(
-                        data=data_agendamento,
-                        profissional_id=profissional_id,
-                        hora_inicio=hora_inicio
-                    ).first()
-
-                    if cliente_nome:
-                        if existente:
-                            existente.cliente_nome = cliente_nome
-                            existente.cliente_telefone = cliente_telefone
-                            existente.hora_fim = hora_fim
-                            existente.status = "agendado"
-                        else:
-                            novo = Agendamento(
-                                cliente_nome=cliente_nome,
-                                cliente_telefone=cliente_telefone,
-                                profissional_id=profissional_id,
-                                servico_id=None,
-                                data=data_agendamento,
-                                hora_inicio=hora_inicio,
-                                hora_fim=hora_fim,
-                                status="agendado"
-                            )
-                            db.session.add(novo)
-                    elif existente:
-                        db.session.delete(existente)
-
-                    db.session.commit()
+                if payload is not None or request.accept_mimetypes.best == "application/json":
+                    return jsonify({"data": data_texto, "celulas": alteradas, "conflitos": conflitos}), 200
+
+                if conflitos:
+                    voltar = url_for("agenda_manual", data=data_texto)
+                    return f"""
+                    <p>{MENSAGEM_CONFLITO}</p>
+                    <p><a href="{voltar}">Voltar para a agenda</a></p>
+                    """, 409
 
                 return redirect(url_for("agenda_manual", data=data_texto))
 
-            horarios = []
-            cursor = datetime.strptime("08:00", "%H:%M")
-            fim = datetime.strptime("18:30", "%H:%M")
-            while cursor <= fim:
-                horarios.append(cursor.strftime("%H:%M"))
-                cursor += timedelta(minutes=30)
+            def renderizar():
+                horarios = []
+                cursor = datetime.strptime("08:00", "%H:%M")
+                fim = datetime.strptime("18:30", "%H:%M")
+                while cursor <= fim:
+                    horarios.append(cursor.strftime("%H:%M"))
+                    cursor += timedelta(minutes=30)
 
-            ids_profissionais = [p["id"] for p in profissionais if p["id"] is not None]
-            agendamentos = (
-                Agendamento.query.filter(
-                    Agendamento.data == data_agendamento,
-                    Agendamento.profissional_id.in_(ids_profissionais)
-                ).all()
-                if ids_profissionais else []
-            )
+                # O id vem antes dos agendamentos: um evento que chegue no meio
+                # é reenviado pelo SSE e reaplicado sem efeito colateral.
+                ultimo_evento_id = ultimo_id_alteracao(data_agendamento)
+                ids_profissionais = [p["id"] for p in profissionais if p["id"] is not None]
+                agendamentos = (
+                    Agendamento.query.filter(
+                        Agendamento.data == data_agendamento,
+                        Agendamento.profissional_id.in_(ids_profissionais)
+                    ).all()
+                    if ids_profissionais else []
+                )
 
-            agenda_mapa = {}
-            for agendamento in agendamentos:
-                chave = (agendamento.hora_inicio.strftime("%H:%M"), agendamento.profissional_id)
-                agenda_mapa[chave] = {
-                    "cliente_nome": agendamento.cliente_nome,
-                    "cliente_telefone": agendamento.cliente_telefone or ""
-                }
+                agenda_mapa = {}
+                for agendamento in agendamentos:
+                    chave = (agendamento.hora_inicio.strftime("%H:%M"), agendamento.profissional_id)
+                    agenda_mapa[chave] = {
+                        "cliente_nome": agendamento.cliente_nome,
+                        "cliente_telefone": agendamento.cliente_telefone or ""
+                    }
+
+                return render_template(
+                    "agenda_manual.html",
+                    dia=data_agendamento.strftime("%d/%m/%Y"),
+                    data_iso=data_texto,
+                    horarios=horarios,
+                    profissionais=profissionais,
+                    agenda_mapa=agenda_mapa,
+                    ultimo_evento_id=ultimo_evento_id
+                )
 
-            return render_template(
-                "agenda_manual.html",
-                dia=data_agendamento.strftime("%d/%m/%Y"),
-                data_iso=data_texto,
-                horarios=horarios,
-                profissionais=profissionais,
-                agenda_mapa=agenda_mapa
-            )
+            return responder_grade_em_cache("manual", data_agendamento, referencias.versao, renderizar)
 
         @app.route("/agenda/manual-preview")
         def agenda_manual_preview():
-            data_texto = request.args.get("data") or datetime.today().strftime("%Y-%m-%d")
+            data_texto = request.args.get("data") or agora_na_agenda().strftime("%Y-%m-%d")
             try:
                 data_agendamento = datetime.strptime(data_texto, "%Y-%m-%d").date()
             except ValueError:
-                data_agendamento = datetime.today().date()
+                data_agendamento = agora_na_agenda().date()
                 data_texto = data_agendamento.strftime("%Y-%m-%d")
 
-            profissionais_reais = Profissional.query.order_by(Profissional.nome.asc()).limit(5).all()
+            referencias = obter_referencias()
+            profissionais_reais = profissionais_da_agenda(referencias)
             profissionais = [{"id": p.id, "nome": p.nome} for p in profissionais_reais]
 
             while len(profissionais) < 5:
                 profissionais.append({"id": None, "nome": "(sem profissional)"})
 
-            horarios = []
-            cursor = datetime.strptime("08:00", "%H:%M")
-            fim = datetime.strptime("18:30", "%H:%M")
-            while cursor <= fim:
-                horarios.append(cursor.strftime("%H:%M"))
-                cursor += timedelta(minutes=30)
+            def renderizar():
+                horarios = []
+                cursor = datetime.strptime("08:00", "%H:%M")
+                fim = datetime.strptime("18:30", "%H:%M")
+                while cursor <= fim:
+                    horarios.append(cursor.strftime("%H:%M"))
+                    cursor += timedelta(minutes=30)
 
-            agenda_mapa = {horario: ["", "", "", "", ""] for horario in horarios}
-            indice_profissional = {
-                p["id"]: indice for indice, p in enumerate(profissionais) if p["id"] is not None
-            }
+                agenda_mapa = {horario: ["", "", "", "", ""] for horario in horarios}
+                indice_profissional = {
+                    p["id"]: indice for indice, p in enumerate(profissionais) if p["id"] is not None
+                }
 
-            ids_profissionais = [p["id"] for p in profissionais if p["id"] is not None]
-            agendamentos = (
-                Agendamento.query.filter(
-                    Agendamento.data == data_agendamento,
-                    Agendamento.profissional_id.in_(ids_profissionais)
-                ).all()
-                if ids_profissionais else []
-            )
+                ultimo_evento_id = ultimo_id_alteracao(data_agendamento)
+                ids_profissionais = [p["id"] for p in profissionais if p["id"] is not None]
+                agendamentos = (
+                    Agendamento.query.filter(
+                        Agendamento.data == data_agendamento,
+                        Agendamento.profissional_id.in_(ids_profissionais)
+                    ).all()
+                    if ids_profissionais else []
+                )
 
-            for agendamento in agendamentos:
-                horario = agendamento.hora_inicio.strftime("%H:%M")
-                indice = indice_profissional.get(agendamento.profissional_id)
-                if indice is None or horario not in agenda_mapa:
-                    continue
+                for agendamento in agendamentos:
+                    horario = agendamento.hora_inicio.strftime("%H:%M")
+                    indice = indice_profissional.get(agendamento.profissional_id)
+                    if indice is None or horario not in agenda_mapa:
+                        continue
+
+                    agenda_mapa[horario][indice] = agendamento.cliente_nome
+
+                return render_template(
+                    "agenda_manual_preview.html",
+                    dia=data_agendamento.strftime("%d/%m/%Y"),
+                    data_iso=data_texto,
+                    horarios=horarios,
+                    profissionais=profissionais,
+                    agenda_mapa=agenda_mapa,
+                    ultimo_evento_id=ultimo_evento_id
+                )
 
-                agenda_mapa[horario][indice] = agendamento.cliente_nome
+            return responder_grade_em_cache("preview", data_agendamento, referencias.versao, renderizar)
 
-            return render_template(
-                "agenda_manual_preview.html",
-                dia=data_agendamento.strftime("%d/%m/%Y"),
-                data_iso=data_texto,
-                horarios=horarios,
-                profissionais=profissionais,
-                agenda_mapa=agenda_mapa
+        @app.route("/agenda/eventos")
+        def eventos_agenda():
+            # Server-Sent Events por dia. O feed é a tabela alteracao_agenda,
+            # então funciona entre workers sem broker: cada conexão confere a
+            # versão do dia (chave primária) e só lê eventos quando ela muda.
+            data_texto = request.args.get("data") or agora_na_agenda().strftime("%Y-%m-%d")
+            try:
+                data_agendamento = datetime.strptime(data_texto, "%Y-%m-%d").date()
+            except ValueError:
+                return jsonify({"erro": "Data deve estar no formato AAAA-MM-DD."}), 400
+
+            ultimo_id = request.headers.get("Last-Event-ID", type=int)
+            if ultimo_id is None:
+                ultimo_id = request.args.get("desde", default=0, type=int)
+
+            intervalo = float(ler_env("AGENDA_SSE_INTERVALO", "1") or 1)
+            duracao_maxima = float(ler_env("AGENDA_SSE_DURACAO_MAXIMA", "300") or 300)
+
+            def gerar():
+                nonlocal ultimo_id
+                # O navegador reconecta sozinho com Last-Event-ID; conexões
+                # curtas evitam prender workers indefinidamente.
+                yield "retry: 3000\n\n"
+                inicio = time.monotonic()
+                ultimo_envio = inicio
+                versao_vista = None
+
+                while time.monotonic() - inicio < duracao_maxima:
+                    versao = ler_versao_dia(data_agendamento)
+                    if versao != versao_vista:
+                        for alteracao in carregar_alteracoes(data_agendamento, ultimo_id):
+                            ultimo_id = alteracao.pop("id")
+                            yield f"id: {ultimo_id}\ndata: {json.dumps(alteracao, ensure_ascii=False)}\n\n"
+                            ultimo_envio = time.monotonic()
+                        versao_vista = versao
+                    elif time.monotonic() - ultimo_envio >= 15:
+                        yield ": ping\n\n"
+                        ultimo_envio = time.monotonic()
+
+                    # Fecha a transação para enxergar commits de outros
+                    # processos e devolver a conexão ao pool entre consultas.
+                    db.session.rollback()
+                    time.sleep(intervalo)
+
+            return app.response_class(
+                stream_with_context(gerar()),
+                mimetype="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
             )
 
+        # =========================
+        # COMANDOS
+        # =========================
+
+        @app.cli.command("processar-fila-whatsapp")
+        @click.option("--continuo", is_flag=True, help="Continua consultando a fila até ser interrompido.")
+        @click.option("--intervalo", default=5.0, show_default=True, help="Segundos entre consultas no modo contínuo.")
+        @click.option("--lote", default=50, show_default=True, help="Mensagens por lote.")
+        @click.option("--concorrencia", default=None, type=int, help="Envios simultâneos (padrão: WHATSAPP_CONCORRENCIA).")
+        def processar_fila_whatsapp_comando(continuo, intervalo, lote, concorrencia):
+            executar_worker(app, continuo, intervalo, lote, concorrencia)
+
+        @app.cli.command("exportar-agendamentos")
+        @click.option("--formato", type=click.Choice(sorted(FORMATOS_EXPORTACAO)), default="csv", show_default=True)
+        @click.option("--saida", type=click.File("w", encoding="utf-8"), default="-", help="Arquivo de saída (padrão: stdout).")
+        @click.option("--data-inicio", default=None, help="AAAA-MM-DD")
+        @click.option("--data-fim", default=None, help="AAAA-MM-DD")
+        def exportar_agendamentos_comando(formato, saida, data_inicio, data_fim):
+            filtros, erro = ler_filtros_agendamentos(
+                MultiDict({"data_inicio": data_inicio or "", "data_fim": data_fim or ""})
+            )
+            if erro:
+                raise click.BadParameter(erro)
+
+            for bloco in gerar_exportacao(filtros, formato):
+                saida.write(bloco)
+
+        @app.cli.command("importar-agendamentos")
+        @click.argument("arquivo", type=click.File("rb"))
+        @click.option("--simular", is_flag=True, help="Só valida; não grava nada.")
+        @click.option("--lote", default=1000, show_default=True, help="Linhas por transação.")
+        def importar_agendamentos_comando(arquivo, simular, lote):
+            dados = arquivo.read()
+            try:
+                texto = dados.decode("utf-8")
+            except UnicodeDecodeError:
+                texto = dados.decode("latin-1")
+
+            relatorio = importar_agendamentos(texto, tamanho_lote=lote, simular=simular)
+            for erro in relatorio["erros"]:
+                click.echo(f"linha {erro['linha']}: {' '.join(erro['erros'])}", err=True)
+            click.echo(
+                f"total {relatorio['total']} | válidas {relatorio['validos']} | "
+                f"importadas {relatorio['importados']} | com erro {len(relatorio['erros'])}"
+            )
+
+        @app.cli.command("limpar-alteracoes-agenda")
+        @click.option("--dias", default=7, show_default=True, help="Mantém os eventos mais recentes que isso.")
+        def limpar_alteracoes_agenda_comando(dias):
+            removidas = limpar_alteracoes_antigas(dias)
+            click.echo(f"{removidas} alterações removidas.")
+
+        @app.cli.command("aplicar-respostas-whatsapp")
+        @click.option("--continuo", is_flag=True, help="Continua consultando a caixa de entrada até ser interrompido.")
+        @click.option("--intervalo", default=2.0, show_default=True, help="Segundos entre consultas no modo contínuo.")
+        @click.option("--lote", default=200, show_default=True, help="Respostas por transação.")
+        def aplicar_respostas_whatsapp_comando(continuo, intervalo, lote):
+            executar_aplicador(app, continuo, intervalo, lote)
+
+        @app.cli.command("agendar-lembretes")
+        @click.option("--continuo", is_flag=True, help="Continua consultando os lembretes programados até ser interrompido.")
+        @click.option("--intervalo", default=30.0, show_default=True, help="Segundos entre consultas no modo contínuo.")
+        @click.option("--lote", default=100, show_default=True, help="Lembretes por transação.")
+        def agendar_lembretes_comando(continuo, intervalo, lote):
+            executar_agendador(app, continuo, intervalo, lote)
+
+        @app.cli.command("reprogramar-lembretes")
+        def reprogramar_lembretes_comando():
+            total = reprogramar_todos()
+            click.echo(f"{total} lembretes programados.")
+
     return app
 
 
@@ -0,0 +1,238 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+from datetime import date, time as hora, timedelta
+
+# Conferências da disponibilidade: cada caso monta uma agenda pequena num
+# SQLite temporário e compara o resultado (e o número de consultas SQL) com
+# o esperado. Sai com código 1 se algum caso falhar.
+# Uso (na raiz do projeto, também no CI):
+#   python -m benchmarks.conferir_disponibilidade [--database-url ...]
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DIA = date(2030, 3, 12)
+
+
+def configurar_ambiente(args):
+    os.environ.update({
+        "WHATSAPP_FILA_EM_PROCESSO": "0",
+        "LEMBRETES_AGENDADOR_EM_PROCESSO": "0",
+        "WHATSAPP_ENTRADA_EM_PROCESSO": "0",
+        "METRICAS_ATIVAS": "0"
+    })
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        os.environ.pop("DATABASE_URL", None)
+        os.environ["RENDER_DISK_PATH"] = tempfile.mkdtemp(prefix="conferir_disponibilidade_")
+
+
+def cadastrar(profissionais, duracoes=(30,)):
+    # profissionais: lista de (horario_inicio, horario_fim)
+    from database import db
+    from models import Profissional, Servico, ProfissionalServico
+    from cache_referencia import incrementar_versao
+
+    cadastrados = [
+        Profissional(nome=f"Profissional {indice}", horario_inicio=inicio, horario_fim=fim)
+        for indice, (inicio, fim) in enumerate(profissionais)
+    ]
+    servicos = [Servico(nome=f"Serviço {duracao}", duracao=duracao) for duracao in duracoes]
+    db.session.add_all(cadastrados + servicos)
+    db.session.flush()
+    db.session.add_all([
+        ProfissionalServico(profissional_id=profissional.id, servico_id=servico.id)
+        for profissional in cadastrados
+        for servico in servicos
+    ])
+    incrementar_versao()
+    db.session.commit()
+    return cadastrados, servicos
+
+
+def agendar(profissional, data, inicio, fim, servico=None):
+    from database import db
+    from models import Agendamento
+
+    db.session.add(Agendamento(
+        cliente_nome="Cliente",
+        cliente_telefone="11999990000",
+        profissional_id=profissional.id,
+        servico_id=servico.id if servico else None,
+        data=data,
+        hora_inicio=hora(*inicio),
+        hora_fim=hora(*fim)
+    ))
+    db.session.commit()
+
+
+def conferir(condicao, mensagem):
+    if not condicao:
+        raise AssertionError(mensagem)
+
+
+# =========================
+# CASOS
+# =========================
+
+
+def caso_uma_consulta_por_dia():
+    # O índice do dia sai de uma consulta só, qualquer que seja o número de
+    # profissionais e agendamentos; o cálculo dos horários não vai ao banco.
+    from disponibilidade import carregar_indice_do_dia, calcular_disponibilidade
+    from perfil_consultas import coletar_consultas
+    from cache_referencia import obter_referencias
+    from flask import current_app
+
+    profissionais, (servico,) = cadastrar([("08:00", "18:00")] * 6)
+    for profissional in profissionais:
+        for inicio in range(8, 18, 2):
+            agendar(profissional, DIA, (inicio, 0), (inicio, 45), servico)
+        agendar(profissional, DIA + timedelta(days=1), (9, 0), (12, 0), servico)
+
+    # Como na rota: profissionais e serviço vêm do cache de cadastros.
+    referencias = obter_referencias()
+    servico = referencias.servicos_por_id[servico.id]
+    profissionais = referencias.profissionais_por_servico[servico.id]
+    ids = [profissional.id for profissional in profissionais]
+    with coletar_consultas() as leitura:
+        indice = carregar_indice_do_dia(DIA, ids)
+    with coletar_consultas() as calculo:
+        disponibilidade = calcular_disponibilidade(profissionais, indice, servico.duracao)
+
+    conferir(leitura.total == 1, f"índice do dia usou {leitura.total} consultas (esperado 1)")
+    conferir(calculo.total == 0, f"cálculo dos horários usou {calculo.total} consultas (esperado 0)")
+
+    # Ocupados 08:00-08:45, 10:00-10:45 ...: 08:30 e 10:00 caem neles.
+    livres = sorted(disponibilidade)
+    conferir("08:30" not in livres and "10:00" not in livres, f"horários ocupados oferecidos: {livres}")
+    conferir("09:00" in livres and "17:00" in livres, f"horários livres faltando: {livres}")
+    conferir(
+        all(len(disponibilidade[chave]) == len(profissionais) for chave in livres),
+        "horário livre sem todos os profissionais"
+    )
+
+    # Pela rota (buscar_disponibilidade): uma leitura de agendamentos; a
+    # outra consulta possível é só a versão do cache de cadastros.
+    with coletar_consultas() as rota:
+        resposta = current_app.test_client().get(f"/agendamentos/novo?servico_id={servico.id}&data={DIA:%Y-%m-%d}")
+    leituras = [comando for comando, _, _ in rota.consultas if "FROM agendamento" in comando]
+    conferir(resposta.status_code == 200, f"rota respondeu {resposta.status_code}")
+    conferir(len(leituras) == 1, f"rota leu agendamentos {len(leituras)} vezes (esperado 1)")
+    conferir(rota.total <= 2, f"rota usou {rota.total} consultas (máximo 2)")
+
+
+def proximos_do_dia(profissionais, data, duracao=30):
+    from disponibilidade import carregar_bitmaps_periodo, buscar_proximos_horarios
+
+    bitmaps = carregar_bitmaps_periodo(data, data, [profissional.id for profissional in profissionais])
+    return [
+        horario["hora_inicio"]
+        for horario in buscar_proximos_horarios(profissionais, bitmaps, [data], duracao, 100)
+    ]
+
+
+def caso_intervalo_vazio():
+    # Início igual ao fim não ocupa nada (tsrange vazio no Postgres, ignorado
+    # pelos gatilhos do SQLite); antes bloqueava o resto do dia.
+    (profissional,), _ = cadastrar([("08:00", "12:00")])
+    agendar(profissional, DIA, (9, 0), (9, 0))
+
+    horarios = proximos_do_dia([profissional], DIA)
+    conferir(horarios == ["08:00", "08:30", "09:00", "09:30", "10:00", "10:30", "11:00", "11:30"], f"oferecidos: {horarios}")
+
+
+def caso_virada_do_dia():
+    # 23:30-00:30 da véspera ocupa 00:00-00:30 do dia: o banco recusaria
+    # 00:00, então a busca não pode oferecer. O dia anterior ao período
+    # também conta.
+    (profissional,), _ = cadastrar([("00:00", "02:00")])
+    agendar(profissional, DIA - timedelta(days=1), (23, 30), (0, 30))
+    agendar(profissional, DIA, (1, 30), (1, 30))
+
+    horarios = proximos_do_dia([profissional], DIA)
+    conferir(horarios == ["00:30", "01:00", "01:30"], f"oferecidos: {horarios}")
+
+    from disponibilidade import carregar_bitmaps_periodo, mascara_intervalo
+
+    bitmaps = carregar_bitmaps_periodo(DIA - timedelta(days=1), DIA, [profissional.id])
+    conferir(
+        bitmaps.get((profissional.id, DIA - timedelta(days=1))) == mascara_intervalo(23 * 60 + 30, 24 * 60),
+        "a véspera deveria ficar ocupada só de 23:30 até a meia-noite"
+    )
+
+
+def caso_combo_com_grades_diferentes():
+    # A (grade 08:00, 08:30...) está ocupada até 10:00; B começa 08:15
+    # (grade 08:15, 08:45...). Antes de 10:00 só B atende, então o combo só
+    # pode começar na grade de B; 08:30 nunca é oferecido.
+    from disponibilidade import carregar_bitmaps_periodo, buscar_combos, hora_para_minutos
+    from cache_referencia import obter_referencias
+
+    (primeira, segunda), (servico,) = cadastrar([("08:00", "12:00"), ("08:15", "12:00")])
+    agendar(primeira, DIA, (8, 0), (10, 0), servico)
+
+    referencias = obter_referencias()
+    profissionais = referencias.profissionais_por_servico[servico.id]
+    etapas = [(referencias.servicos_por_id[servico.id], list(profissionais))] * 2
+    bitmaps = carregar_bitmaps_periodo(DIA, DIA, [profissional.id for profissional in profissionais])
+    opcoes = buscar_combos(etapas, bitmaps, DIA, 100)
+
+    ids = {profissional.nome: profissional.id for profissional in profissionais}
+    inicios_turno = {profissional.id: hora_para_minutos(profissional.horario_inicio) for profissional in profissionais}
+    inicios = [(opcao["hora_inicio"], opcao["etapas"][0]["profissional"]["id"]) for opcao in opcoes]
+    conferir(
+        inicios[:3] == [("08:15", ids["Profissional 1"]), ("08:45", ids["Profissional 1"]), ("09:15", ids["Profissional 1"])],
+        f"primeiros inícios: {inicios[:3]}"
+    )
+    conferir(("10:00", ids["Profissional 0"]) in inicios, f"A livre às 10:00 não foi oferecida: {inicios}")
+    fora_da_grade = [
+        (inicio, profissional_id) for inicio, profissional_id in inicios
+        if (hora_para_minutos(inicio) - inicios_turno[profissional_id]) % 30
+    ]
+    conferir(not fora_da_grade, f"inícios fora da grade do profissional: {fora_da_grade}")
+
+
+CASOS = {
+    "uma consulta por dia (calcular_disponibilidade)": caso_uma_consulta_por_dia,
+    "intervalo vazio não ocupa (carregar_bitmaps_periodo)": caso_intervalo_vazio,
+    "agendamento que passa da meia-noite (carregar_bitmaps_periodo)": caso_virada_do_dia,
+    "combo com grades diferentes (buscar_combos)": caso_combo_com_grades_diferentes,
+}
+
+
+def executar(args):
+    configurar_ambiente(args)
+
+    from app import create_app
+    from flask_migrate import upgrade
+    from benchmarks.dados_sinteticos import limpar_dados
+
+    app = create_app()
+    with app.app_context():
+        upgrade()
+
+    resultados = {}
+    for nome, caso in CASOS.items():
+        with app.app_context():
+            limpar_dados()
+            try:
+                caso()
+                resultados[nome] = {"ok": True, "erro": None}
+            except AssertionError as falha:
+                resultados[nome] = {"ok": False, "erro": str(falha)}
+
+    falhas = [nome for nome, resultado in resultados.items() if not resultado["ok"]]
+    print(json.dumps({"falhas": falhas, "casos": resultados}, indent=2, ensure_ascii=False))
+    if falhas:
+        sys.exit(1)
+    return resultados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Confere os casos da disponibilidade.")
+    parser.add_argument("--database-url", default="", help="Usa este banco (será limpo) em vez de um SQLite temporário.")
+    executar(parser.parse_args())
@@ -0,0 +1,222 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+from datetime import date, datetime, time as hora, timedelta
+
+# Conferências da fila de saída do WhatsApp contra o simulador local: cada
+# caso monta a fila num SQLite temporário, processa e confere o estado das
+# mensagens. Sai com código 1 se algum caso falhar.
+# Uso (na raiz do projeto, também no CI):
+#   python -m benchmarks.conferir_fila [--database-url ...]
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import simulador_whatsapp
+
+ESPERA_MAXIMA = 1
+RETRY_AFTER_LONGO = 600
+
+
+def configurar_ambiente(args, porta):
+    os.environ.update({
+        "WHATSAPP_SIMULADO": "0",
+        "WHATSAPP_PROVIDER": "api",
+        "WHATSAPP_API_URL": f"http://127.0.0.1:{porta}/enviar",
+        "WHATSAPP_API_TOKEN": "token-simulado",
+        "WHATSAPP_LIMITE_ESPERA_MAXIMA": str(ESPERA_MAXIMA),
+        # Taxa alta e fixa: a redução AIMD a cada 429 não entra na conta do
+        # tempo dos casos.
+        "WHATSAPP_LIMITE_POR_SEGUNDO": "50",
+        "WHATSAPP_LIMITE_MINIMO_POR_SEGUNDO": "50",
+        "WHATSAPP_FILA_EM_PROCESSO": "0",
+        "LEMBRETES_AGENDADOR_EM_PROCESSO": "0",
+        "WHATSAPP_ENTRADA_EM_PROCESSO": "0",
+        "METRICAS_ATIVAS": "0"
+    })
+    os.environ.pop("WHATSAPP_PHONE_NUMBER_ID", None)
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        os.environ.pop("DATABASE_URL", None)
+        os.environ["RENDER_DISK_PATH"] = tempfile.mkdtemp(prefix="conferir_fila_")
+
+
+def agendamentos(quantidade, data=None):
+    from database import db
+    from models import Agendamento
+
+    data = data or date.today() + timedelta(days=1)
+    criados = [
+        Agendamento(
+            cliente_nome=f"Cliente {indice}",
+            cliente_telefone=f"119{indice:08d}",
+            profissional_id=None,
+            servico_id=None,
+            data=data,
+            hora_inicio=hora(8 + indice % 10, 0),
+            hora_fim=hora(8 + indice % 10, 30),
+            status="agendado",
+            lembrete_whatsapp_ativo=True
+        )
+        for indice in range(quantidade)
+    ]
+    db.session.add_all(criados)
+    db.session.commit()
+    return criados
+
+
+def conferir(condicao, mensagem):
+    if not condicao:
+        raise AssertionError(mensagem)
+
+
+# =========================
+# CASOS
+# =========================
+
+
+def caso_retry_after_longo(simulador):
+    # Todo envio volta 429 com Retry-After de 10 minutos, acima da espera
+    # máxima. Com mais mensagens que threads, cada thread volta ao limitador
+    # depois do primeiro 429, e nenhuma pode dormir esse tempo (a reserva
+    # venceria antes e outro worker reenviaria). As mensagens voltam para a
+    # fila, liberadas, com a próxima tentativa depois do Retry-After.
+    from database import db
+    from models import MensagemSaida
+    from fila_whatsapp import enfileirar_lembretes_de, processar_fila
+    from limitador import obter_limitador
+    from flask import current_app
+
+    simulador.estado.rajada_429_a_cada = 1
+    simulador.estado.rajada_429_tamanho = 1
+    simulador.estado.retry_after = RETRY_AFTER_LONGO
+
+    enfileirar_lembretes_de(agendamentos(12))
+    db.session.commit()
+
+    resumo = {}
+    app = current_app._get_current_object()
+
+    def processar():
+        with app.app_context():
+            resumo.update(processar_fila(concorrencia=4))
+
+    inicio = time.monotonic()
+    thread = threading.Thread(target=processar, daemon=True)
+    thread.start()
+    thread.join(ESPERA_MAXIMA * 10)
+    duracao = time.monotonic() - inicio
+    conferir(not thread.is_alive(), f"processar_fila ainda preso no limitador depois de {duracao:.1f}s")
+
+    limitador = obter_limitador("api", os.environ["WHATSAPP_API_URL"])
+    bloqueio = limitador.bloqueado_ate - time.monotonic()
+    conferir(bloqueio <= ESPERA_MAXIMA, f"limitador bloqueado por mais {bloqueio:.0f}s")
+
+    db.session.expire_all()
+    minimo = datetime.utcnow() + timedelta(seconds=RETRY_AFTER_LONGO - 60)
+    mensagens = MensagemSaida.query.all()
+    conferir(resumo.get("reagendadas") == len(mensagens) == 12, f"resumo: {resumo}")
+    for mensagem in mensagens:
+        conferir(mensagem.status == "pendente", f"mensagem {mensagem.id} ficou {mensagem.status}")
+        conferir(mensagem.reservado_por is None, f"mensagem {mensagem.id} ainda reservada")
+        conferir(
+            mensagem.proxima_tentativa_em >= minimo,
+            f"mensagem {mensagem.id} volta em {mensagem.proxima_tentativa_em}, antes do Retry-After"
+        )
+
+
+def caso_lembrete_com_anterior_na_fila(simulador):
+    # O lembrete de 24h ainda está na fila (nova tentativa) quando o de 2h
+    # vence: o de 2h não pode ficar "enfileirado" sem mensagem. Ele espera
+    # como "agendado" e entra na fila quando a do de 24h sai.
+    from database import db
+    from models import Agendamento, LembreteAgendado, MensagemSaida
+    from lembretes_agendados import agora_na_agenda
+    from fila_whatsapp import enfileirar_lembretes_de, drenar_lembretes_vencidos
+
+    # Só antecedências futuras são programadas; depois o de 2h é vencido à mão.
+    inicio = agora_na_agenda().replace(second=0, microsecond=0) + timedelta(days=3)
+    agendamento = Agendamento(
+        cliente_nome="Cliente Lembretes",
+        cliente_telefone="11988887777",
+        profissional_id=None,
+        servico_id=None,
+        data=inicio.date(),
+        hora_inicio=inicio.time(),
+        hora_fim=(inicio + timedelta(minutes=30)).time(),
+        status="agendado",
+        lembrete_whatsapp_ativo=True
+    )
+    db.session.add(agendamento)
+    db.session.commit()
+
+    lembretes = {lembrete.antecedencia_min: lembrete for lembrete in LembreteAgendado.query.all()}
+    conferir(sorted(lembretes) == [120, 1440], f"lembretes programados: {sorted(lembretes)}")
+    enfileirar_lembretes_de([agendamento])
+    lembretes[1440].status = "enfileirado"
+    lembretes[120].enviar_em = agora_na_agenda() - timedelta(minutes=1)
+    db.session.commit()
+
+    resumo = drenar_lembretes_vencidos()
+    db.session.expire_all()
+    conferir(resumo["enfileirados"] == 0, f"resumo com o de 24h na fila: {resumo}")
+    conferir(lembretes[120].status == "agendado", f"lembrete de 2h ficou {lembretes[120].status}")
+    conferir(MensagemSaida.query.count() == 1, "mensagem a mais na fila")
+
+    MensagemSaida.query.update({MensagemSaida.status: "enviada"})
+    db.session.commit()
+    resumo = drenar_lembretes_vencidos()
+    db.session.expire_all()
+    pendentes = MensagemSaida.query.filter_by(status="pendente").count()
+    conferir(resumo["enfileirados"] == 1, f"resumo depois do envio do de 24h: {resumo}")
+    conferir(lembretes[120].status == "enfileirado" and pendentes == 1, "lembrete de 2h não entrou na fila")
+
+
+CASOS = {
+    "Retry-After acima da espera máxima (registrar_limitacao)": caso_retry_after_longo,
+    "lembrete vencido com o anterior ainda na fila (enfileirar_lembretes_vencidos)": caso_lembrete_com_anterior_na_fila,
+}
+
+
+def executar(args):
+    simulador = simulador_whatsapp.iniciar_em_segundo_plano(latencia_ms=5)
+    configurar_ambiente(args, simulador.server_port)
+
+    from app import create_app
+    from flask_migrate import upgrade
+    from benchmarks.dados_sinteticos import limpar_dados
+
+    app = create_app()
+    with app.app_context():
+        upgrade()
+
+    resultados = {}
+    for nome, caso in CASOS.items():
+        simulador.estado.rajada_429_a_cada = 0
+        simulador.estado.rajada_429_tamanho = 0
+        with app.app_context():
+            limpar_dados()
+            try:
+                caso(simulador)
+                resultados[nome] = {"ok": True, "erro": None}
+            except AssertionError as falha:
+                resultados[nome] = {"ok": False, "erro": str(falha)}
+
+    simulador.shutdown()
+    falhas = [nome for nome, resultado in resultados.items() if not resultado["ok"]]
+    print(json.dumps({"falhas": falhas, "casos": resultados}, indent=2, ensure_ascii=False))
+    if falhas:
+        # Um envio preso no limitador não deixaria o processo terminar.
+        sys.stdout.flush()
+        os._exit(1)
+    return resultados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Confere os casos da fila de saída do WhatsApp.")
+    parser.add_argument("--database-url", default="", help="Usa este banco (será limpo) em vez de um SQLite temporário.")
+    executar(parser.parse_args())
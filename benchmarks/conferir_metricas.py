@@ -0,0 +1,139 @@
+import os
+import sys
+import json
+import runpy
+import signal
+import argparse
+import tempfile
+import multiprocessing
+
+# Conferências das métricas entre processos: workers (processos filhos)
+# gravam retratos, saem ou morrem, e a soma do /metrics não pode diminuir.
+# Sai com código 1 se algum caso falhar.
+# Uso (na raiz do projeto, também no CI):
+#   python -m benchmarks.conferir_metricas
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+RAIZ_PROJETO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONTADOR = "agenda_http_requisicoes_total"
+HISTOGRAMA = "agenda_http_requisicao_segundos"
+
+
+def configurar_ambiente():
+    os.environ.update({
+        "METRICAS_DIR": tempfile.mkdtemp(prefix="conferir_metricas_"),
+        # Só as gravações explícitas dos casos.
+        "METRICAS_INTERVALO": "3600"
+    })
+
+
+def trabalhar(requisicoes, pronto, sair):
+    # Um "worker": registra requisições, grava o retrato e espera a ordem de
+    # sair (ou ser morto).
+    from metricas import incrementar, observar, gravar_retrato
+
+    for _ in range(requisicoes):
+        incrementar(CONTADOR, rota="/conferir", metodo="GET", status=200)
+        observar(HISTOGRAMA, 0.02, rota="/conferir", metodo="GET")
+    gravar_retrato()
+    pronto.set()
+    sair.wait(30)
+
+
+def iniciar_worker(contexto, requisicoes):
+    pronto, sair = contexto.Event(), contexto.Event()
+    processo = contexto.Process(target=trabalhar, args=(requisicoes, pronto, sair))
+    processo.start()
+    pronto.wait(30)
+    return processo, sair
+
+
+def totais():
+    from metricas import somar_retratos
+
+    contadores, histogramas = somar_retratos()
+    contador = sum(valor for (nome, _), valor in contadores.items() if nome == CONTADOR)
+    observacoes = sum(serie[-1] for (nome, _), serie in histogramas.items() if nome == HISTOGRAMA)
+    return contador, observacoes
+
+
+def conferir(condicao, mensagem):
+    if not condicao:
+        raise AssertionError(mensagem)
+
+
+# =========================
+# CASOS
+# =========================
+
+
+def caso_workers_que_saem(contexto):
+    # Um worker sai pelo child_exit do gunicorn.conf.py, outro morre com
+    # SIGKILL sem hook nenhum: a soma continua com os números dos dois.
+    child_exit = runpy.run_path(os.path.join(RAIZ_PROJETO, "gunicorn.conf.py"))["child_exit"]
+
+    primeiro, sair_primeiro = iniciar_worker(contexto, 5)
+    segundo, _ = iniciar_worker(contexto, 3)
+    conferir(totais() == (8, 8), f"com os dois vivos: {totais()}")
+
+    sair_primeiro.set()
+    primeiro.join()
+    child_exit(None, primeiro)
+    conferir(totais() == (8, 8), f"depois do child_exit: {totais()}")
+
+    os.kill(segundo.pid, signal.SIGKILL)
+    segundo.join()
+    conferir(totais() == (8, 8), f"depois do SIGKILL: {totais()}")
+
+    terceiro, sair_terceiro = iniciar_worker(contexto, 2)
+    conferir(totais() == (10, 10), f"com um worker novo: {totais()}")
+    sair_terceiro.set()
+    terceiro.join()
+    conferir(totais() == (10, 10), f"depois do worker novo sair: {totais()}")
+
+
+def caso_pid_reaproveitado(contexto):
+    # Arquivo deixado por um processo antigo com o mesmo PID deste: a
+    # primeira gravação soma os números dele aos mortos em vez de apagá-los.
+    from metricas import diretorio_metricas, gravar_retrato, incrementar
+
+    antes, _ = totais()
+    antigo = {"contadores": [[CONTADOR, [["rota", "/antiga"]], 7]], "histogramas": []}
+    with open(os.path.join(diretorio_metricas(), f"{os.getpid()}.json"), "w", encoding="utf-8") as arquivo:
+        json.dump(antigo, arquivo)
+
+    incrementar(CONTADOR, rota="/conferir", metodo="GET", status=200)
+    gravar_retrato()
+    depois, _ = totais()
+    conferir(depois == antes + 7 + 1, f"antes {antes}, depois {depois} (esperado {antes + 8})")
+
+
+CASOS = {
+    "worker que sai ou morre continua na soma (aposentar_retrato)": caso_workers_que_saem,
+    "PID reaproveitado não apaga o processo antigo (gravar_retrato)": caso_pid_reaproveitado,
+}
+
+
+def executar(_args):
+    configurar_ambiente()
+    contexto = multiprocessing.get_context("fork")
+
+    resultados = {}
+    for nome, caso in CASOS.items():
+        try:
+            caso(contexto)
+            resultados[nome] = {"ok": True, "erro": None}
+        except AssertionError as falha:
+            resultados[nome] = {"ok": False, "erro": str(falha)}
+
+    falhas = [nome for nome, resultado in resultados.items() if not resultado["ok"]]
+    print(json.dumps({"falhas": falhas, "casos": resultados}, indent=2, ensure_ascii=False))
+    if falhas:
+        sys.exit(1)
+    return resultados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Confere a soma das métricas entre processos.")
+    executar(parser.parse_args())
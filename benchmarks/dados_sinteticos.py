@@ -0,0 +1,269 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+from datetime import date, datetime, timedelta
+
+# Gerador determinístico de dados sintéticos: profissionais, serviços,
+# vínculos e agendamentos sem sobreposição, da escala "pequena" (5
+# profissionais, 1 mil agendamentos) à "grande" (200 profissionais, 5
+# milhões). A mesma semente e a mesma data base geram os mesmos dados.
+# Uso (na raiz do projeto):
+#   python -m benchmarks.dados_sinteticos --escala media [--database-url ...] [--limpar]
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ESCALAS = {
+    "pequena": (5, 1_000),
+    "media": (50, 100_000),
+    "grande": (200, 5_000_000),
+}
+
+DURACOES_SERVICO = (15, 30, 30, 45, 60, 90)
+STATUS_PESOS = (("agendado", 70), ("confirmado", 20), ("cancelado", 10))
+# Três quartos dos dias no passado e o resto no futuro, como numa agenda
+# em uso há algum tempo.
+FRACAO_PASSADO = 0.75
+
+
+def ler_escala(nome, profissionais=None, agendamentos=None):
+    base_profissionais, base_agendamentos = ESCALAS[nome]
+    return profissionais or base_profissionais, agendamentos or base_agendamentos
+
+
+def telefone_cliente(indice):
+    return f"55119{indice:08d}"
+
+
+def clientes_da_escala(agendamentos):
+    # Cerca de dez agendamentos por cliente: o mesmo telefone aparece em
+    # vários dias, como na base real.
+    return max(100, agendamentos // 10)
+
+
+def limpar_dados():
+    from sqlalchemy import delete
+    from database import db
+    from models import (
+        AlteracaoAgenda, Agendamento, Cliente, EventoWebhook, LembreteAgendado, MensagemSaida,
+        Profissional, ProfissionalServico, Servico
+    )
+
+    # Ordem das chaves estrangeiras. As tabelas de versão ficam: zerá-las
+    # faria workers com cache antigo acharem que nada mudou.
+    for modelo in (
+        LembreteAgendado, MensagemSaida, EventoWebhook, AlteracaoAgenda, Agendamento,
+        ProfissionalServico, Servico, Profissional, Cliente
+    ):
+        db.session.execute(delete(modelo))
+    db.session.commit()
+
+
+def gerar_cadastros(sorteio, quantidade_profissionais):
+    from database import db
+    from models import Profissional, Servico, ProfissionalServico
+    from cache_referencia import incrementar_versao
+
+    servicos = [
+        Servico(nome=f"Serviço {indice + 1} ({duracao} min)", duracao=duracao)
+        for indice, duracao in enumerate(DURACOES_SERVICO)
+    ]
+    profissionais = []
+    for indice in range(quantidade_profissionais):
+        inicio = sorteio.choice((7, 8, 8, 9))
+        fim = inicio + sorteio.choice((8, 9, 10, 12))
+        profissionais.append(Profissional(
+            nome=f"Profissional {indice + 1:03d}",
+            horario_inicio=f"{inicio:02d}:00",
+            horario_fim=f"{fim:02d}:00"
+        ))
+    db.session.add_all(servicos + profissionais)
+    db.session.flush()
+
+    vinculos = {}
+    for profissional in profissionais:
+        escolhidos = sorted(sorteio.sample(servicos, sorteio.randint(2, len(servicos))), key=lambda s: s.id)
+        vinculos[profissional.id] = escolhidos
+        db.session.add_all([
+            ProfissionalServico(profissional_id=profissional.id, servico_id=servico.id)
+            for servico in escolhidos
+        ])
+    incrementar_versao()
+    db.session.commit()
+    return profissionais, vinculos
+
+
+def agenda_do_profissional(sorteio, profissional, servicos, quantidade, primeiro_dia):
+    # Um cursor por dia que só anda para frente: cada agendamento começa
+    # depois do fim do anterior, então nunca há sobreposição.
+    inicio_expediente = int(profissional.horario_inicio[:2]) * 60
+    fim_expediente = int(profissional.horario_fim[:2]) * 60
+    dia = primeiro_dia
+    gerados = 0
+    while gerados < quantidade:
+        minuto = inicio_expediente
+        while gerados < quantidade:
+            servico = sorteio.choice(servicos)
+            if minuto + servico.duracao > fim_expediente:
+                break
+            if sorteio.random() < 0.8:
+                yield dia, minuto, servico
+                gerados += 1
+                minuto += servico.duracao
+            minuto += sorteio.choice((0, 0, 15, 30))
+        dia += timedelta(days=1)
+
+
+def gerar_agendamentos(sorteio, profissionais, vinculos, quantidade, data_base, tamanho_lote=10_000, progresso=None):
+    from sqlalchemy import insert
+    from database import db
+    from models import Agendamento
+    from utils import normalizar_telefone
+
+    por_profissional = [quantidade // len(profissionais)] * len(profissionais)
+    for indice in range(quantidade % len(profissionais)):
+        por_profissional[indice] += 1
+
+    clientes = clientes_da_escala(quantidade)
+    status = [nome for nome, _ in STATUS_PESOS]
+    pesos = [peso for _, peso in STATUS_PESOS]
+    criado_em = datetime.combine(data_base, datetime.min.time())
+
+    lote = []
+    total = 0
+    for profissional, alvo in zip(profissionais, por_profissional):
+        servicos = vinculos[profissional.id]
+        # A cada passo do cursor: 80% de chance de um serviço de duração
+        # média e, em média, 11,25 minutos de intervalo.
+        minutos = (int(profissional.horario_fim[:2]) - int(profissional.horario_inicio[:2])) * 60
+        duracao_media = sum(servico.duracao for servico in servicos) / len(servicos)
+        por_dia = max(1.0, minutos * 0.8 / (0.8 * duracao_media + 11.25))
+        primeiro_dia = data_base - timedelta(days=int(alvo / por_dia * FRACAO_PASSADO))
+
+        for dia, minuto, servico in agenda_do_profissional(sorteio, profissional, servicos, alvo, primeiro_dia):
+            cliente = sorteio.randrange(clientes)
+            telefone = telefone_cliente(cliente)
+            situacao = sorteio.choices(status, pesos)[0]
+            passado = dia < data_base
+            lembrete = sorteio.random() < 0.6
+            lote.append({
+                "cliente_nome": f"Cliente {cliente + 1:07d}",
+                "cliente_telefone": telefone,
+                "cliente_telefone_normalizado": normalizar_telefone(telefone),
+                "profissional_id": profissional.id,
+                "servico_id": servico.id,
+                "data": dia,
+                "hora_inicio": (datetime.min + timedelta(minutes=minuto)).time(),
+                "hora_fim": (datetime.min + timedelta(minutes=minuto + servico.duracao)).time(),
+                "status": situacao,
+                "criado_em": criado_em,
+                "lembrete_whatsapp_ativo": lembrete,
+                "lembrete_whatsapp_enviado_em": criado_em if lembrete and passado else None
+            })
+            if len(lote) >= tamanho_lote:
+                db.session.execute(insert(Agendamento), lote)
+                db.session.commit()
+                total += len(lote)
+                lote = []
+                if progresso:
+                    progresso(total, quantidade)
+
+    if lote:
+        db.session.execute(insert(Agendamento), lote)
+        db.session.commit()
+        total += len(lote)
+        if progresso:
+            progresso(total, quantidade)
+    return total
+
+
+def gerar_dados(escala, semente=42, data_base=None, profissionais=None, agendamentos=None, limpar=False, progresso=None):
+    """Gera a escala no banco do app ativo e devolve um resumo. Inserções em
+    lote pelo Core: não passam pelos ouvintes da sessão (lembretes
+    programados, feed da agenda); rode `flask reprogramar-lembretes` se
+    precisar deles."""
+    from sqlalchemy import text
+    from database import db
+    from models import Agendamento
+
+    quantidade_profissionais, quantidade_agendamentos = ler_escala(escala, profissionais, agendamentos)
+    data_base = data_base or date.today()
+    sorteio = random.Random(semente)
+
+    if limpar:
+        limpar_dados()
+    elif db.session.query(Agendamento.id).first() is not None:
+        raise RuntimeError("O banco já tem agendamentos; use limpar=True (--limpar) num banco descartável.")
+
+    inicio = time.perf_counter()
+    cadastros, vinculos = gerar_cadastros(sorteio, quantidade_profissionais)
+    total = gerar_agendamentos(sorteio, cadastros, vinculos, quantidade_agendamentos, data_base, progresso=progresso)
+
+    # Estatísticas atualizadas para o planejador depois da carga em massa.
+    db.session.execute(text("ANALYZE"))
+    db.session.commit()
+
+    return {
+        "escala": escala,
+        "semente": semente,
+        "data_base": data_base.strftime("%Y-%m-%d"),
+        "profissionais": quantidade_profissionais,
+        "servicos": len(DURACOES_SERVICO),
+        "agendamentos": total,
+        "clientes": clientes_da_escala(quantidade_agendamentos),
+        "geracao_s": round(time.perf_counter() - inicio, 2)
+    }
+
+
+def mostrar_progresso(feitos, total):
+    print(f"\r{feitos}/{total} agendamentos", end="", file=sys.stderr, flush=True)
+    if feitos >= total:
+        print(file=sys.stderr)
+
+
+def executar(args):
+    os.environ.update({
+        "WHATSAPP_FILA_EM_PROCESSO": "0",
+        "LEMBRETES_AGENDADOR_EM_PROCESSO": "0",
+        "WHATSAPP_ENTRADA_EM_PROCESSO": "0"
+    })
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        os.environ.pop("DATABASE_URL", None)
+        os.environ["RENDER_DISK_PATH"] = tempfile.mkdtemp(prefix="dados_sinteticos_")
+
+    from app import create_app
+    from flask_migrate import upgrade
+
+    app = create_app()
+    with app.app_context():
+        upgrade()
+        resumo = gerar_dados(
+            args.escala,
+            semente=args.semente,
+            data_base=datetime.strptime(args.data_base, "%Y-%m-%d").date() if args.data_base else None,
+            profissionais=args.profissionais,
+            agendamentos=args.agendamentos,
+            limpar=args.limpar,
+            progresso=mostrar_progresso
+        )
+        resumo["banco"] = app.config["SQLALCHEMY_DATABASE_URI"].split("@")[-1]
+
+    print(json.dumps(resumo, indent=2, ensure_ascii=False))
+    return resumo
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gera agendas sintéticas determinísticas.")
+    parser.add_argument("--escala", choices=sorted(ESCALAS), default="pequena")
+    parser.add_argument("--profissionais", type=int, default=None, help="Sobrescreve o número de profissionais da escala.")
+    parser.add_argument("--agendamentos", type=int, default=None, help="Sobrescreve o número de agendamentos da escala.")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--data-base", default="", help="Data de referência (AAAA-MM-DD); padrão: hoje.")
+    parser.add_argument("--database-url", default="", help="Usa este banco em vez de um SQLite temporário.")
+    parser.add_argument("--limpar", action="store_true", help="Apaga todos os dados do banco antes de gerar.")
+    executar(parser.parse_args())
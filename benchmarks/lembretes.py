@@ -0,0 +1,170 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import threading
+from datetime import date, time as hora, timedelta
+
+# Benchmark de ponta a ponta do envio de lembretes contra o simulador local.
+# Uso (na raiz do projeto):
+#   python -m benchmarks.lembretes --mensagens 500 --provider twilio --latencia-ms 80
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import simulador_whatsapp
+
+
+def percentil(valores, fracao):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, max(0, int(round(fracao * (len(ordenados) - 1)))))
+    return ordenados[indice]
+
+
+def configurar_ambiente(args, porta):
+    base = f"http://127.0.0.1:{porta}"
+    os.environ.update({
+        "WHATSAPP_SIMULADO": "0",
+        "WHATSAPP_PROVIDER": args.provider,
+        "WHATSAPP_FILA_EM_PROCESSO": "0",
+        "LEMBRETES_AGENDADOR_EM_PROCESSO": "0",
+        "WHATSAPP_CONCORRENCIA": str(args.concorrencia),
+        "WHATSAPP_LIMITE_POR_SEGUNDO": str(args.limite_cliente),
+        "TWILIO_API_BASE_URL": base,
+        "WHATSAPP_GRAPH_BASE_URL": base,
+        "WHATSAPP_API_URL": f"{base}/enviar",
+        "WHATSAPP_API_TOKEN": "token-simulado"
+    })
+
+    if args.provider == "twilio":
+        os.environ.update({
+            "TWILIO_ACCOUNT_SID": "ACsimulado",
+            "TWILIO_AUTH_TOKEN": "token-simulado",
+            "TWILIO_WHATSAPP_FROM": "whatsapp:+14155238886"
+        })
+    elif args.provider == "meta":
+        os.environ["WHATSAPP_PHONE_NUMBER_ID"] = "123456789"
+    else:
+        os.environ.pop("WHATSAPP_PHONE_NUMBER_ID", None)
+
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        os.environ.pop("DATABASE_URL", None)
+        os.environ["RENDER_DISK_PATH"] = tempfile.mkdtemp(prefix="bench_lembretes_")
+
+
+def popular_lembretes(quantidade):
+    from database import db
+    from models import Agendamento
+
+    amanha = date.today() + timedelta(days=1)
+    db.session.add_all([
+        Agendamento(
+            cliente_nome=f"Cliente {indice}",
+            cliente_telefone=f"119{indice:08d}",
+            profissional_id=None,
+            servico_id=None,
+            data=amanha,
+            hora_inicio=hora(8 + (indice % 10), 0),
+            hora_fim=hora(8 + (indice % 10), 30),
+            status="agendado",
+            lembrete_whatsapp_ativo=True
+        )
+        for indice in range(quantidade)
+    ])
+    db.session.commit()
+
+
+def executar(args):
+    simulador = simulador_whatsapp.iniciar_em_segundo_plano(**simulador_whatsapp.opcoes_do_args(args))
+    configurar_ambiente(args, simulador.server_port)
+
+    import whatsapp
+    from app import create_app
+    from flask_migrate import upgrade
+    from fila_whatsapp import drenar_fila
+
+    latencias = []
+    trava = threading.Lock()
+    requisitar_original = whatsapp.requisitar_provedor
+
+    def requisitar_medindo(*posicionais, **nomeados):
+        inicio = time.perf_counter()
+        try:
+            return requisitar_original(*posicionais, **nomeados)
+        finally:
+            with trava:
+                latencias.append(time.perf_counter() - inicio)
+
+    whatsapp.requisitar_provedor = requisitar_medindo
+
+    app = create_app()
+
+    servidor_app = None
+    if args.taxa_resposta > 0:
+        from werkzeug.serving import make_server
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        servidor_app = make_server("127.0.0.1", 0, app, threaded=True)
+        threading.Thread(target=servidor_app.serve_forever, daemon=True).start()
+        simulador.estado.webhook_url = f"http://127.0.0.1:{servidor_app.server_port}/webhooks/whatsapp"
+        simulador.estado.webhook_modo = "twilio" if args.provider == "twilio" else "meta"
+
+    with app.app_context():
+        upgrade()
+        popular_lembretes(args.mensagens)
+
+        cliente = app.test_client()
+        inicio = time.perf_counter()
+        resposta = cliente.post("/notificacoes/whatsapp/processar")
+        enfileiramento = time.perf_counter() - inicio
+        resumo = drenar_fila(args.lote, args.concorrencia)
+        duracao = time.perf_counter() - inicio
+
+    if servidor_app is not None:
+        time.sleep(args.atraso_webhook_ms / 1000.0 + 0.5)
+        servidor_app.shutdown()
+
+    with simulador.estado.trava:
+        estatisticas = dict(simulador.estado.estatisticas)
+    simulador.shutdown()
+
+    resultado = {
+        "provider": args.provider,
+        "mensagens": args.mensagens,
+        "concorrencia": args.concorrencia,
+        "latencia_simulada_ms": args.latencia_ms,
+        "enfileiradas": resposta.get_json().get("total"),
+        "enfileiramento_s": round(enfileiramento, 4),
+        "duracao_s": round(duracao, 4),
+        "mensagens_por_segundo": round(resumo["enviadas"] / duracao, 2) if duracao else 0.0,
+        "latencia_p50_ms": round(percentil(latencias, 0.50) * 1000, 2),
+        "latencia_p99_ms": round(percentil(latencias, 0.99) * 1000, 2),
+        "requisicoes_http": len(latencias),
+        "fila": resumo,
+        "simulador": estatisticas
+    }
+
+    print(json.dumps(resultado, indent=2, ensure_ascii=False))
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as arquivo:
+            json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+
+    return resultado
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark do envio de lembretes de WhatsApp.")
+    parser.add_argument("--mensagens", type=int, default=500)
+    parser.add_argument("--provider", choices=["twilio", "meta", "api"], default="twilio")
+    parser.add_argument("--concorrencia", type=int, default=8)
+    parser.add_argument("--lote", type=int, default=100)
+    parser.add_argument("--limite-cliente", type=float, default=1000, help="WHATSAPP_LIMITE_POR_SEGUNDO do cliente.")
+    parser.add_argument("--database-url", default="", help="Usa este banco em vez de um SQLite temporário.")
+    parser.add_argument("--saida", default="", help="Arquivo JSON para gravar o resultado.")
+    simulador_whatsapp.adicionar_argumentos(parser)
+    executar(parser.parse_args())
@@ -0,0 +1,190 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+from datetime import date, time as hora, timedelta
+
+# Guarda contra N+1: roda as rotas principais sobre uma agenda cheia e falha
+# (código 1) se alguma passar do orçamento de consultas SQL ou repetir o
+# mesmo comando. Os orçamentos não dependem do volume de dados; se uma
+# mudança legítima precisar de mais consultas, ajuste ORCAMENTOS.
+# Uso (na raiz do projeto, também no CI):
+#   python -m benchmarks.orcamento_consultas [--database-url ...]
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CELULAS_GRAVADAS = 6
+
+# nome: (máximo de consultas, máximo de execuções do mesmo comando)
+ORCAMENTOS = {
+    "GET /profissionais": (4, 1),
+    "GET /agendamentos": (2, 1),
+    "GET /agendamentos/exportar": (2, 1),
+    "GET /agenda/manual": (4, 1),
+    "GET /agenda/manual-preview": (4, 1),
+    "GET /agendamentos/novo": (2, 1),
+    "GET /disponibilidade/proximos": (2, 1),
+    "GET /disponibilidade/combo": (2, 1),
+    # O flush do ORM grava um INSERT por agendamento novo no SQLite; o
+    # resto (leitura do dia, programação de lembretes) é em lote.
+    "POST /agenda/manual": (CELULAS_GRAVADAS + 6, CELULAS_GRAVADAS),
+    "POST /webhooks/whatsapp": (2, 1),
+    "aplicar respostas do WhatsApp": (10, 1),
+}
+
+
+def configurar_ambiente(args):
+    os.environ.update({
+        "WHATSAPP_FILA_EM_PROCESSO": "0",
+        "LEMBRETES_AGENDADOR_EM_PROCESSO": "0",
+        "WHATSAPP_ENTRADA_EM_PROCESSO": "0",
+        "WHATSAPP_PROVIDER": "meta",
+        "METRICAS_ATIVAS": "0"
+    })
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        os.environ.pop("DATABASE_URL", None)
+        os.environ["RENDER_DISK_PATH"] = tempfile.mkdtemp(prefix="bench_orcamento_")
+
+
+def semear(args, dia):
+    from database import db
+    from models import Profissional, Servico, ProfissionalServico, Agendamento
+
+    profissionais = [
+        Profissional(nome=f"Profissional {indice}", horario_inicio="08:00", horario_fim="20:00")
+        for indice in range(args.profissionais)
+    ]
+    servicos = [Servico(nome=f"Serviço {indice}", duracao=30) for indice in range(3)]
+    db.session.add_all(profissionais + servicos)
+    db.session.flush()
+    db.session.add_all([
+        ProfissionalServico(profissional_id=profissional.id, servico_id=servico.id)
+        for profissional in profissionais
+        for servico in servicos
+    ])
+
+    # Horários cheios (sem sobreposição) nas horas redondas, deixando as
+    # meias horas livres para a gravação da grade.
+    for profissional in profissionais:
+        for indice in range(args.por_profissional):
+            inicio = 8 + indice % 12
+            db.session.add(Agendamento(
+                cliente_nome=f"Cliente {profissional.id}-{indice}",
+                cliente_telefone=f"5511{profissional.id:03d}{indice:05d}",
+                profissional_id=profissional.id,
+                servico_id=servicos[0].id,
+                data=dia + timedelta(days=indice // 12),
+                hora_inicio=hora(inicio, 0),
+                hora_fim=hora(inicio, 30),
+                lembrete_whatsapp_ativo=True
+            ))
+    db.session.commit()
+    return profissionais[0].id, [servico.id for servico in servicos]
+
+
+def cenarios(cliente, dia, profissional_id, servico_ids):
+    from entrada_whatsapp import aplicar_eventos_pendentes
+
+    texto_dia = dia.strftime("%Y-%m-%d")
+    servicos = ",".join(str(servico_id) for servico_id in servico_ids[:2])
+    respostas = {
+        "entry": [{"changes": [{"value": {"messages": [
+            {"id": f"orcamento-{indice}", "type": "text", "from": f"5511{profissional_id:03d}{indice:05d}", "text": {"body": "1"}}
+            for indice in range(10)
+        ]}}]}]
+    }
+    celulas = [
+        {
+            "profissional_id": profissional_id,
+            "hora_inicio": f"{8 + indice:02d}:30",
+            "cliente_nome": f"Grade {indice}",
+            "cliente_telefone": f"5521{indice:08d}"
+        }
+        for indice in range(CELULAS_GRAVADAS)
+    ]
+
+    return {
+        "GET /profissionais": lambda: cliente.get("/profissionais"),
+        "GET /agendamentos": lambda: cliente.get(f"/agendamentos?data_inicio={texto_dia}&por_pagina=200"),
+        "GET /agendamentos/exportar": lambda: cliente.get(f"/agendamentos/exportar?data_inicio={texto_dia}").get_data(),
+        "GET /agenda/manual": lambda: cliente.get(f"/agenda/manual?data={texto_dia}"),
+        "GET /agenda/manual-preview": lambda: cliente.get(f"/agenda/manual-preview?data={texto_dia}"),
+        "GET /agendamentos/novo": lambda: cliente.get(f"/agendamentos/novo?servico_id={servico_ids[0]}&data={texto_dia}"),
+        "GET /disponibilidade/proximos": lambda: cliente.get(f"/disponibilidade/proximos?servico_id={servico_ids[0]}&limite=50"),
+        "GET /disponibilidade/combo": lambda: cliente.get(f"/disponibilidade/combo?servico_ids={servicos}"),
+        "POST /agenda/manual": lambda: cliente.post("/agenda/manual", json={"data": texto_dia, "celulas": celulas}),
+        "POST /webhooks/whatsapp": lambda: cliente.post("/webhooks/whatsapp", json=respostas),
+        "aplicar respostas do WhatsApp": aplicar_eventos_pendentes,
+    }
+
+
+def executar(args):
+    configurar_ambiente(args)
+
+    from app import create_app
+    from flask_migrate import upgrade
+    from perfil_consultas import orcamento_de_consultas, resumir_comando
+
+    app = create_app()
+    dia = date.today() + timedelta(days=1)
+    with app.app_context():
+        upgrade()
+        profissional_id, servico_ids = semear(args, dia)
+
+    cliente = app.test_client()
+    resultados = {}
+    with app.app_context():
+        for nome, acao in cenarios(cliente, dia, profissional_id, servico_ids).items():
+            maximo, repeticao_maxima = ORCAMENTOS[nome]
+            erro = None
+            try:
+                with orcamento_de_consultas(maximo, repeticao_maxima) as coletor:
+                    resposta = acao()
+            except AssertionError as falha:
+                erro = str(falha)
+                resposta = None
+
+            status = getattr(resposta, "status_code", None)
+            if erro is None and status is not None and status >= 400:
+                erro = f"status HTTP {status}"
+
+            resultados[nome] = {
+                "consultas": coletor.total,
+                "orcamento": maximo,
+                "tempo_sql_ms": round(coletor.tempo_total * 1000, 2),
+                "repetidas": [
+                    {"vezes": quantidade, "origens": dict(origens), "comando": resumir_comando(comando)}
+                    for comando, quantidade, origens in coletor.repetidas(2)
+                ],
+                "ok": erro is None,
+                "erro": erro
+            }
+
+    falhas = [nome for nome, resultado in resultados.items() if not resultado["ok"]]
+    resultado = {
+        "profissionais": args.profissionais,
+        "agendamentos_por_profissional": args.por_profissional,
+        "falhas": falhas,
+        "cenarios": resultados
+    }
+
+    print(json.dumps(resultado, indent=2, ensure_ascii=False))
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as arquivo:
+            json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+
+    if falhas:
+        sys.exit(1)
+    return resultado
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Confere o orçamento de consultas SQL das rotas principais.")
+    parser.add_argument("--profissionais", type=int, default=8)
+    parser.add_argument("--por-profissional", type=int, default=24, help="Agendamentos por profissional (12 por dia).")
+    parser.add_argument("--database-url", default="", help="Usa este banco em vez de um SQLite temporário.")
+    parser.add_argument("--saida", default="", help="Arquivo JSON para gravar o resultado.")
+    executar(parser.parse_args())
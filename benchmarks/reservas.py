@@ -0,0 +1,216 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import multiprocessing
+from datetime import date, datetime, timedelta
+
+# Teste de estresse de reservas simultâneas: vários processos disputam os
+# mesmos horários de um profissional pela rota de novo agendamento e, no
+# fim, o banco é conferido em busca de sobreposições (deve dar zero). Depois,
+# um agendamento que passa da meia-noite deve bloquear o começo do dia
+# seguinte. Sai com código 1 se alguma conferência falhar.
+# Uso (na raiz do projeto, também no CI):
+#   python -m benchmarks.reservas --processos 8 --tentativas 200
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.lembretes import percentil
+
+
+def configurar_ambiente(args):
+    os.environ.update({
+        "WHATSAPP_FILA_EM_PROCESSO": "0",
+        "LEMBRETES_AGENDADOR_EM_PROCESSO": "0",
+        "WHATSAPP_ENTRADA_EM_PROCESSO": "0"
+    })
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        os.environ.pop("DATABASE_URL", None)
+        os.environ["RENDER_DISK_PATH"] = tempfile.mkdtemp(prefix="bench_reservas_")
+
+
+def preparar_banco(args):
+    from app import create_app
+    from flask_migrate import upgrade
+    from database import db
+    from models import Profissional, Servico, ProfissionalServico
+
+    app = create_app()
+    with app.app_context():
+        upgrade()
+        profissional = Profissional(nome="Profissional Estresse", horario_inicio="08:00", horario_fim="20:00")
+        servico = Servico(nome="Serviço Estresse", duracao=args.duracao)
+        db.session.add_all([profissional, servico])
+        db.session.flush()
+        db.session.add(ProfissionalServico(profissional_id=profissional.id, servico_id=servico.id))
+        db.session.commit()
+        return profissional.id, servico.id
+
+
+def disputar(indice, args, profissional_id, servico_id, dia, barreira, fila):
+    from app import create_app
+
+    app = create_app()
+    cliente = app.test_client()
+    sorteio = random.Random(indice)
+    # Início a cada 15 minutos com serviço de 30: horários vizinhos também
+    # se sobrepõem, não só os idênticos.
+    horarios = [f"{hora:02d}:{minuto:02d}" for hora in range(8, 18) for minuto in (0, 15, 30, 45)]
+
+    contagem = {"reservados": 0, "conflitos": 0, "outros": 0}
+    latencias = []
+    barreira.wait()
+
+    for tentativa in range(args.tentativas):
+        inicio = time.perf_counter()
+        resposta = cliente.post("/agendamentos/novo", data={
+            "cliente_nome": f"Cliente {indice}-{tentativa}",
+            "cliente_telefone": f"119{indice:02d}{tentativa:06d}",
+            "profissional_id": profissional_id,
+            "servico_id": servico_id,
+            "data": dia,
+            "hora_inicio": sorteio.choice(horarios)
+        })
+        latencias.append(time.perf_counter() - inicio)
+
+        if resposta.status_code == 302:
+            contagem["reservados"] += 1
+        elif "Conflito de horário" in resposta.get_data(as_text=True):
+            contagem["conflitos"] += 1
+        else:
+            contagem["outros"] += 1
+
+    fila.put((contagem, latencias))
+
+
+def conferir_sobreposicoes():
+    from app import create_app
+    from database import db
+    from sqlalchemy import text
+
+    app = create_app()
+    with app.app_context():
+        total = db.session.execute(text("SELECT COUNT(*) FROM agendamento")).scalar()
+        sobreposicoes = db.session.execute(text(
+            "SELECT COUNT(*) FROM agendamento a "
+            "JOIN agendamento b ON b.profissional_id = a.profissional_id "
+            "AND b.data = a.data AND b.id > a.id "
+            "AND b.hora_inicio < a.hora_fim AND b.hora_fim > a.hora_inicio"
+        )).scalar()
+    return total, sobreposicoes
+
+
+def conferir_virada_do_dia(profissional_id, servico_id, dia):
+    # Um agendamento das 23:30 à 00:30 ocupa o começo do dia seguinte: o
+    # banco deve recusar 00:00-00:20 no outro dia e aceitar 00:30-01:00.
+    from app import create_app
+    from database import db
+    from models import Agendamento
+    from conflito_horario import eh_conflito_horario
+    from sqlalchemy.exc import IntegrityError
+
+    def gravar(data, inicio, fim):
+        db.session.add(Agendamento(
+            cliente_nome="Virada do dia",
+            cliente_telefone="11900000000",
+            profissional_id=profissional_id,
+            servico_id=servico_id,
+            data=data,
+            hora_inicio=datetime.strptime(inicio, "%H:%M").time(),
+            hora_fim=datetime.strptime(fim, "%H:%M").time()
+        ))
+        try:
+            db.session.commit()
+            return "gravado"
+        except IntegrityError as erro:
+            db.session.rollback()
+            if not eh_conflito_horario(erro):
+                raise
+            return "conflito"
+
+    app = create_app()
+    with app.app_context():
+        seguinte = dia + timedelta(days=1)
+        return {
+            "23:30-00:30": gravar(dia, "23:30", "00:30"),
+            "00:00-00:20 no dia seguinte": gravar(seguinte, "00:00", "00:20"),
+            "00:30-01:00 no dia seguinte": gravar(seguinte, "00:30", "01:00"),
+        }
+
+
+def executar(args):
+    configurar_ambiente(args)
+    profissional_id, servico_id = preparar_banco(args)
+    dia = (date.today() + timedelta(days=7)).strftime("%Y-%m-%d")
+
+    # spawn: cada processo abre as próprias conexões, como workers do gunicorn.
+    contexto = multiprocessing.get_context("spawn")
+    barreira = contexto.Barrier(args.processos)
+    fila = contexto.Queue()
+    processos = [
+        contexto.Process(target=disputar, args=(indice, args, profissional_id, servico_id, dia, barreira, fila))
+        for indice in range(args.processos)
+    ]
+
+    inicio = time.perf_counter()
+    for processo in processos:
+        processo.start()
+    resultados = [fila.get() for _ in processos]
+    for processo in processos:
+        processo.join()
+    duracao = time.perf_counter() - inicio
+
+    contagem = {"reservados": 0, "conflitos": 0, "outros": 0}
+    latencias = []
+    for parcial, tempos in resultados:
+        for chave, valor in parcial.items():
+            contagem[chave] += valor
+        latencias.extend(tempos)
+
+    total, sobreposicoes = conferir_sobreposicoes()
+    virada = conferir_virada_do_dia(
+        profissional_id, servico_id, datetime.strptime(dia, "%Y-%m-%d").date() + timedelta(days=1)
+    )
+    virada_ok = virada == {
+        "23:30-00:30": "gravado",
+        "00:00-00:20 no dia seguinte": "conflito",
+        "00:30-01:00 no dia seguinte": "gravado",
+    }
+
+    resultado = {
+        "processos": args.processos,
+        "tentativas_por_processo": args.tentativas,
+        "duracao_servico_min": args.duracao,
+        "duracao_s": round(duracao, 4),
+        "reservas_por_segundo": round(len(latencias) / duracao, 2) if duracao else 0.0,
+        "latencia_p50_ms": round(percentil(latencias, 0.50) * 1000, 2),
+        "latencia_p99_ms": round(percentil(latencias, 0.99) * 1000, 2),
+        "agendamentos_no_banco": total,
+        "sobreposicoes": sobreposicoes,
+        "virada_do_dia": virada,
+        **contagem
+    }
+
+    print(json.dumps(resultado, indent=2, ensure_ascii=False))
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as arquivo:
+            json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+
+    if sobreposicoes or contagem["outros"] or not virada_ok:
+        sys.exit(1)
+    return resultado
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Estresse de reservas simultâneas no mesmo profissional.")
+    parser.add_argument("--processos", type=int, default=8)
+    parser.add_argument("--tentativas", type=int, default=200)
+    parser.add_argument("--duracao", type=int, default=30, help="Duração do serviço em minutos.")
+    parser.add_argument("--database-url", default="", help="Usa este banco em vez de um SQLite temporário.")
+    parser.add_argument("--saida", default="", help="Arquivo JSON para gravar o resultado.")
+    executar(parser.parse_args())
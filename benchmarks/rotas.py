@@ -0,0 +1,230 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+from datetime import date, datetime, timedelta
+
+# Benchmark das rotas quentes sobre dados sintéticos (benchmarks.dados_sinteticos):
+# latência p50/p95/p99 e consultas SQL por rota e por escala, pelo test
+# client do Flask. Grava JSON para comparar execuções.
+# Uso (na raiz do projeto):
+#   python -m benchmarks.rotas --escalas pequena,media --amostras 50 --saida resultado.json
+#   python -m benchmarks.rotas --escalas media --database-url postgresql://localhost/agenda_bench
+# Com --database-url o banco é APAGADO antes de cada escala: use um banco descartável.
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.lembretes import percentil
+from benchmarks.dados_sinteticos import ESCALAS, telefone_cliente
+
+RESPOSTAS_POR_WEBHOOK = 20
+
+
+def configurar_ambiente(args):
+    os.environ.update({
+        "WHATSAPP_SIMULADO": "1",
+        "WHATSAPP_PROVIDER": "meta",
+        "WHATSAPP_FILA_EM_PROCESSO": "0",
+        "LEMBRETES_AGENDADOR_EM_PROCESSO": "0",
+        "WHATSAPP_ENTRADA_EM_PROCESSO": "0",
+        "METRICAS_ATIVAS": "0"
+    })
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        os.environ.pop("DATABASE_URL", None)
+
+
+def preparar_escala(args, escala):
+    from app import create_app
+    from flask_migrate import upgrade
+    from benchmarks.dados_sinteticos import gerar_dados, mostrar_progresso
+
+    if not args.database_url:
+        # SQLite novo por escala; com Postgres o mesmo banco é limpo.
+        os.environ["RENDER_DISK_PATH"] = tempfile.mkdtemp(prefix=f"bench_rotas_{escala}_")
+
+    app = create_app()
+    with app.app_context():
+        upgrade()
+        resumo = gerar_dados(
+            escala,
+            semente=args.semente,
+            limpar=bool(args.database_url),
+            progresso=mostrar_progresso
+        )
+    return app, resumo
+
+
+def montar_cenarios(app, cliente, sorteio, resumo):
+    from sqlalchemy import delete
+    from database import db
+    from models import MensagemSaida, ProfissionalServico
+    from entrada_whatsapp import aplicar_eventos_pendentes
+    from versao_agenda import incrementar_versoes_dias
+
+    # As requisições do test client abrem o próprio contexto (sessão nova a
+    # cada uma, como em produção); o resto ganha um contexto por chamada.
+    def em_contexto(funcao):
+        def executar_em_contexto(*args):
+            with app.app_context():
+                return funcao(*args)
+        return executar_em_contexto
+
+    hoje = date.today()
+    with app.app_context():
+        vinculos = [(vinculo.profissional_id, vinculo.servico_id) for vinculo in ProfissionalServico.query.all()]
+    servico_ids = sorted({servico_id for _, servico_id in vinculos})
+    respostas_enviadas = [0]
+    dia_da_grade = [None]
+
+    def dia_proximo():
+        return (hoje + timedelta(days=sorteio.randint(0, 14))).strftime("%Y-%m-%d")
+
+    def disponibilidade_proximos():
+        profissional_id, servico_id = sorteio.choice(vinculos)
+        filtro = f"&profissional_id={profissional_id}" if sorteio.random() < 0.5 else ""
+        return cliente.get(f"/disponibilidade/proximos?servico_id={servico_id}&limite=20{filtro}")
+
+    def disponibilidade_do_dia():
+        return cliente.get(f"/agendamentos/novo?servico_id={sorteio.choice(servico_ids)}&data={dia_proximo()}")
+
+    def listar_agendamentos():
+        inicio = hoje + timedelta(days=sorteio.randint(-30, 14))
+        filtro = f"&profissional_id={sorteio.choice(vinculos)[0]}" if sorteio.random() < 0.5 else ""
+        return cliente.get(
+            f"/agendamentos?data_inicio={inicio:%Y-%m-%d}&data_fim={inicio + timedelta(days=7):%Y-%m-%d}{filtro}"
+        )
+
+    def agenda_manual():
+        return cliente.get(f"/agenda/manual?data={dia_da_grade[0]}")
+
+    def aquecer_grade():
+        # Mesma grade pedida antes, fora da medição: a medida é sempre acerto
+        # do cache de HTML.
+        dia_da_grade[0] = dia_proximo()
+        agenda_manual().get_data()
+
+    @em_contexto
+    def esfriar_grade():
+        # Uma escrita no dia muda a versao_dia: a medida é sempre falta no
+        # cache, com leitura dos agendamentos e renderização.
+        dia_da_grade[0] = dia_proximo()
+        incrementar_versoes_dias(db.session, [datetime.strptime(dia_da_grade[0], "%Y-%m-%d").date()])
+        db.session.commit()
+
+    def receber_respostas():
+        mensagens = []
+        for _ in range(RESPOSTAS_POR_WEBHOOK):
+            respostas_enviadas[0] += 1
+            mensagens.append({
+                "id": f"bench-{resumo['escala']}-{respostas_enviadas[0]}",
+                "type": "text",
+                "from": telefone_cliente(sorteio.randrange(resumo["clientes"])),
+                "text": {"body": sorteio.choice(("1", "2", "sim", "ok"))}
+            })
+        return cliente.post("/webhooks/whatsapp", json={"entry": [{"changes": [{"value": {"messages": mensagens}}]}]})
+
+    def processar_lembretes():
+        return cliente.post("/notificacoes/whatsapp/processar")
+
+    @em_contexto
+    def esvaziar_fila():
+        # Sem isso só a primeira amostra enfileiraria alguma coisa.
+        db.session.execute(delete(MensagemSaida))
+        db.session.commit()
+
+    # nome: (ação medida, preparação fora da medição)
+    return {
+        "GET /disponibilidade/proximos": (disponibilidade_proximos, None),
+        "GET /agendamentos/novo (buscar_disponibilidade)": (disponibilidade_do_dia, None),
+        "GET /agendamentos (listar_agendamentos)": (listar_agendamentos, None),
+        "GET /agenda/manual (cache de HTML quente)": (agenda_manual, aquecer_grade),
+        "GET /agenda/manual (cache de HTML frio)": (agenda_manual, esfriar_grade),
+        "POST /webhooks/whatsapp": (receber_respostas, None),
+        "aplicar respostas do WhatsApp": (
+            em_contexto(lambda: aplicar_eventos_pendentes(RESPOSTAS_POR_WEBHOOK)), receber_respostas
+        ),
+        "POST /notificacoes/whatsapp/processar": (processar_lembretes, esvaziar_fila),
+    }
+
+
+def medir(cenarios, amostras):
+    from perfil_consultas import coletar_consultas
+
+    resultados = {}
+    for nome, (acao, preparar) in cenarios.items():
+        latencias, consultas, tempos_sql = [], [], []
+        erros = 0
+        for _ in range(amostras):
+            if preparar:
+                preparar()
+            with coletar_consultas() as coletor:
+                inicio = time.perf_counter()
+                resposta = acao()
+                if hasattr(resposta, "get_data"):
+                    resposta.get_data()
+                latencias.append(time.perf_counter() - inicio)
+            consultas.append(coletor.total)
+            tempos_sql.append(coletor.tempo_total)
+            if getattr(resposta, "status_code", 200) >= 400:
+                erros += 1
+
+        resultados[nome] = {
+            "amostras": amostras,
+            "latencia_p50_ms": round(percentil(latencias, 0.50) * 1000, 2),
+            "latencia_p95_ms": round(percentil(latencias, 0.95) * 1000, 2),
+            "latencia_p99_ms": round(percentil(latencias, 0.99) * 1000, 2),
+            "consultas_p50": percentil(consultas, 0.50),
+            "consultas_max": max(consultas),
+            "sql_p50_ms": round(percentil(tempos_sql, 0.50) * 1000, 2),
+            "erros": erros
+        }
+    return resultados
+
+
+def executar(args):
+    configurar_ambiente(args)
+    escalas = [escala.strip() for escala in args.escalas.split(",") if escala.strip()]
+    for escala in escalas:
+        if escala not in ESCALAS:
+            raise SystemExit(f"Escala desconhecida: {escala} (opções: {', '.join(sorted(ESCALAS))})")
+
+    resultado = {
+        "executado_em": datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
+        "banco": None,
+        "semente": args.semente,
+        "amostras": args.amostras,
+        "escalas": {}
+    }
+
+    for escala in escalas:
+        app, resumo = preparar_escala(args, escala)
+        sorteio = random.Random(args.semente)
+        with app.app_context():
+            from database import db
+            resultado["banco"] = db.engine.dialect.name
+        # Fora de um app_context: cada requisição tem a própria sessão, sem
+        # reaproveitar objetos já carregados por outra.
+        cliente = app.test_client()
+        rotas = medir(montar_cenarios(app, cliente, sorteio, resumo), args.amostras)
+        resultado["escalas"][escala] = {**resumo, "rotas": rotas}
+
+    print(json.dumps(resultado, indent=2, ensure_ascii=False))
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as arquivo:
+            json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+    return resultado
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark das rotas principais em várias escalas de dados.")
+    parser.add_argument("--escalas", default="pequena", help="Lista separada por vírgula: pequena, media, grande.")
+    parser.add_argument("--amostras", type=int, default=50, help="Requisições medidas por rota.")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--database-url", default="", help="Usa este banco (será limpo) em vez de um SQLite temporário.")
+    parser.add_argument("--saida", default="", help="Arquivo JSON para gravar o resultado.")
+    executar(parser.parse_args())
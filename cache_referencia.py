@@ -0,0 +1,115 @@
+import time
+from collections import namedtuple
+from types import MappingProxyType
+from sqlalchemy import select, update
+from database import db
+from models import Profissional, Servico, ProfissionalServico, VersaoCache
+from utils import ler_env
+
+CHAVE_REFERENCIA = "referencia"
+
+ProfissionalRef = namedtuple("ProfissionalRef", "id nome horario_inicio horario_fim")
+ServicoRef = namedtuple("ServicoRef", "id nome duracao")
+Referencias = namedtuple(
+    "Referencias",
+    "versao profissionais servicos vinculos profissionais_por_id servicos_por_id "
+    "nomes_profissionais nomes_servicos servicos_por_profissional profissionais_por_servico"
+)
+
+# (url do banco, chave) -> (conferido_em, Referencias). A entrada é trocada
+# inteira numa única atribuição, então leitores nunca veem estado parcial.
+_cache = {}
+
+
+def ler_versao(chave=CHAVE_REFERENCIA):
+    return db.session.execute(
+        select(VersaoCache.versao).where(VersaoCache.chave == chave)
+    ).scalar() or 0
+
+
+def incrementar_versao(chave=CHAVE_REFERENCIA):
+    # Roda na mesma transação da escrita: os outros workers só enxergam a
+    # versão nova junto com os dados novos.
+    resultado = db.session.execute(
+        update(VersaoCache)
+        .where(VersaoCache.chave == chave)
+        .values(versao=VersaoCache.versao + 1)
+    )
+    if not resultado.rowcount:
+        db.session.add(VersaoCache(chave=chave, versao=1))
+
+    _cache.pop((str(db.engine.url), chave), None)
+
+
+def montar_referencias(versao):
+    profissionais = tuple(
+        ProfissionalRef(*linha)
+        for linha in Profissional.query.with_entities(
+            Profissional.id, Profissional.nome, Profissional.horario_inicio, Profissional.horario_fim
+        ).order_by(Profissional.id.asc())
+    )
+    servicos = tuple(
+        ServicoRef(*linha)
+        for linha in Servico.query.with_entities(
+            Servico.id, Servico.nome, Servico.duracao
+        ).order_by(Servico.id.asc())
+    )
+    linhas_vinculo = ProfissionalServico.query.with_entities(
+        ProfissionalServico.profissional_id, ProfissionalServico.servico_id
+    ).order_by(ProfissionalServico.id.asc()).all()
+
+    profissionais_por_id = {p.id: p for p in profissionais}
+    servicos_por_id = {s.id: s for s in servicos}
+
+    servicos_por_profissional = {}
+    ids_por_servico = {}
+    for profissional_id, servico_id in linhas_vinculo:
+        servicos_por_profissional.setdefault(profissional_id, []).append(servico_id)
+        if profissional_id in profissionais_por_id:
+            ids_por_servico.setdefault(servico_id, set()).add(profissional_id)
+
+    return Referencias(
+        versao=versao,
+        profissionais=profissionais,
+        servicos=servicos,
+        vinculos=frozenset((p, s) for p, s in linhas_vinculo),
+        profissionais_por_id=MappingProxyType(profissionais_por_id),
+        servicos_por_id=MappingProxyType(servicos_por_id),
+        nomes_profissionais=MappingProxyType({p.id: p.nome for p in profissionais}),
+        nomes_servicos=MappingProxyType({s.id: s.nome for s in servicos}),
+        servicos_por_profissional=MappingProxyType({
+            profissional_id: tuple(ids) for profissional_id, ids in servicos_por_profissional.items()
+        }),
+        profissionais_por_servico=MappingProxyType({
+            servico_id: tuple(profissionais_por_id[pid] for pid in sorted(ids))
+            for servico_id, ids in ids_por_servico.items()
+        })
+    )
+
+
+def obter_referencias():
+    # Dentro de CACHE_REFERENCIA_INTERVALO segundos não há nenhuma consulta;
+    # depois disso, só a leitura da versão (chave primária) e a reconstrução
+    # quando algum worker tiver alterado os cadastros.
+    chave = (str(db.engine.url), CHAVE_REFERENCIA)
+    entrada = _cache.get(chave)
+    agora = time.monotonic()
+    intervalo = float(ler_env("CACHE_REFERENCIA_INTERVALO", "1") or 0)
+
+    if entrada is not None and agora - entrada[0] < intervalo:
+        return entrada[1]
+
+    # A versão é lida antes dos dados: se uma escrita entrar no meio, o
+    # retrato fica marcado como antigo e é refeito na próxima conferência.
+    versao = ler_versao()
+    if entrada is not None and entrada[1].versao == versao:
+        _cache[chave] = (agora, entrada[1])
+        return entrada[1]
+
+    referencias = montar_referencias(versao)
+    _cache[chave] = (agora, referencias)
+    return referencias
+
+
+def profissionais_da_agenda(referencias, quantidade=5):
+    return sorted(referencias.profissionais, key=lambda p: p.nome)[:quantidade]
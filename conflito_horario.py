@@ -0,0 +1,24 @@
+from sqlalchemy.exc import IntegrityError
+
+MENSAGEM_CONFLITO = "Conflito de horário: já existe agendamento nesse intervalo."
+
+# Nomes usados pela migração 0008: a restrição de exclusão no Postgres e a
+# mensagem do RAISE dos gatilhos no SQLite.
+RESTRICAO_SOBREPOSICAO = "ex_agendamento_sem_sobreposicao"
+ERRO_SQLITE_SOBREPOSICAO = "conflito_horario_agendamento"
+
+
+def eh_conflito_horario(erro):
+    # O banco é quem garante que dois agendamentos do mesmo profissional não
+    # se sobrepõem; aqui só reconhecemos a violação para devolver a mensagem
+    # de sempre em vez de um erro 500.
+    if not isinstance(erro, IntegrityError):
+        return False
+
+    original = getattr(erro, "orig", None)
+    diagnostico = getattr(original, "diag", None)
+    if getattr(diagnostico, "constraint_name", None) == RESTRICAO_SOBREPOSICAO:
+        return True
+
+    texto = str(original if original is not None else erro)
+    return RESTRICAO_SOBREPOSICAO in texto or ERRO_SQLITE_SOBREPOSICAO in texto
@@ -0,0 +1,138 @@
+from datetime import datetime
+from sqlalchemy import and_, or_
+from models import Agendamento
+
+STATUS_AGENDAMENTO = ("agendado", "confirmado", "cancelado")
+ESTADOS_LEMBRETE = ("ativo", "enviado", "inativo")
+
+
+def ler_filtros_agendamentos(args, data_inicio_padrao=None):
+    # Filtros vindos da query string. Datas inválidas voltam como erro em
+    # vez de exceção para a rota decidir como responder.
+    filtros = {
+        "data_inicio": None,
+        "data_fim": None,
+        "profissional_id": args.get("profissional_id", type=int),
+        "status": args.get("status") if args.get("status") in STATUS_AGENDAMENTO else None,
+        "lembrete": args.get("lembrete") if args.get("lembrete") in ESTADOS_LEMBRETE else None
+    }
+
+    try:
+        data_inicio_texto = args.get("data_inicio")
+        if data_inicio_texto:
+            filtros["data_inicio"] = datetime.strptime(data_inicio_texto, "%Y-%m-%d").date()
+        else:
+            filtros["data_inicio"] = data_inicio_padrao
+
+        data_fim_texto = args.get("data_fim")
+        if data_fim_texto:
+            filtros["data_fim"] = datetime.strptime(data_fim_texto, "%Y-%m-%d").date()
+    except ValueError:
+        return filtros, "Datas devem estar no formato AAAA-MM-DD."
+
+    return filtros, None
+
+
+def filtrar_agendamentos(consulta, filtros):
+    if filtros.get("data_inicio"):
+        consulta = consulta.filter(Agendamento.data >= filtros["data_inicio"])
+    if filtros.get("data_fim"):
+        consulta = consulta.filter(Agendamento.data <= filtros["data_fim"])
+    if filtros.get("profissional_id"):
+        consulta = consulta.filter(Agendamento.profissional_id == filtros["profissional_id"])
+    if filtros.get("status"):
+        consulta = consulta.filter(Agendamento.status == filtros["status"])
+
+    lembrete = filtros.get("lembrete")
+    if lembrete == "ativo":
+        consulta = consulta.filter(
+            Agendamento.lembrete_whatsapp_ativo == True,
+            Agendamento.lembrete_whatsapp_enviado_em.is_(None)
+        )
+    elif lembrete == "enviado":
+        consulta = consulta.filter(Agendamento.lembrete_whatsapp_enviado_em.isnot(None))
+    elif lembrete == "inativo":
+        consulta = consulta.filter(Agendamento.lembrete_whatsapp_ativo == False)
+
+    return consulta
+
+
+def codificar_cursor(agendamento):
+    return f"{agendamento.data.strftime('%Y-%m-%d')}_{agendamento.hora_inicio.strftime('%H:%M:%S')}_{agendamento.id}"
+
+
+def decodificar_cursor(texto):
+    if not texto:
+        return None
+
+    try:
+        data_texto, hora_texto, id_texto = texto.split("_")
+        return (
+            datetime.strptime(data_texto, "%Y-%m-%d").date(),
+            datetime.strptime(hora_texto, "%H:%M:%S").time(),
+            int(id_texto)
+        )
+    except ValueError:
+        return None
+
+
+def depois_do_cursor(cursor):
+    data, hora_inicio, agendamento_id = cursor
+    # O `data >= ...` isolado dá ao banco um intervalo de índice; o OR
+    # resolve o desempate dentro do mesmo dia.
+    return and_(
+        Agendamento.data >= data,
+        or_(
+            Agendamento.data > data,
+            Agendamento.hora_inicio > hora_inicio,
+            and_(Agendamento.hora_inicio == hora_inicio, Agendamento.id > agendamento_id)
+        )
+    )
+
+
+def antes_do_cursor(cursor):
+    data, hora_inicio, agendamento_id = cursor
+    return and_(
+        Agendamento.data <= data,
+        or_(
+            Agendamento.data < data,
+            Agendamento.hora_inicio < hora_inicio,
+            and_(Agendamento.hora_inicio == hora_inicio, Agendamento.id < agendamento_id)
+        )
+    )
+
+
+def paginar_agendamentos(filtros, por_pagina, depois=None, antes=None):
+    # Paginação por chave em (data, hora_inicio, id): cada página custa o
+    # mesmo, não importa quanto histórico existe antes dela.
+    consulta = filtrar_agendamentos(Agendamento.query, filtros)
+    cursor_depois = decodificar_cursor(depois)
+    cursor_antes = decodificar_cursor(antes) if not cursor_depois else None
+
+    if cursor_antes:
+        linhas = consulta.filter(antes_do_cursor(cursor_antes)).order_by(
+            Agendamento.data.desc(),
+            Agendamento.hora_inicio.desc(),
+            Agendamento.id.desc()
+        ).limit(por_pagina + 1).all()
+        tem_anterior = len(linhas) > por_pagina
+        linhas = list(reversed(linhas[:por_pagina]))
+        tem_proxima = True
+    else:
+        if cursor_depois:
+            consulta = consulta.filter(depois_do_cursor(cursor_depois))
+        linhas = consulta.order_by(
+            Agendamento.data.asc(),
+            Agendamento.hora_inicio.asc(),
+            Agendamento.id.asc()
+        ).limit(por_pagina + 1).all()
+        tem_proxima = len(linhas) > por_pagina
+        linhas = linhas[:por_pagina]
+        tem_anterior = cursor_depois is not None
+
+    return {
+        "agendamentos": linhas,
+        "proximo": codificar_cursor(linhas[-1]) if linhas and tem_proxima else None,
+        "anterior": codificar_cursor(linhas[0]) if linhas and tem_anterior else None
+    }
+
@@ -1,3 +1,64 @@
 from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate
+from sqlalchemy import event
+from utils import ler_env
 
-db = SQLAlchemy()
\ No newline at end of file
+db = SQLAlchemy()
+migrate = Migrate()
+
+
+def ler_env_int(nome, padrao):
+    try:
+        return int(ler_env(nome, str(padrao)) or padrao)
+    except ValueError:
+        return padrao
+
+
+def opcoes_engine(database_uri):
+    if database_uri.startswith("sqlite"):
+        # O busy timeout também é aplicado por PRAGMA; aqui vale para o
+        # próprio driver antes mesmo do primeiro comando.
+        return {
+            "connect_args": {
+                "timeout": ler_env_int("SQLITE_BUSY_TIMEOUT_MS", 5000) / 1000.0
+            }
+        }
+
+    return {
+        "pool_size": ler_env_int("DB_POOL_SIZE", 5),
+        "max_overflow": ler_env_int("DB_POOL_MAX_OVERFLOW", 10),
+        "pool_timeout": ler_env_int("DB_POOL_TIMEOUT", 30),
+        "pool_recycle": ler_env_int("DB_POOL_RECYCLE", 1800),
+        "pool_pre_ping": ler_env("DB_POOL_PRE_PING", "1") == "1"
+    }
+
+
+def configurar_sqlite(engine):
+    # Perfil para vários workers do gunicorn no mesmo arquivo: WAL deixa
+    # leituras e uma escrita andarem juntas e o busy_timeout espera o
+    # lock em vez de falhar com "database is locked".
+    if engine.dialect.name != "sqlite":
+        return
+
+    em_memoria = engine.url.database in (None, "", ":memory:")
+    journal_mode = ler_env("SQLITE_JOURNAL_MODE", "WAL").upper()
+    if journal_mode not in ("WAL", "DELETE", "TRUNCATE", "PERSIST", "MEMORY"):
+        journal_mode = "WAL"
+    synchronous = ler_env("SQLITE_SYNCHRONOUS", "NORMAL").upper()
+    if synchronous not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+        synchronous = "NORMAL"
+    busy_timeout = ler_env_int("SQLITE_BUSY_TIMEOUT_MS", 5000)
+    cache_kb = ler_env_int("SQLITE_CACHE_KB", 20000)
+
+    @event.listens_for(engine, "connect")
+    def aplicar_pragmas(conexao_dbapi, _registro):
+        cursor = conexao_dbapi.cursor()
+        try:
+            if not em_memoria and journal_mode:
+                cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+            cursor.execute(f"PRAGMA busy_timeout={busy_timeout}")
+            if synchronous:
+                cursor.execute(f"PRAGMA synchronous={synchronous}")
+            cursor.execute(f"PRAGMA cache_size={-abs(cache_kb)}")
+        finally:
+            cursor.close()
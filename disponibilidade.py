@@ -0,0 +1,333 @@
+from bisect import bisect_left
+from datetime import timedelta
+from models import Agendamento
+
+
+def hora_para_minutos(valor):
+    if isinstance(valor, str):
+        horas, minutos = valor.split(":")
+        return int(horas) * 60 + int(minutos)
+    return valor.hour * 60 + valor.minute
+
+
+def minutos_para_hora_str(minutos):
+    return f"{minutos // 60:02d}:{minutos % 60:02d}"
+
+
+def montar_indice_intervalos(intervalos):
+    # intervalos: iterável de (profissional_id, inicio_min, fim_min)
+    por_profissional = {}
+    for profissional_id, inicio, fim in intervalos:
+        por_profissional.setdefault(profissional_id, []).append((inicio, fim))
+
+    indice = {}
+    for profissional_id, lista in por_profissional.items():
+        lista.sort()
+        inicios = [inicio for inicio, _ in lista]
+        fins_max = []
+        maior_fim = None
+        for _, fim in lista:
+            maior_fim = fim if maior_fim is None or fim > maior_fim else maior_fim
+            fins_max.append(maior_fim)
+        indice[profissional_id] = (inicios, fins_max)
+
+    return indice
+
+
+def carregar_indice_do_dia(data_agendamento, profissional_ids):
+    if not profissional_ids:
+        return {}
+
+    linhas = (
+        Agendamento.query
+        .with_entities(Agendamento.profissional_id, Agendamento.hora_inicio, Agendamento.hora_fim)
+        .filter(
+            Agendamento.data == data_agendamento,
+            Agendamento.profissional_id.in_(profissional_ids)
+        )
+        .all()
+    )
+
+    return montar_indice_intervalos(
+        (profissional_id, hora_para_minutos(hora_inicio), hora_para_minutos(hora_fim))
+        for profissional_id, hora_inicio, hora_fim in linhas
+    )
+
+
+def tem_conflito(indice, profissional_id, inicio, fim):
+    # Mesma regra de verificar_conflito: inicio < ag.fim and fim > ag.inicio.
+    # Os intervalos candidatos são os que começam antes de `fim`; basta saber
+    # se o maior fim entre eles ultrapassa `inicio`.
+    entrada = indice.get(profissional_id)
+    if not entrada:
+        return False
+
+    inicios, fins_max = entrada
+    posicao = bisect_left(inicios, fim)
+    return posicao > 0 and fins_max[posicao - 1] > inicio
+
+
+def calcular_disponibilidade(profissionais, indice, duracao, passo=30):
+    disponibilidade = {}
+
+    for profissional in profissionais:
+        inicio_turno = hora_para_minutos(profissional.horario_inicio)
+        fim_turno = hora_para_minutos(profissional.horario_fim)
+
+        inicio_slot = inicio_turno
+        while inicio_slot + duracao <= fim_turno:
+            fim_slot = inicio_slot + duracao
+
+            if not tem_conflito(indice, profissional.id, inicio_slot, fim_slot):
+                chave_hora = minutos_para_hora_str(inicio_slot)
+                if chave_hora not in disponibilidade:
+                    disponibilidade[chave_hora] = []
+
+                disponibilidade[chave_hora].append(
+                    {
+                        "id": profissional.id,
+                        "nome": profissional.nome
+                    }
+                )
+
+            inicio_slot += passo
+
+    return disponibilidade
+
+
+# =========================
+# BITMAPS DE OCUPAÇÃO (1 bit por minuto do dia)
+# =========================
+
+MINUTOS_DIA = 24 * 60
+
+
+def mascara_intervalo(inicio, fim):
+    inicio = max(inicio, 0)
+    fim = min(fim, MINUTOS_DIA)
+    if fim <= inicio:
+        return 0
+    return ((1 << (fim - inicio)) - 1) << inicio
+
+
+def mascara_grade(inicio_turno, fim_turno, passo=30):
+    mascara = 0
+    for minuto in range(inicio_turno, fim_turno, passo):
+        mascara |= 1 << minuto
+    return mascara
+
+
+def inicios_com_folga(livre, duracao):
+    # Bit m fica ligado só se os minutos m .. m+duracao-1 estiverem livres.
+    resultado = livre
+    coberto = 1
+    while coberto < duracao and resultado:
+        deslocamento = min(coberto, duracao - coberto)
+        resultado &= resultado >> deslocamento
+        coberto += deslocamento
+    return resultado
+
+
+def iterar_bits(mascara):
+    while mascara:
+        menor = mascara & -mascara
+        yield menor.bit_length() - 1
+        mascara ^= menor
+
+
+def carregar_bitmaps_periodo(data_inicio, data_fim, profissional_ids):
+    if not profissional_ids:
+        return {}
+
+    # A véspera entra na consulta: um agendamento que passa da meia-noite
+    # ocupa o começo do primeiro dia (mesma regra da 0008/0011).
+    linhas = (
+        Agendamento.query
+        .with_entities(
+            Agendamento.profissional_id,
+            Agendamento.data,
+            Agendamento.hora_inicio,
+            Agendamento.hora_fim
+        )
+        .filter(
+            Agendamento.data >= data_inicio - timedelta(days=1),
+            Agendamento.data <= data_fim,
+            Agendamento.profissional_id.in_(profissional_ids)
+        )
+        .all()
+    )
+
+    bitmaps = {}
+
+    def ocupar(chave, inicio, fim):
+        bitmaps[chave] = bitmaps.get(chave, 0) | mascara_intervalo(inicio, fim)
+
+    for profissional_id, data_agendamento, hora_inicio, hora_fim in linhas:
+        inicio = hora_para_minutos(hora_inicio)
+        fim = hora_para_minutos(hora_fim)
+        if fim == inicio:
+            # Intervalo vazio: não ocupa nada, como no banco.
+            continue
+        if fim > inicio:
+            ocupar((profissional_id, data_agendamento), inicio, fim)
+            continue
+        ocupar((profissional_id, data_agendamento), inicio, MINUTOS_DIA)
+        ocupar((profissional_id, data_agendamento + timedelta(days=1)), 0, fim)
+
+    return bitmaps
+
+
+def buscar_proximos_horarios(profissionais, bitmaps, datas, duracao, limite, passo=30, minuto_minimo=None):
+    # minuto_minimo: {data: minuto} para descartar horários que já passaram.
+    turnos = []
+    for profissional in profissionais:
+        inicio_turno = hora_para_minutos(profissional.horario_inicio)
+        fim_turno = hora_para_minutos(profissional.horario_fim)
+        turnos.append((
+            profissional,
+            mascara_intervalo(inicio_turno, fim_turno),
+            mascara_grade(inicio_turno, fim_turno, passo)
+        ))
+
+    minuto_minimo = minuto_minimo or {}
+    resultados = []
+
+    for data_agendamento in datas:
+        corte = minuto_minimo.get(data_agendamento, 0)
+        mascara_corte = ~((1 << corte) - 1)
+        do_dia = []
+
+        for profissional, turno, grade in turnos:
+            ocupado = bitmaps.get((profissional.id, data_agendamento), 0)
+            inicios = inicios_com_folga(turno & ~ocupado, duracao) & grade & mascara_corte
+            for minuto in iterar_bits(inicios):
+                do_dia.append((minuto, profissional.id, profissional))
+
+        do_dia.sort(key=lambda item: (item[0], item[1]))
+
+        for minuto, _, profissional in do_dia:
+            resultados.append(
+                {
+                    "data": data_agendamento.strftime("%Y-%m-%d"),
+                    "hora_inicio": minutos_para_hora_str(minuto),
+                    "hora_fim": minutos_para_hora_str(minuto + duracao),
+                    "profissional": {
+                        "id": profissional.id,
+                        "nome": profissional.nome
+                    }
+                }
+            )
+            if len(resultados) >= limite:
+                return resultados
+
+    return resultados
+
+
+# =========================
+# COMBOS (serviços em sequência)
+# =========================
+
+def escolher_profissionais_da_cadeia(candidatos_por_etapa):
+    # Menor número de trocas de profissional; empate resolvido pelo menor id.
+    melhor = {pid: (0, [pid]) for pid in candidatos_por_etapa[0]}
+
+    for candidatos in candidatos_por_etapa[1:]:
+        proximo = {}
+        for pid in candidatos:
+            opcoes = []
+            for anterior, (trocas, caminho) in melhor.items():
+                opcoes.append((trocas + (0 if anterior == pid else 1), caminho + [pid]))
+            proximo[pid] = min(opcoes)
+        melhor = proximo
+
+    return min(melhor.values())
+
+
+def buscar_combos(etapas, bitmaps, data_agendamento, limite, passo=30, minuto_minimo=0):
+    # etapas: lista ordenada de (servico, [profissionais vinculados])
+    if not etapas or any(not profissionais for _, profissionais in etapas):
+        return []
+
+    livres = {}
+    grades = {}
+    for _, profissionais in etapas:
+        for profissional in profissionais:
+            if profissional.id in livres:
+                continue
+            inicio_turno = hora_para_minutos(profissional.horario_inicio)
+            fim_turno = hora_para_minutos(profissional.horario_fim)
+            ocupado = bitmaps.get((profissional.id, data_agendamento), 0)
+            livres[profissional.id] = mascara_intervalo(inicio_turno, fim_turno) & ~ocupado
+            grades[profissional.id] = mascara_grade(inicio_turno, fim_turno, passo)
+
+    # cabe[k][pid]: bit t ligado se pid consegue fazer a etapa k começando
+    # em t + deslocamento da etapa k. Na primeira etapa o início ainda tem de
+    # cair na grade do próprio profissional que a faz; as seguintes emendam.
+    # `validos` fica só com os inícios em que cada etapa tem alguém.
+    cabe = []
+    deslocamento = 0
+    validos = ~((1 << minuto_minimo) - 1)
+
+    for servico, profissionais in etapas:
+        da_etapa = {}
+        uniao = 0
+        for profissional in profissionais:
+            mascara = inicios_com_folga(livres[profissional.id], servico.duracao) >> deslocamento
+            if not cabe:
+                mascara &= grades[profissional.id]
+            mascara &= validos
+            if mascara:
+                da_etapa[profissional.id] = mascara
+                uniao |= mascara
+        cabe.append(da_etapa)
+        validos &= uniao
+        if not validos:
+            return []
+        deslocamento += servico.duracao
+
+    nomes = {p.id: p.nome for _, profissionais in etapas for p in profissionais}
+    opcoes = []
+
+    for minuto in iterar_bits(validos):
+        candidatos_por_etapa = [
+            [pid for pid, mascara in da_etapa.items() if (mascara >> minuto) & 1]
+            for da_etapa in cabe
+        ]
+
+        comuns = set(candidatos_por_etapa[0]).intersection(*candidatos_por_etapa[1:])
+        if comuns:
+            cadeias = [(0, [pid] * len(etapas)) for pid in sorted(comuns)]
+        else:
+            cadeias = [escolher_profissionais_da_cadeia(candidatos_por_etapa)]
+
+        for trocas, caminho in cadeias:
+            opcoes.append((minuto, trocas, caminho))
+
+    opcoes.sort(key=lambda item: (item[0], item[1], item[2]))
+
+    resultados = []
+    for minuto, trocas, caminho in opcoes[:limite]:
+        cursor = minuto
+        detalhes = []
+        for (servico, _), profissional_id in zip(etapas, caminho):
+            detalhes.append(
+                {
+                    "servico": {"id": servico.id, "nome": servico.nome},
+                    "profissional": {"id": profissional_id, "nome": nomes[profissional_id]},
+                    "hora_inicio": minutos_para_hora_str(cursor),
+                    "hora_fim": minutos_para_hora_str(cursor + servico.duracao)
+                }
+            )
+            cursor += servico.duracao
+
+        resultados.append(
+            {
+                "data": data_agendamento.strftime("%Y-%m-%d"),
+                "hora_inicio": minutos_para_hora_str(minuto),
+                "hora_fim": minutos_para_hora_str(cursor),
+                "trocas_profissional": trocas,
+                "etapas": detalhes
+            }
+        )
+
+    return resultados
@@ -0,0 +1,228 @@
+import time
+import uuid
+import threading
+from datetime import datetime
+from sqlalchemy import select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from database import db
+from lembretes_agendados import agora_na_agenda
+from metricas import observar
+from models import Agendamento, EventoWebhook
+from utils import ler_env, normalizar_telefone
+
+_trava_aplicacao = threading.Lock()
+_aplicacao_pedida = threading.Event()
+
+
+def extrair_eventos_meta(payload):
+    eventos = []
+    for entry in payload.get("entry", []):
+        for change in entry.get("changes", []):
+            value = change.get("value", {})
+            for mensagem in value.get("messages", []):
+                if mensagem.get("type") != "text":
+                    continue
+                eventos.append({
+                    "provider": "meta",
+                    "mensagem_id": mensagem.get("id") or uuid.uuid4().hex,
+                    "remetente": mensagem.get("from", ""),
+                    "texto": mensagem.get("text", {}).get("body", "")
+                })
+    return eventos
+
+
+def extrair_evento_twilio(formulario):
+    remetente = formulario.get("From", "")
+    if remetente.lower().startswith("whatsapp:"):
+        remetente = remetente.split(":", 1)[1]
+
+    return {
+        "provider": "twilio",
+        "mensagem_id": formulario.get("MessageSid") or uuid.uuid4().hex,
+        "remetente": remetente,
+        "texto": formulario.get("Body", "")
+    }
+
+
+def registrar_eventos(eventos):
+    # Só grava a caixa de entrada. Reentregas do provedor batem na chave
+    # única (provider, mensagem_id) e são descartadas pelo próprio banco.
+    if not eventos:
+        return 0
+
+    agora = datetime.utcnow()
+    linhas = [
+        {
+            "provider": evento["provider"],
+            "mensagem_id": evento["mensagem_id"][:100],
+            "remetente": (evento["remetente"] or "")[:30],
+            "texto": evento["texto"] or "",
+            "status": "pendente",
+            "recebido_em": agora
+        }
+        for evento in eventos
+        if evento["remetente"]
+    ]
+    if not linhas:
+        return 0
+
+    tabela = EventoWebhook.__table__
+    dialeto = db.session.get_bind().dialect.name
+
+    if dialeto in ("sqlite", "postgresql"):
+        modulo = sqlite if dialeto == "sqlite" else postgresql
+        comando = modulo.insert(tabela).values(linhas).on_conflict_do_nothing(
+            index_elements=[tabela.c.provider, tabela.c.mensagem_id]
+        )
+        resultado = db.session.execute(comando)
+        db.session.commit()
+        return resultado.rowcount
+
+    gravados = 0
+    for linha in linhas:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(tabela.insert(), linha)
+            gravados += 1
+        except IntegrityError:
+            continue
+    db.session.commit()
+    return gravados
+
+
+def resposta_para_status(texto):
+    resposta = (texto or "").strip()
+    if resposta == "1":
+        return "confirmado"
+    if resposta == "2":
+        return "cancelado"
+    return None
+
+
+def carregar_alvos(telefones):
+    # Para cada telefone, o agendamento que recebeu o lembrete mais recente;
+    # sem lembrete enviado, o próximo agendamento. Uma consulta para o lote.
+    if not telefones:
+        return {}
+
+    hoje = agora_na_agenda().date()
+    candidatos = Agendamento.query.filter(
+        Agendamento.cliente_telefone_normalizado.in_(telefones),
+        Agendamento.data >= hoje
+    ).order_by(
+        Agendamento.lembrete_whatsapp_enviado_em.is_(None).asc(),
+        Agendamento.lembrete_whatsapp_enviado_em.desc(),
+        Agendamento.data.asc(),
+        Agendamento.hora_inicio.asc()
+    ).all()
+
+    alvos = {}
+    for agendamento in candidatos:
+        alvos.setdefault(agendamento.cliente_telefone_normalizado, agendamento)
+    return alvos
+
+
+def aplicar_eventos_pendentes(tamanho_lote=200):
+    while True:
+        ids = db.session.execute(
+            select(EventoWebhook.id)
+            .where(EventoWebhook.status == "pendente")
+            .order_by(EventoWebhook.id.asc())
+            .limit(tamanho_lote)
+        ).scalars().all()
+        if not ids:
+            return 0
+
+        # Reivindicar e aplicar na mesma transação: outro processo que tente o
+        # mesmo lote espera o lock e não encontra mais linhas pendentes.
+        eventos = db.session.execute(
+            update(EventoWebhook)
+            .where(EventoWebhook.id.in_(ids), EventoWebhook.status == "pendente")
+            .values(status="aplicando")
+            .returning(EventoWebhook.id, EventoWebhook.remetente, EventoWebhook.texto, EventoWebhook.recebido_em),
+            execution_options={"synchronize_session": False}
+        ).all()
+        if eventos:
+            break
+        # Outro processo levou o lote inteiro; pode haver pendentes depois
+        # dele, então seleciona de novo em vez de devolver 0 ao drenar_eventos.
+
+    eventos.sort(key=lambda evento: evento.id)
+
+    telefones = {normalizar_telefone(evento.remetente) for evento in eventos}
+    telefones.discard("")
+    alvos = carregar_alvos(telefones)
+
+    agora = datetime.utcnow()
+    atualizacoes = []
+    for evento in eventos:
+        status = resposta_para_status(evento.texto)
+        alvo = alvos.get(normalizar_telefone(evento.remetente)) if status else None
+        if alvo is not None:
+            # Na ordem de chegada: a última resposta do telefone prevalece.
+            alvo.status = status
+        atualizacoes.append({
+            "id": evento.id,
+            "status": "aplicado" if alvo is not None else "ignorado",
+            "processado_em": agora
+        })
+
+    db.session.execute(update(EventoWebhook), atualizacoes)
+    db.session.commit()
+
+    for evento in eventos:
+        if evento.recebido_em is not None:
+            observar("agenda_webhook_atraso_segundos", max((agora - evento.recebido_em).total_seconds(), 0.0))
+    return len(eventos)
+
+
+def drenar_eventos(tamanho_lote=200):
+    total = 0
+    while True:
+        aplicados = aplicar_eventos_pendentes(tamanho_lote)
+        if not aplicados:
+            return total
+        total += aplicados
+
+
+def iniciar_aplicacao_em_segundo_plano(app):
+    # Como a fila de saída: sem worker dedicado, o processo web aplica as
+    # respostas numa thread depois de responder ao provedor.
+    if ler_env("WHATSAPP_ENTRADA_EM_PROCESSO", "1") != "1":
+        return False
+
+    # Mesmo esquema da drenagem da fila de saída: o pedido fica registrado
+    # para a thread em andamento dar mais uma volta se ele chegar na última
+    # passada vazia.
+    _aplicacao_pedida.set()
+    if not _trava_aplicacao.acquire(blocking=False):
+        return False
+
+    def aplicar():
+        while True:
+            try:
+                _aplicacao_pedida.clear()
+                with app.app_context():
+                    drenar_eventos()
+            except Exception as erro_geral:
+                print(f"[ENTRADA WHATSAPP] Erro ao aplicar respostas: {erro_geral}")
+            finally:
+                _trava_aplicacao.release()
+
+            if not _aplicacao_pedida.is_set() or not _trava_aplicacao.acquire(blocking=False):
+                return
+
+    threading.Thread(target=aplicar, daemon=True).start()
+    return True
+
+
+def executar_aplicador(app, continuo=True, intervalo=2.0, tamanho_lote=200):
+    with app.app_context():
+        while True:
+            total = drenar_eventos(tamanho_lote)
+            if total:
+                print(f"[ENTRADA WHATSAPP] respostas processadas {total}")
+            if not continuo:
+                return total
+            time.sleep(intervalo)
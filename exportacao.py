@@ -0,0 +1,109 @@
+import io
+import csv
+import json
+from sqlalchemy import select
+from database import db
+from models import Profissional, Servico, Agendamento
+from consulta_agendamentos import filtrar_agendamentos
+
+CAMPOS_EXPORTACAO = (
+    "id",
+    "data",
+    "hora_inicio",
+    "hora_fim",
+    "cliente_nome",
+    "cliente_telefone",
+    "profissional_id",
+    "profissional_nome",
+    "servico_id",
+    "servico_nome",
+    "status",
+    "lembrete_whatsapp_ativo",
+    "lembrete_whatsapp_enviado_em",
+    "criado_em"
+)
+
+FORMATOS_EXPORTACAO = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson"
+}
+
+
+def consultar_exportacao(filtros, tamanho_lote=1000):
+    # yield_per liga stream_results: no Postgres vira cursor no servidor e
+    # no SQLite as linhas saem do driver aos poucos. A memória fica presa
+    # ao tamanho do lote, não ao tamanho da tabela.
+    consulta = select(
+        Agendamento.id,
+        Agendamento.data,
+        Agendamento.hora_inicio,
+        Agendamento.hora_fim,
+        Agendamento.cliente_nome,
+        Agendamento.cliente_telefone,
+        Agendamento.profissional_id,
+        Profissional.nome.label("profissional_nome"),
+        Agendamento.servico_id,
+        Servico.nome.label("servico_nome"),
+        Agendamento.status,
+        Agendamento.lembrete_whatsapp_ativo,
+        Agendamento.lembrete_whatsapp_enviado_em,
+        Agendamento.criado_em
+    ).outerjoin(
+        Profissional, Profissional.id == Agendamento.profissional_id
+    ).outerjoin(
+        Servico, Servico.id == Agendamento.servico_id
+    )
+
+    consulta = filtrar_agendamentos(consulta, filtros).order_by(
+        Agendamento.data.asc(),
+        Agendamento.hora_inicio.asc(),
+        Agendamento.id.asc()
+    ).execution_options(yield_per=tamanho_lote)
+
+    return db.session.execute(consulta)
+
+
+def valor_exportado(valor):
+    if valor is None:
+        return None
+    if hasattr(valor, "isoformat"):
+        return valor.isoformat()
+    return valor
+
+
+def gerar_csv(linhas, linhas_por_bloco=500):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(CAMPOS_EXPORTACAO)
+
+    pendentes = 0
+    for linha in linhas:
+        escritor.writerow(["" if valor is None else valor_exportado(valor) for valor in linha])
+        pendentes += 1
+        if pendentes >= linhas_por_bloco:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pendentes = 0
+
+    yield buffer.getvalue()
+
+
+def gerar_ndjson(linhas, linhas_por_bloco=500):
+    bloco = []
+    for linha in linhas:
+        registro = dict(zip(CAMPOS_EXPORTACAO, (valor_exportado(valor) for valor in linha)))
+        bloco.append(json.dumps(registro, ensure_ascii=False))
+        if len(bloco) >= linhas_por_bloco:
+            yield "\n".join(bloco) + "\n"
+            bloco = []
+
+    if bloco:
+        yield "\n".join(bloco) + "\n"
+
+
+def gerar_exportacao(filtros, formato="csv"):
+    linhas = consultar_exportacao(filtros)
+    if formato == "ndjson":
+        return gerar_ndjson(linhas)
+    return gerar_csv(linhas)
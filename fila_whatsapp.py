@@ -0,0 +1,565 @@
+import time
+import uuid
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import and_, bindparam, exists, func, or_, select, text, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from database import db
+from models import Agendamento, LembreteAgendado, MensagemSaida, LEMBRETE_ATIVO_NA_FILA
+from lembretes_agendados import agora_na_agenda, reprogramar_lembretes
+from transporte_http import obter_pool
+from utils import ler_env, normalizar_telefone
+from whatsapp import enviar_whatsapp, montar_mensagem_confirmacao, resultado_envio
+
+STATUS_ATIVOS = ("pendente", "enviando")
+
+_trava_drenagem = threading.Lock()
+_drenagem_pedida = threading.Event()
+_trava_agendador = threading.Lock()
+
+
+def enfileirar_mensagem(agendamento, tipo="lembrete", lote_id=None):
+    mensagem = MensagemSaida(
+        agendamento_id=agendamento.id,
+        lote_id=lote_id,
+        tipo=tipo,
+        telefone=normalizar_telefone(agendamento.cliente_telefone),
+        mensagem=montar_mensagem_confirmacao(agendamento),
+        status="pendente",
+        tentativas=0,
+        proxima_tentativa_em=datetime.utcnow()
+    )
+    db.session.add(mensagem)
+    return mensagem
+
+
+def enfileirar_lembretes_de(agendamentos, lote_id=None, linhas_por_comando=500):
+    # Um lembrete ativo por agendamento é garantido pelo índice único
+    # parcial: se dois processamentos correrem juntos, o segundo só encontra
+    # conflito e não enfileira de novo. Devolve os ids dos agendamentos que
+    # ganharam mensagem (o RETURNING só traz as linhas inseridas).
+    agora = datetime.utcnow()
+    linhas = [
+        {
+            "agendamento_id": agendamento.id,
+            "lote_id": lote_id,
+            "tipo": "lembrete",
+            "telefone": normalizar_telefone(agendamento.cliente_telefone),
+            "mensagem": montar_mensagem_confirmacao(agendamento),
+            "status": "pendente",
+            "tentativas": 0,
+            "proxima_tentativa_em": agora,
+            "criado_em": agora
+        }
+        for agendamento in agendamentos
+    ]
+    if not linhas:
+        return set()
+
+    tabela = MensagemSaida.__table__
+    dialeto = db.session.get_bind().dialect.name
+
+    gravados = set()
+    if dialeto in ("sqlite", "postgresql"):
+        modulo = sqlite if dialeto == "sqlite" else postgresql
+        for inicio in range(0, len(linhas), linhas_por_comando):
+            comando = modulo.insert(tabela).values(linhas[inicio:inicio + linhas_por_comando]).on_conflict_do_nothing(
+                index_elements=[tabela.c.agendamento_id],
+                index_where=text(LEMBRETE_ATIVO_NA_FILA)
+            ).returning(tabela.c.agendamento_id)
+            gravados.update(db.session.execute(comando).scalars())
+        return gravados
+
+    for linha in linhas:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(tabela.insert(), linha)
+            gravados.add(linha["agendamento_id"])
+        except IntegrityError:
+            continue
+    return gravados
+
+
+def enfileirar_lembretes(data_alvo, lote_id=None):
+    ja_na_fila = exists().where(
+        MensagemSaida.agendamento_id == Agendamento.id,
+        MensagemSaida.tipo == "lembrete",
+        MensagemSaida.status.in_(STATUS_ATIVOS)
+    )
+
+    pendentes = Agendamento.query.filter(
+        Agendamento.data == data_alvo,
+        Agendamento.lembrete_whatsapp_ativo == True,
+        Agendamento.lembrete_whatsapp_enviado_em.is_(None),
+        ~ja_na_fila
+    ).all()
+
+    enfileirados = enfileirar_lembretes_de(pendentes, lote_id)
+    if not enfileirados:
+        return 0
+
+    # O envio manual da véspera faz as vezes do lembrete programado de maior
+    # antecedência; os menores (ex.: 2h antes) continuam valendo. Só conta
+    # para quem ganhou mensagem agora.
+    programados = db.session.execute(
+        select(LembreteAgendado.id, LembreteAgendado.agendamento_id, LembreteAgendado.antecedencia_min)
+        .where(
+            LembreteAgendado.agendamento_id.in_(enfileirados),
+            LembreteAgendado.status == "agendado"
+        )
+    ).all()
+    maiores = {}
+    for programado in programados:
+        atual = maiores.get(programado.agendamento_id)
+        if atual is None or programado.antecedencia_min > atual.antecedencia_min:
+            maiores[programado.agendamento_id] = programado
+    if maiores:
+        agora = datetime.utcnow()
+        db.session.execute(update(LembreteAgendado), [
+            {"id": programado.id, "status": "enfileirado", "enfileirado_em": agora}
+            for programado in maiores.values()
+        ])
+
+    return len(enfileirados)
+
+
+def enfileirar_lembretes_vencidos(tamanho_lote=100):
+    # Consulta só o começo da fila por horário de envio (índice em status,
+    # enviar_em): cada lembrete sai na hora dele, não num lote diário.
+    resumo = {"vencidos": 0, "enfileirados": 0, "expirados": 0, "adiados": 0}
+    agora = agora_na_agenda()
+    # Reivindicar e enfileirar na mesma transação. No Postgres, SKIP LOCKED
+    # faz cada agendador pegar linhas diferentes sem esperar o outro; no
+    # SQLite o UPDATE já roda com o lock de escrita do banco. Agendamento que
+    # ainda tem lembrete na fila (ex.: o de 24h em nova tentativa quando o de
+    # 2h vence) fica para depois: o índice único não deixaria entrar outro.
+    ja_na_fila = exists().where(
+        MensagemSaida.agendamento_id == LembreteAgendado.agendamento_id,
+        MensagemSaida.tipo == "lembrete",
+        MensagemSaida.status.in_(STATUS_ATIVOS)
+    )
+    candidatos = (
+        select(LembreteAgendado.id)
+        .where(LembreteAgendado.status == "agendado", LembreteAgendado.enviar_em <= agora, ~ja_na_fila)
+        .order_by(LembreteAgendado.enviar_em.asc(), LembreteAgendado.id.asc())
+        .limit(tamanho_lote)
+        .with_for_update(skip_locked=True)
+    )
+    vencidos = db.session.execute(
+        update(LembreteAgendado)
+        .where(LembreteAgendado.id.in_(candidatos), LembreteAgendado.status == "agendado")
+        .values(status="enfileirado", enfileirado_em=datetime.utcnow())
+        .returning(
+            LembreteAgendado.id,
+            LembreteAgendado.agendamento_id,
+            LembreteAgendado.antecedencia_min,
+            LembreteAgendado.enviar_em
+        ),
+        execution_options={"synchronize_session": False}
+    ).all()
+    if not vencidos:
+        db.session.rollback()
+        return resumo
+
+    # Se o agendador ficou parado e o atendimento já começou, o lembrete
+    # perdeu o sentido.
+    expirados = {
+        vencido.id for vencido in vencidos
+        if vencido.enviar_em + timedelta(minutes=vencido.antecedencia_min) <= agora
+    }
+    if expirados:
+        db.session.execute(update(LembreteAgendado), [
+            {"id": lembrete_id, "status": "expirado"} for lembrete_id in expirados
+        ])
+
+    agendamento_ids = {vencido.agendamento_id for vencido in vencidos if vencido.id not in expirados}
+    agendamentos = Agendamento.query.filter(Agendamento.id.in_(agendamento_ids)).all() if agendamento_ids else []
+    enfileirados = enfileirar_lembretes_de(agendamentos)
+
+    # Se outro processo enfileirou um lembrete do mesmo agendamento entre a
+    # reivindicação e o INSERT, o índice único descartou o nosso: o lembrete
+    # volta a "agendado" e sai quando a fila do agendamento esvaziar.
+    carregados = {agendamento.id for agendamento in agendamentos}
+    descartados = [
+        {"id": vencido.id, "status": "agendado", "enfileirado_em": None}
+        for vencido in vencidos
+        if vencido.id not in expirados
+        and vencido.agendamento_id in carregados
+        and vencido.agendamento_id not in enfileirados
+    ]
+    if descartados:
+        db.session.execute(update(LembreteAgendado), descartados)
+    db.session.commit()
+
+    resumo.update(
+        vencidos=len(vencidos),
+        enfileirados=len(enfileirados),
+        expirados=len(expirados),
+        adiados=len(descartados)
+    )
+    return resumo
+
+
+def drenar_lembretes_vencidos(tamanho_lote=100):
+    total = {"vencidos": 0, "enfileirados": 0, "expirados": 0, "adiados": 0}
+    while True:
+        resumo = enfileirar_lembretes_vencidos(tamanho_lote)
+        for chave, valor in resumo.items():
+            total[chave] += valor
+        # Passada só com adiados: repetir agora pegaria as mesmas linhas.
+        if resumo["vencidos"] == resumo["adiados"]:
+            return total
+
+
+def calcular_proxima_tentativa(tentativas, agora):
+    espera_base = int(ler_env("WHATSAPP_FILA_ESPERA_BASE", "30") or 30)
+    espera = min(espera_base * 2 ** max(tentativas - 1, 0), 3600)
+    return agora + timedelta(seconds=espera)
+
+
+def despachar_mensagens(mensagens, concorrencia=None):
+    # mensagens: lista de (chave, telefone, texto). Só faz I/O de rede;
+    # nenhuma thread do pool toca na sessão do banco. Cada thread consome a
+    # fila compartilhada dentro de uma sessão do transporte, reaproveitando
+    # a mesma conexão keep-alive para todas as mensagens que enviar.
+    if concorrencia is None:
+        concorrencia = int(ler_env("WHATSAPP_CONCORRENCIA", "8") or 8)
+    concorrencia = max(1, concorrencia)
+
+    resultados = {}
+    if not mensagens:
+        return resultados
+
+    fila = queue.SimpleQueue()
+    for item in mensagens:
+        fila.put(item)
+
+    def enviar_em_sequencia():
+        parciais = {}
+        with obter_pool().sessao():
+            while True:
+                try:
+                    chave, telefone, texto = fila.get_nowait()
+                except queue.Empty:
+                    return parciais
+                try:
+                    parciais[chave] = enviar_whatsapp(telefone, texto)
+                except Exception as erro_geral:
+                    parciais[chave] = resultado_envio(
+                        False, erro=f"Erro inesperado: {erro_geral}", tentar_novamente=True
+                    )
+
+    with ThreadPoolExecutor(max_workers=min(concorrencia, len(mensagens))) as executor:
+        futuros = [executor.submit(enviar_em_sequencia) for _ in range(min(concorrencia, len(mensagens)))]
+        for futuro in futuros:
+            # Erro fora do envio de uma mensagem (ex.: ao abrir a sessão do
+            # transporte): as mensagens dessa thread ficam sem resultado e
+            # processar_fila as devolve para a fila.
+            try:
+                resultados.update(futuro.result())
+            except Exception as erro_geral:
+                print(f"[FILA WHATSAPP] Erro numa thread de envio: {erro_geral}")
+
+    return resultados
+
+
+def reivindicar_mensagens(tamanho_lote, agora):
+    # Reserva com prazo: cada mensagem fica com um só remetente (token) até
+    # reservado_ate. Se o processo morrer no meio, a reserva vence e a
+    # mensagem volta para a fila; a tentativa já conta na reserva, então uma
+    # mensagem que derruba o processo não fica em ciclo para sempre.
+    max_tentativas = int(ler_env("WHATSAPP_FILA_MAX_TENTATIVAS", "6") or 6)
+    prazo = int(ler_env("WHATSAPP_FILA_RESERVA_SEGUNDOS", "300") or 300)
+    token = uuid.uuid4().hex
+
+    MensagemSaida.query.filter(
+        MensagemSaida.status == "enviando",
+        MensagemSaida.reservado_ate < agora,
+        MensagemSaida.tentativas >= max_tentativas
+    ).update({
+        MensagemSaida.status: "falhou",
+        MensagemSaida.ultimo_erro: "Reserva expirada sem resposta do envio.",
+        MensagemSaida.reservado_por: None,
+        MensagemSaida.reservado_ate: None
+    }, synchronize_session=False)
+
+    livres = or_(
+        and_(MensagemSaida.status == "pendente", MensagemSaida.proxima_tentativa_em <= agora),
+        and_(MensagemSaida.status == "enviando", MensagemSaida.reservado_ate < agora)
+    )
+    # No Postgres, FOR UPDATE SKIP LOCKED deixa vários remetentes pegarem
+    # lotes diferentes em paralelo; no SQLite a cláusula some e o próprio
+    # UPDATE é atômico (um escritor por vez).
+    candidatos = (
+        select(MensagemSaida.id)
+        .where(livres)
+        .order_by(MensagemSaida.proxima_tentativa_em.asc(), MensagemSaida.id.asc())
+        .limit(tamanho_lote)
+        .with_for_update(skip_locked=True)
+    )
+    lote = db.session.execute(
+        update(MensagemSaida)
+        .where(MensagemSaida.id.in_(candidatos), livres)
+        .values(
+            status="enviando",
+            tentativas=MensagemSaida.tentativas + 1,
+            reservado_por=token,
+            reservado_ate=agora + timedelta(seconds=prazo)
+        )
+        .returning(
+            MensagemSaida.id,
+            MensagemSaida.agendamento_id,
+            MensagemSaida.tipo,
+            MensagemSaida.telefone,
+            MensagemSaida.mensagem,
+            MensagemSaida.tentativas,
+            MensagemSaida.proxima_tentativa_em
+        ),
+        execution_options={"synchronize_session": False}
+    ).all()
+    db.session.commit()
+
+    lote.sort(key=lambda item: (item.proxima_tentativa_em, item.id))
+    return token, lote
+
+
+def processar_fila(tamanho_lote=50, concorrencia=None):
+    resumo = {"processadas": 0, "enviadas": 0, "reagendadas": 0, "falhas": 0}
+
+    token, lote = reivindicar_mensagens(tamanho_lote, datetime.utcnow())
+    if not lote:
+        return resumo
+
+    resultados = despachar_mensagens(
+        [(item.id, item.telefone, item.mensagem) for item in lote],
+        concorrencia
+    )
+
+    # Se a reserva venceu durante o envio e outro remetente pegou a
+    # mensagem, o resultado dela é dele; aqui não se sobrescreve nada.
+    reservadas = set(db.session.execute(
+        select(MensagemSaida.id).where(
+            MensagemSaida.id.in_([item.id for item in lote]),
+            MensagemSaida.reservado_por == token
+        )
+    ).scalars())
+
+    max_tentativas = int(ler_env("WHATSAPP_FILA_MAX_TENTATIVAS", "6") or 6)
+    agora = datetime.utcnow()
+    atualizacoes = []
+    lembretes_enviados = []
+    manuais_enviados = []
+
+    for item in lote:
+        if item.id not in reservadas:
+            continue
+
+        resultado = resultados.get(item.id)
+        if resultado is None:
+            resultado = resultado_envio(False, erro="Envio interrompido sem resultado.", tentar_novamente=True)
+        tentativas = item.tentativas
+        atualizacao = {
+            "id": item.id,
+            "resposta_provider": resultado["resposta"] or None,
+            "ultimo_erro": resultado["erro"],
+            "enviado_em": None,
+            "provider_message_id": None,
+            "proxima_tentativa_em": item.proxima_tentativa_em
+        }
+
+        if resultado["ok"]:
+            atualizacao.update({
+                "status": "enviada",
+                "enviado_em": agora,
+                "provider_message_id": resultado["message_id"]
+            })
+            resumo["enviadas"] += 1
+            if item.agendamento_id:
+                if item.tipo == "manual":
+                    manuais_enviados.append(item.agendamento_id)
+                else:
+                    lembretes_enviados.append(item.agendamento_id)
+        elif resultado["tentar_novamente"] and tentativas < max_tentativas:
+            proxima_tentativa_em = calcular_proxima_tentativa(tentativas, agora)
+            if resultado.get("retry_after"):
+                proxima_tentativa_em = max(
+                    proxima_tentativa_em,
+                    agora + timedelta(seconds=resultado["retry_after"])
+                )
+            atualizacao.update({
+                "status": "pendente",
+                "proxima_tentativa_em": proxima_tentativa_em
+            })
+            resumo["reagendadas"] += 1
+        else:
+            atualizacao["status"] = "falhou"
+            resumo["falhas"] += 1
+
+        atualizacoes.append(atualizacao)
+
+    if atualizacoes:
+        tabela = MensagemSaida.__table__
+        db.session.execute(
+            update(tabela)
+            .where(tabela.c.id == bindparam("b_id"), tabela.c.reservado_por == token)
+            .values(
+                {coluna: bindparam(f"b_{coluna}") for coluna in atualizacoes[0] if coluna != "id"}
+                | {"reservado_por": None, "reservado_ate": None}
+            ),
+            [{f"b_{chave}": valor for chave, valor in atualizacao.items()} for atualizacao in atualizacoes]
+        )
+
+    if lembretes_enviados:
+        Agendamento.query.filter(Agendamento.id.in_(lembretes_enviados)).update(
+            {Agendamento.lembrete_whatsapp_enviado_em: agora},
+            synchronize_session=False
+        )
+
+    if manuais_enviados:
+        Agendamento.query.filter(Agendamento.id.in_(manuais_enviados)).update(
+            {
+                Agendamento.lembrete_whatsapp_ativo: True,
+                Agendamento.lembrete_whatsapp_enviado_em: agora
+            },
+            synchronize_session=False
+        )
+        # Update em massa não passa pelos eventos da sessão.
+        reprogramar_lembretes(db.session, manuais_enviados)
+
+    db.session.commit()
+
+    resumo["processadas"] = len(lote)
+    return resumo
+
+
+def drenar_fila(tamanho_lote=50, concorrencia=None):
+    total = {"processadas": 0, "enviadas": 0, "reagendadas": 0, "falhas": 0}
+    while True:
+        resumo = processar_fila(tamanho_lote, concorrencia)
+        if not resumo["processadas"]:
+            return total
+        for chave, valor in resumo.items():
+            total[chave] += valor
+
+
+def executar_worker(app, continuo=True, intervalo=5.0, tamanho_lote=50, concorrencia=None):
+    with app.app_context():
+        while True:
+            # O worker também é o agendador: a cada volta, os lembretes
+            # vencidos entram na fila antes do envio.
+            drenar_lembretes_vencidos()
+            resumo = drenar_fila(tamanho_lote, concorrencia)
+            if resumo["processadas"]:
+                print(
+                    f"[FILA WHATSAPP] processadas {resumo['processadas']} | "
+                    f"enviadas {resumo['enviadas']} | reagendadas {resumo['reagendadas']} | "
+                    f"falhas {resumo['falhas']}"
+                )
+            if not continuo:
+                return resumo
+            time.sleep(intervalo)
+
+
+def iniciar_drenagem_em_segundo_plano(app):
+    # Para instalações sem worker separado: esvazia a fila numa thread do
+    # próprio processo web. Uma única thread por processo.
+    if ler_env("WHATSAPP_FILA_EM_PROCESSO", "1") != "1":
+        return False
+
+    # O pedido fica registrado mesmo se outra thread já estiver drenando:
+    # ela pode estar na última passada vazia e não ver a mensagem nova.
+    _drenagem_pedida.set()
+    if not _trava_drenagem.acquire(blocking=False):
+        return False
+
+    def drenar():
+        while True:
+            try:
+                _drenagem_pedida.clear()
+                with app.app_context():
+                    drenar_fila()
+            except Exception as erro_geral:
+                print(f"[FILA WHATSAPP] Erro ao drenar a fila: {erro_geral}")
+            finally:
+                _trava_drenagem.release()
+
+            # Pedido que chegou durante a passada: mais uma volta, se nenhuma
+            # outra thread assumiu a trava nesse meio-tempo.
+            if not _drenagem_pedida.is_set() or not _trava_drenagem.acquire(blocking=False):
+                return
+
+    threading.Thread(target=drenar, daemon=True).start()
+    return True
+
+
+def executar_agendador(app, continuo=True, intervalo=30.0, tamanho_lote=100):
+    with app.app_context():
+        while True:
+            try:
+                resumo = drenar_lembretes_vencidos(tamanho_lote)
+            except Exception as erro_geral:
+                db.session.rollback()
+                print(f"[LEMBRETES] Erro ao enfileirar lembretes vencidos: {erro_geral}")
+                resumo = {"vencidos": 0, "enfileirados": 0, "expirados": 0, "adiados": 0}
+
+            if resumo["vencidos"]:
+                print(
+                    f"[LEMBRETES] vencidos {resumo['vencidos']} | "
+                    f"enfileirados {resumo['enfileirados']} | expirados {resumo['expirados']} | "
+                    f"adiados {resumo['adiados']}"
+                )
+            # A cada volta, não só quando algo entrou: mensagens em espera
+            # (backoff) e reservas vencidas também precisam ser retomadas.
+            iniciar_drenagem_em_segundo_plano(app)
+            if not continuo:
+                return resumo
+            time.sleep(intervalo)
+
+
+def iniciar_agendador_em_segundo_plano(app):
+    # Uma thread por processo, que fica consultando a fila de lembretes
+    # programados. Vários processos podem rodar juntos: cada lembrete é
+    # reivindicado por um só.
+    if ler_env("LEMBRETES_AGENDADOR_EM_PROCESSO", "1") != "1":
+        return False
+
+    if not _trava_agendador.acquire(blocking=False):
+        return False
+
+    def agendar():
+        try:
+            executar_agendador(
+                app,
+                continuo=True,
+                intervalo=float(ler_env("LEMBRETES_AGENDADOR_INTERVALO", "30") or 30),
+                tamanho_lote=int(ler_env("LEMBRETES_AGENDADOR_LOTE", "100") or 100)
+            )
+        finally:
+            _trava_agendador.release()
+
+    threading.Thread(target=agendar, daemon=True).start()
+    return True
+
+
+def resumo_lote(lote_id):
+    contagens = dict(
+        MensagemSaida.query
+        .with_entities(MensagemSaida.status, func.count(MensagemSaida.id))
+        .filter(MensagemSaida.lote_id == lote_id)
+        .group_by(MensagemSaida.status)
+        .all()
+    )
+
+    total = sum(contagens.values())
+    pendentes = contagens.get("pendente", 0) + contagens.get("enviando", 0)
+
+    return {
+        "total": total,
+        "enviados": contagens.get("enviada", 0),
+        "falhas": contagens.get("falhou", 0),
+        "pendentes": pendentes,
+        "status": "concluida" if not pendentes else "executando"
+    }
@@ -0,0 +1,9 @@
+# Lido automaticamente pelo gunicorn na raiz do projeto.
+
+
+def child_exit(server, worker):
+    # Worker que saiu (reinício, timeout, max_requests): os números dele vão
+    # para o acumulado dos mortos, e o PID fica livre para outro processo.
+    from metricas import aposentar_retrato
+
+    aposentar_retrato(worker.pid)
@@ -0,0 +1,259 @@
+import io
+import csv
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from database import db
+from models import Agendamento
+from disponibilidade import hora_para_minutos, montar_indice_intervalos, tem_conflito
+from consulta_agendamentos import STATUS_AGENDAMENTO
+from cache_referencia import obter_referencias
+from versao_agenda import registrar_alteracoes
+from conflito_horario import MENSAGEM_CONFLITO, eh_conflito_horario
+from utils import normalizar_telefone
+
+COLUNAS_OBRIGATORIAS = ("cliente_nome", "cliente_telefone", "profissional_id", "data", "hora_inicio")
+
+
+def ler_registros_csv(texto):
+    # Planilhas exportadas em português costumam usar ";" como separador.
+    texto = texto.lstrip("﻿")
+    primeira_linha = texto.split("\n", 1)[0]
+    delimitador = ";" if primeira_linha.count(";") > primeira_linha.count(",") else ","
+
+    leitor = csv.DictReader(io.StringIO(texto), delimiter=delimitador)
+    colunas = [(coluna or "").strip().lower() for coluna in (leitor.fieldnames or [])]
+    faltando = [coluna for coluna in COLUNAS_OBRIGATORIAS if coluna not in colunas]
+    leitor.fieldnames = colunas
+
+    registros = [
+        (numero, {chave: (valor or "").strip() for chave, valor in linha.items() if chave})
+        for numero, linha in enumerate(leitor, start=2)
+    ]
+    return registros, faltando
+
+
+def ler_hora(valor):
+    for formato in ("%H:%M", "%H:%M:%S"):
+        try:
+            return datetime.strptime(valor, formato).time()
+        except ValueError:
+            continue
+    raise ValueError(valor)
+
+
+def ler_data(valor):
+    for formato in ("%Y-%m-%d", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(valor, formato).date()
+        except ValueError:
+            continue
+    raise ValueError(valor)
+
+
+def validar_registro(registro, profissional_ids, duracoes, vinculos):
+    erros = []
+    if not registro.get("cliente_nome"):
+        erros.append("Informe o nome da cliente.")
+    if not registro.get("cliente_telefone"):
+        erros.append("Informe o telefone da cliente.")
+
+    profissional_id = int(registro["profissional_id"]) if registro.get("profissional_id", "").isdigit() else None
+    if profissional_id not in profissional_ids:
+        erros.append("Profissional não encontrado.")
+
+    servico_id = None
+    if registro.get("servico_id"):
+        servico_id = int(registro["servico_id"]) if registro["servico_id"].isdigit() else None
+        if servico_id not in duracoes:
+            erros.append("Serviço não encontrado.")
+        elif profissional_id in profissional_ids and (profissional_id, servico_id) not in vinculos:
+            erros.append("Esse profissional não está vinculado ao serviço selecionado.")
+
+    try:
+        data_agendamento = ler_data(registro.get("data", ""))
+    except ValueError:
+        data_agendamento = None
+        erros.append("Data inválida (use AAAA-MM-DD ou DD/MM/AAAA).")
+
+    hora_inicio = hora_fim = None
+    try:
+        hora_inicio = ler_hora(registro.get("hora_inicio", ""))
+        if registro.get("hora_fim"):
+            hora_fim = ler_hora(registro["hora_fim"])
+        elif servico_id in duracoes:
+            base = datetime.combine(datetime.today(), hora_inicio)
+            hora_fim = (base + timedelta(minutes=duracoes[servico_id])).time()
+        else:
+            erros.append("Informe hora_fim ou um serviço para calcular o término.")
+    except ValueError:
+        erros.append("Horário inválido (use HH:MM).")
+
+    if hora_inicio and hora_fim and hora_fim <= hora_inicio:
+        erros.append("O horário final deve ser posterior ao inicial.")
+
+    status = registro.get("status") or "agendado"
+    if status not in STATUS_AGENDAMENTO:
+        erros.append(f"Status inválido: {status}.")
+
+    if erros:
+        return None, erros
+
+    return {
+        "cliente_nome": registro["cliente_nome"],
+        "cliente_telefone": registro["cliente_telefone"],
+        # insert em massa não passa pelo @validates do modelo.
+        "cliente_telefone_normalizado": normalizar_telefone(registro["cliente_telefone"]) or None,
+        "profissional_id": profissional_id,
+        "servico_id": servico_id,
+        "data": data_agendamento,
+        "hora_inicio": hora_inicio,
+        "hora_fim": hora_fim,
+        "status": status,
+        "lembrete_whatsapp_ativo": False
+    }, []
+
+
+def carregar_indice_existente(validos):
+    # Um único SELECT cobre todos os (profissional, dia) do arquivo; o índice
+    # em memória é chaveado por (profissional_id, data).
+    chaves = {(valores["profissional_id"], valores["data"]) for _, valores in validos}
+    if not chaves:
+        return {}
+
+    datas = [data for _, data in chaves]
+    linhas = (
+        Agendamento.query
+        .with_entities(Agendamento.profissional_id, Agendamento.data, Agendamento.hora_inicio, Agendamento.hora_fim)
+        .filter(
+            Agendamento.profissional_id.in_({profissional_id for profissional_id, _ in chaves}),
+            Agendamento.data >= min(datas),
+            Agendamento.data <= max(datas)
+        )
+        .all()
+    )
+
+    return montar_indice_intervalos(
+        ((profissional_id, data), hora_para_minutos(hora_inicio), hora_para_minutos(hora_fim))
+        for profissional_id, data, hora_inicio, hora_fim in linhas
+        if (profissional_id, data) in chaves
+    )
+
+
+def detectar_conflitos(validos):
+    # Uma varredura ordenada por (profissional, dia): cada linha é comparada
+    # com o que já existe no banco (bisect no índice) e com o maior término
+    # entre as linhas do arquivo já aceitas.
+    indice = carregar_indice_existente(validos)
+    grupos = {}
+    for numero, valores in validos:
+        grupos.setdefault((valores["profissional_id"], valores["data"]), []).append((numero, valores))
+
+    aceitos = []
+    conflitos = {}
+    for chave, linhas in grupos.items():
+        linhas.sort(key=lambda item: (item[1]["hora_inicio"], item[0]))
+        maior_fim = None
+        linha_maior_fim = None
+
+        for numero, valores in linhas:
+            inicio = hora_para_minutos(valores["hora_inicio"])
+            fim = hora_para_minutos(valores["hora_fim"])
+
+            if tem_conflito(indice, chave, inicio, fim):
+                conflitos[numero] = MENSAGEM_CONFLITO
+                continue
+
+            if maior_fim is not None and inicio < maior_fim:
+                conflitos[numero] = f"Conflito de horário com a linha {linha_maior_fim} do arquivo."
+                continue
+
+            if maior_fim is None or fim > maior_fim:
+                maior_fim = fim
+                linha_maior_fim = numero
+            aceitos.append((numero, valores))
+
+    aceitos.sort(key=lambda item: item[0])
+    return aceitos, conflitos
+
+
+def gravar_lote(lote):
+    db.session.execute(insert(Agendamento), lote)
+    registrar_alteracoes(db.session, [
+        {
+            "data": valores["data"],
+            "profissional_id": valores["profissional_id"],
+            "hora_inicio": valores["hora_inicio"].strftime("%H:%M"),
+            "acao": "criado",
+            "cliente_nome": valores["cliente_nome"],
+            "cliente_telefone": valores["cliente_telefone"],
+            "status": valores["status"]
+        }
+        for valores in lote
+    ])
+    db.session.commit()
+
+
+def importar_agendamentos(texto, tamanho_lote=1000, simular=False):
+    registros, faltando = ler_registros_csv(texto)
+    if faltando:
+        return {
+            "total": 0,
+            "importados": 0,
+            "validos": 0,
+            "erros": [{"linha": 1, "erros": [f"Coluna obrigatória ausente: {coluna}." for coluna in faltando]}]
+        }
+
+    referencias = obter_referencias()
+    profissional_ids = set(referencias.profissionais_por_id)
+    duracoes = {servico.id: servico.duracao for servico in referencias.servicos}
+    vinculos = referencias.vinculos
+
+    validos = []
+    erros = []
+    for numero, registro in registros:
+        valores, erros_linha = validar_registro(registro, profissional_ids, duracoes, vinculos)
+        if erros_linha:
+            erros.append({"linha": numero, "erros": erros_linha})
+        else:
+            validos.append((numero, valores))
+
+    aceitos, conflitos = detectar_conflitos(validos)
+    erros.extend({"linha": numero, "erros": [mensagem]} for numero, mensagem in conflitos.items())
+    erros.sort(key=lambda erro: erro["linha"])
+
+    importados = 0
+    if not simular:
+        agora = datetime.utcnow()
+        for inicio in range(0, len(aceitos), tamanho_lote):
+            lote = [(numero, dict(valores, criado_em=agora)) for numero, valores in aceitos[inicio:inicio + tamanho_lote]]
+            try:
+                gravar_lote([valores for _, valores in lote])
+                importados += len(lote)
+                continue
+            except IntegrityError as erro_banco:
+                db.session.rollback()
+                if not eh_conflito_horario(erro_banco):
+                    raise
+
+            # Outro agendamento entrou no intervalo depois da conferência; a
+            # restrição do banco barrou o lote inteiro. Refaz linha a linha
+            # para gravar as demais.
+            for numero, valores in lote:
+                try:
+                    gravar_lote([valores])
+                    importados += 1
+                except IntegrityError as erro_banco:
+                    db.session.rollback()
+                    if not eh_conflito_horario(erro_banco):
+                        raise
+                    erros.append({"linha": numero, "erros": [MENSAGEM_CONFLITO]})
+
+        erros.sort(key=lambda erro: erro["linha"])
+
+    return {
+        "total": len(registros),
+        "importados": importados,
+        "validos": len(aceitos),
+        "erros": erros
+    }
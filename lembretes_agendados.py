@@ -0,0 +1,158 @@
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from sqlalchemy import delete, event, inspect, select
+from database import db
+from models import Agendamento, LembreteAgendado
+from utils import ler_env
+
+# Campos do agendamento que mudam quando (ou se) os lembretes saem.
+CAMPOS_PROGRAMACAO = ("data", "hora_inicio", "lembrete_whatsapp_ativo", "status")
+
+
+def ler_antecedencias():
+    # "24h,2h" (padrão), "90m" ou minutos puros ("1440,120"). Vazio desliga
+    # os lembretes programados.
+    antecedencias = set()
+    for parte in ler_env("LEMBRETE_ANTECEDENCIAS", "24h,2h").split(","):
+        parte = parte.strip().lower()
+        multiplicador = 60 if parte.endswith("h") else 1
+        numero = parte.rstrip("hm")
+        if numero.isdigit() and int(numero) > 0:
+            antecedencias.add(int(numero) * multiplicador)
+    return sorted(antecedencias, reverse=True)
+
+
+def agora_na_agenda():
+    # data e hora_inicio são o horário local da agenda, sem fuso. Em servidor
+    # com relógio em UTC, AGENDA_FUSO_HORARIO diz que horário local é esse.
+    fuso = ler_env("AGENDA_FUSO_HORARIO", "")
+    if fuso:
+        return datetime.now(ZoneInfo(fuso)).replace(tzinfo=None)
+    return datetime.now()
+
+
+def calcular_envios(inicio, antecedencias, agora):
+    envios = []
+    for antecedencia in antecedencias:
+        enviar_em = inicio - timedelta(minutes=antecedencia)
+        # Antecedência que já passou não vira lembrete atrasado.
+        if enviar_em > agora:
+            envios.append((antecedencia, enviar_em))
+    return envios
+
+
+def reprogramar_lembretes(session, agendamento_ids):
+    # Refaz a programação dos agendamentos pela conexão (Core), então pode
+    # rodar dentro de um flush e na mesma transação da escrita.
+    agendamento_ids = sorted(set(agendamento_ids))
+    if not agendamento_ids:
+        return 0
+
+    conexao = session.connection()
+    tabela = LembreteAgendado.__table__
+    antecedencias = ler_antecedencias()
+
+    agendamentos = {}
+    if antecedencias:
+        agendamentos = {
+            agendamento.id: datetime.combine(agendamento.data, agendamento.hora_inicio)
+            for agendamento in conexao.execute(
+                select(Agendamento.id, Agendamento.data, Agendamento.hora_inicio)
+                .where(
+                    Agendamento.id.in_(agendamento_ids),
+                    Agendamento.lembrete_whatsapp_ativo == True,
+                    Agendamento.status.is_distinct_from("cancelado")
+                )
+            )
+        }
+
+    existentes = conexao.execute(
+        select(tabela.c.id, tabela.c.agendamento_id, tabela.c.antecedencia_min, tabela.c.enviar_em, tabela.c.status)
+        .where(tabela.c.agendamento_id.in_(agendamento_ids))
+    ).all()
+
+    # Lembrete que já saiu para o mesmo horário fica registrado e não sai de
+    # novo; se o agendamento mudou de horário, ele volta a ser programado.
+    mantidos = set()
+    removidos = []
+    for linha in existentes:
+        inicio = agendamentos.get(linha.agendamento_id)
+        mesmo_horario = inicio is not None and linha.enviar_em == inicio - timedelta(minutes=linha.antecedencia_min)
+        if linha.status == "agendado":
+            manter = mesmo_horario and linha.antecedencia_min in antecedencias
+        else:
+            manter = inicio is None or mesmo_horario
+        if manter:
+            mantidos.add((linha.agendamento_id, linha.antecedencia_min))
+        else:
+            removidos.append(linha.id)
+
+    if removidos:
+        conexao.execute(delete(tabela).where(tabela.c.id.in_(removidos)))
+
+    agora = agora_na_agenda()
+    linhas = [
+        {
+            "agendamento_id": agendamento_id,
+            "antecedencia_min": antecedencia,
+            "enviar_em": enviar_em,
+            "status": "agendado"
+        }
+        for agendamento_id, inicio in agendamentos.items()
+        for antecedencia, enviar_em in calcular_envios(inicio, antecedencias, agora)
+        if (agendamento_id, antecedencia) not in mantidos
+    ]
+    if linhas:
+        conexao.execute(tabela.insert(), linhas)
+    return len(linhas)
+
+
+@event.listens_for(db.session, "before_flush")
+def remover_lembretes_de_excluidos(session, _contexto, _instancias):
+    # Precisa ser antes do DELETE do agendamento por causa da chave estrangeira.
+    ids = [
+        objeto.id for objeto in session.deleted
+        if isinstance(objeto, Agendamento) and objeto.id is not None
+    ]
+    if ids:
+        session.connection().execute(
+            delete(LembreteAgendado.__table__).where(LembreteAgendado.agendamento_id.in_(ids))
+        )
+
+
+@event.listens_for(db.session, "after_flush")
+def reprogramar_lembretes_alterados(session, _contexto):
+    # Depois do flush os agendamentos novos já têm id; o histórico dos
+    # atributos ainda está disponível até o fim do flush.
+    ids = [
+        objeto.id for objeto in session.new
+        if isinstance(objeto, Agendamento) and objeto.lembrete_whatsapp_ativo
+    ]
+    for objeto in session.dirty:
+        if not isinstance(objeto, Agendamento):
+            continue
+        estado = inspect(objeto).attrs
+        if any(getattr(estado, campo).history.has_changes() for campo in CAMPOS_PROGRAMACAO):
+            ids.append(objeto.id)
+
+    reprogramar_lembretes(session, ids)
+
+
+def reprogramar_todos(tamanho_lote=1000):
+    # Para depois de mudar LEMBRETE_ANTECEDENCIAS ou de migrar um banco com
+    # agendamentos antigos: refaz a programação de tudo que ainda vai ocorrer.
+    hoje = agora_na_agenda().date()
+    ultimo_id = 0
+    total = 0
+    while True:
+        ids = db.session.execute(
+            select(Agendamento.id)
+            .where(Agendamento.data >= hoje, Agendamento.id > ultimo_id)
+            .order_by(Agendamento.id.asc())
+            .limit(tamanho_lote)
+        ).scalars().all()
+        if not ids:
+            return total
+        total += reprogramar_lembretes(db.session, ids)
+        db.session.commit()
+        ultimo_id = ids[-1]
@@ -0,0 +1,118 @@
+import time
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from utils import ler_env
+
+
+class BaldeTokens:
+    # Token bucket com ajuste AIMD: cai pela metade quando o provedor
+    # responde 429/503 e volta a subir aos poucos com respostas saudáveis.
+    def __init__(self, taxa_max, taxa_min=0.5, rajada=None):
+        self.taxa_max = float(taxa_max)
+        self.taxa_min = min(float(taxa_min), self.taxa_max)
+        self.taxa = self.taxa_max
+        self.capacidade = float(rajada or max(1.0, self.taxa_max))
+        self.tokens = self.capacidade
+        self.atualizado_em = time.monotonic()
+        self.bloqueado_ate = 0.0
+        self._trava = threading.Lock()
+
+    def _reabastecer(self, agora):
+        decorrido = agora - self.atualizado_em
+        if decorrido > 0:
+            self.tokens = min(self.capacidade, self.tokens + decorrido * self.taxa)
+            self.atualizado_em = agora
+
+    def aguardar(self):
+        while True:
+            with self._trava:
+                agora = time.monotonic()
+                if agora < self.bloqueado_ate:
+                    espera = self.bloqueado_ate - agora
+                else:
+                    self._reabastecer(agora)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    espera = (1 - self.tokens) / self.taxa
+            time.sleep(espera)
+
+    def registrar_limitacao(self, retry_after=None, pausa_maxima=None):
+        # A pausa vale para todas as threads do remetente, então fica limitada
+        # a pausa_maxima: um Retry-After maior volta para a fila como nova
+        # tentativa, em vez de segurar os envios além do prazo da reserva.
+        with self._trava:
+            agora = time.monotonic()
+            self.taxa = max(self.taxa_min, self.taxa / 2)
+            self.tokens = 0.0
+            self.atualizado_em = agora
+            pausa = retry_after if retry_after is not None else 1.0 / self.taxa
+            if pausa_maxima is not None:
+                pausa = min(pausa, pausa_maxima)
+            self.bloqueado_ate = max(self.bloqueado_ate, agora + pausa)
+
+    def registrar_sucesso(self):
+        with self._trava:
+            if self.taxa < self.taxa_max:
+                self.taxa = min(self.taxa_max, self.taxa + max(self.taxa_max * 0.05, 0.1))
+
+
+_limitadores = {}
+_trava_limitadores = threading.Lock()
+
+
+def ler_limites_por_remetente():
+    # WHATSAPP_LIMITES_POR_REMETENTE="whatsapp:+5511999990000=20,123456789=80"
+    limites = {}
+    for parte in ler_env("WHATSAPP_LIMITES_POR_REMETENTE").split(","):
+        if "=" not in parte:
+            continue
+        remetente, taxa = parte.rsplit("=", 1)
+        try:
+            limites[remetente.strip()] = float(taxa)
+        except ValueError:
+            continue
+    return limites
+
+
+def obter_limitador(provider, remetente):
+    chave = (provider, remetente)
+    limitador = _limitadores.get(chave)
+    if limitador is not None:
+        return limitador
+
+    with _trava_limitadores:
+        limitador = _limitadores.get(chave)
+        if limitador is None:
+            taxa_max = ler_limites_por_remetente().get(
+                remetente,
+                float(ler_env("WHATSAPP_LIMITE_POR_SEGUNDO", "10") or 10)
+            )
+            limitador = BaldeTokens(
+                taxa_max,
+                taxa_min=float(ler_env("WHATSAPP_LIMITE_MINIMO_POR_SEGUNDO", "0.5") or 0.5)
+            )
+            _limitadores[chave] = limitador
+
+    return limitador
+
+
+def interpretar_retry_after(valor):
+    if not valor:
+        return None
+
+    valor = valor.strip()
+    try:
+        return max(0.0, float(valor))
+    except ValueError:
+        pass
+
+    try:
+        momento = parsedate_to_datetime(valor)
+    except (TypeError, ValueError):
+        return None
+
+    if momento.tzinfo is None:
+        momento = momento.replace(tzinfo=timezone.utc)
+    return max(0.0, (momento - datetime.now(timezone.utc)).total_seconds())
@@ -0,0 +1,383 @@
+import os
+import json
+import time
+import fcntl
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from flask import g, has_request_context, request
+from sqlalchemy import event, func, select
+from database import db
+from models import EventoWebhook, LembreteAgendado, MensagemSaida
+from lembretes_agendados import agora_na_agenda
+from utils import ler_env
+
+# Métricas no formato texto do Prometheus, sem dependência externa. Cada
+# processo acumula contadores e histogramas em memória (um dict e um lock)
+# e grava um retrato em METRICAS_DIR/<pid>.json a cada METRICAS_INTERVALO
+# segundos; o /metrics soma os retratos dos workers vivos e o acumulado
+# dos que já saíram (mortos.json), então os contadores nunca diminuem.
+
+BALDES_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BALDES_CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+BALDES_ATRASO = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+
+METRICAS = {
+    "agenda_http_requisicoes_total": ("counter", "Requisições HTTP atendidas.", None),
+    "agenda_http_requisicao_segundos": ("histogram", "Tempo de resposta por rota.", BALDES_LATENCIA),
+    "agenda_sql_consultas_total": ("counter", "Comandos SQL executados.", None),
+    "agenda_sql_segundos_total": ("counter", "Tempo gasto em comandos SQL.", None),
+    "agenda_sql_consultas_por_requisicao": ("histogram", "Comandos SQL por requisição.", BALDES_CONSULTAS),
+    "agenda_sql_segundos_por_requisicao": ("histogram", "Tempo em SQL por requisição.", BALDES_LATENCIA),
+    "agenda_whatsapp_envio_segundos": ("histogram", "Latência de cada chamada ao provedor.", BALDES_LATENCIA),
+    "agenda_whatsapp_envios_total": ("counter", "Chamadas ao provedor por resultado (sucesso, falha, limitado).", None),
+    "agenda_webhook_atraso_segundos": ("histogram", "Tempo entre receber e aplicar uma resposta do WhatsApp.", BALDES_ATRASO),
+}
+
+_trava = threading.Lock()
+_estado = {"pid": None, "contadores": {}, "histogramas": {}, "gravado": False}
+_trava_gravacao = threading.Lock()
+ARQUIVO_MORTOS = "mortos.json"
+
+
+def metricas_ativas():
+    return ler_env("METRICAS_ATIVAS", "1") == "1"
+
+
+def diretorio_metricas():
+    return ler_env("METRICAS_DIR", "") or os.path.join(tempfile.gettempdir(), "agenda_metricas")
+
+
+def _estado_do_processo():
+    # Depois de um fork o filho começa zerado e com a própria thread de
+    # gravação; senão somaria os números do pai duas vezes.
+    if _estado["pid"] != os.getpid():
+        _estado.update(pid=os.getpid(), contadores={}, histogramas={}, gravado=False)
+        _iniciar_gravacao_periodica()
+    return _estado
+
+
+def _chave(nome, rotulos):
+    return nome, tuple(sorted((chave, str(valor)) for chave, valor in rotulos.items()))
+
+
+def incrementar(nome, valor=1.0, **rotulos):
+    chave = _chave(nome, rotulos)
+    with _trava:
+        contadores = _estado_do_processo()["contadores"]
+        contadores[chave] = contadores.get(chave, 0.0) + valor
+
+
+def observar(nome, valor, **rotulos):
+    baldes = METRICAS[nome][2]
+    chave = _chave(nome, rotulos)
+    with _trava:
+        histogramas = _estado_do_processo()["histogramas"]
+        serie = histogramas.get(chave)
+        if serie is None:
+            # Contagem por balde (não acumulada) + [+Inf], soma e total.
+            serie = histogramas[chave] = [0] * (len(baldes) + 1) + [0.0, 0]
+        for indice, limite in enumerate(baldes):
+            if valor <= limite:
+                break
+        else:
+            indice = len(baldes)
+        serie[indice] += 1
+        serie[-2] += valor
+        serie[-1] += 1
+
+
+# =========================
+# ARQUIVOS POR PROCESSO
+# =========================
+
+
+def gravar_retrato():
+    with _trava:
+        estado = _estado_do_processo()
+        retrato = _montar_retrato(estado["contadores"], estado["histogramas"])
+
+    diretorio = diretorio_metricas()
+    os.makedirs(diretorio, exist_ok=True)
+    with _trava_gravacao:
+        if not estado["gravado"]:
+            # Arquivo com o nosso PID antes da primeira gravação é de um
+            # processo antigo que teve o mesmo número: os números dele vão
+            # para os mortos em vez de serem sobrescritos.
+            aposentar_retrato(os.getpid())
+            estado["gravado"] = True
+        _gravar_json(os.path.join(diretorio, f"{os.getpid()}.json"), retrato)
+
+
+def _iniciar_gravacao_periodica():
+    intervalo = float(ler_env("METRICAS_INTERVALO", "5") or 5)
+
+    def gravar():
+        while True:
+            time.sleep(intervalo)
+            try:
+                gravar_retrato()
+            except OSError as erro_geral:
+                print(f"[METRICAS] Erro ao gravar métricas: {erro_geral}")
+
+    threading.Thread(target=gravar, daemon=True).start()
+
+
+def _montar_retrato(contadores, histogramas):
+    return {
+        "contadores": [[nome, rotulos, valor] for (nome, rotulos), valor in contadores.items()],
+        "histogramas": [[nome, rotulos, list(serie)] for (nome, rotulos), serie in histogramas.items()]
+    }
+
+
+def _acumular(contadores, histogramas, retrato):
+    for nome, rotulos, valor in retrato.get("contadores", []):
+        chave = (nome, tuple(tuple(par) for par in rotulos))
+        contadores[chave] = contadores.get(chave, 0.0) + valor
+    for nome, rotulos, serie in retrato.get("histogramas", []):
+        chave = (nome, tuple(tuple(par) for par in rotulos))
+        atual = histogramas.get(chave)
+        histogramas[chave] = list(serie) if atual is None else [a + b for a, b in zip(atual, serie)]
+
+
+def _ler_json(caminho):
+    try:
+        with open(caminho, encoding="utf-8") as arquivo:
+            return json.load(arquivo)
+    except (OSError, ValueError):
+        return None
+
+
+def _gravar_json(caminho, dados):
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    with open(temporario, "w", encoding="utf-8") as arquivo:
+        json.dump(dados, arquivo)
+    os.replace(temporario, caminho)
+
+
+@contextmanager
+def _trava_arquivos(diretorio):
+    # Entre processos (workers e o master do gunicorn): aposentar um retrato
+    # e somar os arquivos não podem se cruzar.
+    os.makedirs(diretorio, exist_ok=True)
+    with open(os.path.join(diretorio, "mortos.trava"), "a") as arquivo:
+        fcntl.flock(arquivo, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(arquivo, fcntl.LOCK_UN)
+
+
+def _aposentar(diretorio, pid):
+    # Com a trava dos arquivos: soma o retrato em mortos.json e só então
+    # apaga o arquivo do processo.
+    caminho = os.path.join(diretorio, f"{pid}.json")
+    retrato = _ler_json(caminho)
+    if retrato is None:
+        return
+    contadores, histogramas = {}, {}
+    _acumular(contadores, histogramas, _ler_json(os.path.join(diretorio, ARQUIVO_MORTOS)) or {})
+    _acumular(contadores, histogramas, retrato)
+    _gravar_json(os.path.join(diretorio, ARQUIVO_MORTOS), _montar_retrato(contadores, histogramas))
+    os.remove(caminho)
+
+
+def aposentar_retrato(pid):
+    # Chamado pelo gunicorn quando um worker sai (gunicorn.conf.py). Os
+    # contadores e histogramas do Prometheus não podem diminuir quando um
+    # worker é reciclado, então os números dele continuam na soma.
+    diretorio = diretorio_metricas()
+    with _trava_arquivos(diretorio):
+        _aposentar(diretorio, pid)
+
+
+def processo_vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def somar_retratos():
+    # Processos vivos mais mortos.json. O arquivo de um worker que morreu
+    # sem passar pelo child_exit (kill -9, outro servidor) é aposentado aqui,
+    # antes que o PID seja reaproveitado.
+    contadores = {}
+    histogramas = {}
+    diretorio = diretorio_metricas()
+    if not os.path.isdir(diretorio):
+        return contadores, histogramas
+
+    with _trava_arquivos(diretorio):
+        vivos = []
+        for nome_arquivo in sorted(os.listdir(diretorio)):
+            pid, extensao = os.path.splitext(nome_arquivo)
+            if extensao != ".json" or not pid.isdigit():
+                continue
+            if processo_vivo(int(pid)):
+                vivos.append(nome_arquivo)
+            else:
+                _aposentar(diretorio, pid)
+
+        for nome_arquivo in [ARQUIVO_MORTOS] + vivos:
+            retrato = _ler_json(os.path.join(diretorio, nome_arquivo))
+            if retrato is not None:
+                _acumular(contadores, histogramas, retrato)
+
+    return contadores, histogramas
+
+
+# =========================
+# FORMATO TEXTO
+# =========================
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _rotulos_texto(rotulos):
+    if not rotulos:
+        return ""
+    return "{" + ",".join(f'{chave}="{_escapar(valor)}"' for chave, valor in rotulos) + "}"
+
+
+def _numero(valor):
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return repr(valor) if isinstance(valor, float) else str(valor)
+
+
+def montar_texto(contadores, histogramas, indicadores):
+    linhas = []
+    for nome, (tipo, ajuda, baldes) in METRICAS.items():
+        linhas.append(f"# HELP {nome} {ajuda}")
+        linhas.append(f"# TYPE {nome} {tipo}")
+        if tipo == "counter":
+            for (nome_serie, rotulos), valor in sorted(contadores.items()):
+                if nome_serie == nome:
+                    linhas.append(f"{nome}{_rotulos_texto(rotulos)} {_numero(valor)}")
+            continue
+
+        for (nome_serie, rotulos), serie in sorted(histogramas.items()):
+            if nome_serie != nome:
+                continue
+            acumulado = 0
+            for limite, quantidade in zip(list(baldes) + ["+Inf"], serie[:len(baldes) + 1]):
+                acumulado += quantidade
+                le = limite if limite == "+Inf" else _numero(float(limite))
+                linhas.append(f"{nome}_bucket{_rotulos_texto(rotulos + (('le', le),))} {acumulado}")
+            linhas.append(f"{nome}_sum{_rotulos_texto(rotulos)} {_numero(serie[-2])}")
+            linhas.append(f"{nome}_count{_rotulos_texto(rotulos)} {serie[-1]}")
+
+    for nome, ajuda, series in indicadores:
+        linhas.append(f"# HELP {nome} {ajuda}")
+        linhas.append(f"# TYPE {nome} gauge")
+        for rotulos, valor in series:
+            linhas.append(f"{nome}{_rotulos_texto(tuple(sorted(rotulos.items())))} {_numero(valor)}")
+
+    return "\n".join(linhas) + "\n"
+
+
+def coletar_indicadores_da_fila():
+    # Medidos no banco na hora da coleta (valem para todos os processos):
+    # todas as consultas usam os índices por status.
+    agora_utc = datetime.utcnow()
+    agora_agenda = agora_na_agenda()
+
+    fila = dict(db.session.execute(
+        select(MensagemSaida.status, func.count(MensagemSaida.id))
+        .where(MensagemSaida.status.in_(("pendente", "enviando")))
+        .group_by(MensagemSaida.status)
+    ).all())
+
+    vencidos, mais_antigo_vencido = db.session.execute(
+        select(func.count(LembreteAgendado.id), func.min(LembreteAgendado.enviar_em))
+        .where(LembreteAgendado.status == "agendado", LembreteAgendado.enviar_em <= agora_agenda)
+    ).one()
+
+    webhooks_pendentes, webhook_mais_antigo = db.session.execute(
+        select(func.count(EventoWebhook.id), func.min(EventoWebhook.recebido_em))
+        .where(EventoWebhook.status == "pendente")
+    ).one()
+
+    return [
+        ("agenda_fila_whatsapp_mensagens", "Mensagens na fila de saída por status.", [
+            ({"status": status}, fila.get(status, 0)) for status in ("pendente", "enviando")
+        ]),
+        ("agenda_lembretes_vencidos", "Lembretes programados que já deviam ter entrado na fila.", [
+            ({}, vencidos or 0)
+        ]),
+        ("agenda_lembretes_atraso_segundos", "Atraso do lembrete vencido mais antigo.", [
+            ({}, round((agora_agenda - mais_antigo_vencido).total_seconds(), 3) if mais_antigo_vencido else 0)
+        ]),
+        ("agenda_webhook_eventos_pendentes", "Respostas do WhatsApp recebidas e ainda não aplicadas.", [
+            ({}, webhooks_pendentes or 0)
+        ]),
+        ("agenda_webhook_pendente_mais_antigo_segundos", "Idade da resposta pendente mais antiga.", [
+            ({}, round((agora_utc - webhook_mais_antigo).total_seconds(), 3) if webhook_mais_antigo else 0)
+        ]),
+    ]
+
+
+def gerar_texto_metricas():
+    gravar_retrato()
+    contadores, histogramas = somar_retratos()
+    return montar_texto(contadores, histogramas, coletar_indicadores_da_fila())
+
+
+# =========================
+# COLETA AUTOMÁTICA
+# =========================
+
+
+def rota_atual():
+    if not has_request_context():
+        return "segundo_plano"
+    regra = request.url_rule
+    return regra.rule if regra is not None else "nao_encontrada"
+
+
+def instalar_metricas(app, engine):
+    if not metricas_ativas():
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def marcar_inicio_sql(conexao, _cursor, _comando, _parametros, _contexto, _executemany):
+        conexao.info.setdefault("metricas_inicio", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def medir_sql(conexao, _cursor, _comando, _parametros, _contexto, _executemany):
+        inicios = conexao.info.get("metricas_inicio")
+        if not inicios:
+            return
+        duracao = time.perf_counter() - inicios.pop()
+        rota = rota_atual()
+        incrementar("agenda_sql_consultas_total", rota=rota)
+        incrementar("agenda_sql_segundos_total", duracao, rota=rota)
+        if has_request_context() and "metricas_sql" in g:
+            g.metricas_sql[0] += 1
+            g.metricas_sql[1] += duracao
+
+    @app.before_request
+    def iniciar_medicao():
+        g.metricas_inicio = time.perf_counter()
+        g.metricas_sql = [0, 0.0]
+
+    @app.after_request
+    def registrar_medicao(resposta):
+        inicio = g.pop("metricas_inicio", None)
+        if inicio is None:
+            return resposta
+        rota = rota_atual()
+        metodo = request.method
+        consultas, tempo_sql = g.get("metricas_sql", (0, 0.0))
+        observar("agenda_http_requisicao_segundos", time.perf_counter() - inicio, rota=rota, metodo=metodo)
+        incrementar("agenda_http_requisicoes_total", rota=rota, metodo=metodo, status=resposta.status_code)
+        observar("agenda_sql_consultas_por_requisicao", consultas, rota=rota)
+        observar("agenda_sql_segundos_por_requisicao", tempo_sql, rota=rota)
+        return resposta
@@ -0,0 +1,178 @@
+"""esquema inicial
+
+Adota bancos criados por db.create_all() + garantir_colunas_agendamento():
+cria só as tabelas, colunas e índices que ainda não existem e preenche
+cliente_telefone_normalizado nas linhas antigas.
+
+Revision ID: 0001_esquema_inicial
+Revises:
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from utils import normalizar_telefone
+
+
+# revision identifiers, used by Alembic.
+revision = '0001_esquema_inicial'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspetor = sa.inspect(op.get_bind())
+    tabelas = set(inspetor.get_table_names())
+
+    if 'profissional' not in tabelas:
+        op.create_table(
+            'profissional',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('nome', sa.String(length=100), nullable=False),
+            sa.Column('horario_inicio', sa.String(length=5), nullable=False),
+            sa.Column('horario_fim', sa.String(length=5), nullable=False),
+            sa.PrimaryKeyConstraint('id')
+        )
+
+    if 'servico' not in tabelas:
+        op.create_table(
+            'servico',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('nome', sa.String(length=100), nullable=False),
+            sa.Column('duracao', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('id')
+        )
+
+    if 'profissional_servico' not in tabelas:
+        op.create_table(
+            'profissional_servico',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('profissional_id', sa.Integer(), nullable=True),
+            sa.Column('servico_id', sa.Integer(), nullable=True),
+            sa.ForeignKeyConstraint(['profissional_id'], ['profissional.id']),
+            sa.ForeignKeyConstraint(['servico_id'], ['servico.id']),
+            sa.PrimaryKeyConstraint('id')
+        )
+
+    if 'cliente' not in tabelas:
+        op.create_table(
+            'cliente',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('nome', sa.String(length=100), nullable=True),
+            sa.Column('telefone', sa.String(length=20), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('telefone')
+        )
+
+    if 'agendamento' not in tabelas:
+        op.create_table(
+            'agendamento',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('cliente_nome', sa.String(length=100), nullable=False),
+            sa.Column('cliente_telefone', sa.String(length=20), nullable=False),
+            sa.Column('profissional_id', sa.Integer(), nullable=True),
+            sa.Column('servico_id', sa.Integer(), nullable=True),
+            sa.Column('data', sa.Date(), nullable=False),
+            sa.Column('hora_inicio', sa.Time(), nullable=False),
+            sa.Column('hora_fim', sa.Time(), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=True),
+            sa.Column('criado_em', sa.DateTime(), nullable=True),
+            sa.Column('lembrete_whatsapp_ativo', sa.Boolean(), server_default=sa.false(), nullable=False),
+            sa.Column('lembrete_whatsapp_enviado_em', sa.DateTime(), nullable=True),
+            sa.Column('cliente_telefone_normalizado', sa.String(length=20), nullable=True),
+            sa.ForeignKeyConstraint(['profissional_id'], ['profissional.id']),
+            sa.ForeignKeyConstraint(['servico_id'], ['servico.id']),
+            sa.PrimaryKeyConstraint('id')
+        )
+    else:
+        colunas = {coluna['name'] for coluna in inspetor.get_columns('agendamento')}
+        novas = [
+            sa.Column('cliente_nome', sa.String(length=100), server_default='', nullable=False),
+            sa.Column('cliente_telefone', sa.String(length=20), server_default='', nullable=False),
+            sa.Column('lembrete_whatsapp_ativo', sa.Boolean(), server_default=sa.false(), nullable=False),
+            sa.Column('lembrete_whatsapp_enviado_em', sa.DateTime(), nullable=True),
+            sa.Column('cliente_telefone_normalizado', sa.String(length=20), nullable=True),
+        ]
+        novas = [coluna for coluna in novas if coluna.name not in colunas]
+        if novas:
+            with op.batch_alter_table('agendamento') as batch_op:
+                for coluna in novas:
+                    batch_op.add_column(coluna)
+
+    indices = {indice['name'] for indice in sa.inspect(op.get_bind()).get_indexes('agendamento')}
+    if 'ix_agendamento_telefone_normalizado_data' not in indices:
+        op.create_index(
+            'ix_agendamento_telefone_normalizado_data',
+            'agendamento',
+            ['cliente_telefone_normalizado', 'data']
+        )
+
+    if 'mensagem_saida' not in tabelas:
+        op.create_table(
+            'mensagem_saida',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('agendamento_id', sa.Integer(), nullable=True),
+            sa.Column('lote_id', sa.String(length=32), nullable=True),
+            sa.Column('tipo', sa.String(length=20), nullable=False),
+            sa.Column('telefone', sa.String(length=20), nullable=False),
+            sa.Column('mensagem', sa.Text(), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=False),
+            sa.Column('tentativas', sa.Integer(), nullable=False),
+            sa.Column('proxima_tentativa_em', sa.DateTime(), nullable=False),
+            sa.Column('resposta_provider', sa.Text(), nullable=True),
+            sa.Column('provider_message_id', sa.String(length=100), nullable=True),
+            sa.Column('ultimo_erro', sa.Text(), nullable=True),
+            sa.Column('criado_em', sa.DateTime(), nullable=True),
+            sa.Column('enviado_em', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['agendamento_id'], ['agendamento.id']),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_mensagem_saida_agendamento_id', 'mensagem_saida', ['agendamento_id'])
+        op.create_index('ix_mensagem_saida_lote_id', 'mensagem_saida', ['lote_id'])
+        op.create_index('ix_mensagem_saida_provider_message_id', 'mensagem_saida', ['provider_message_id'])
+        op.create_index(
+            'ix_mensagem_saida_status_proxima_tentativa',
+            'mensagem_saida',
+            ['status', 'proxima_tentativa_em']
+        )
+
+    preencher_telefones_normalizados()
+
+
+def preencher_telefones_normalizados(tamanho_lote=1000):
+    conexao = op.get_bind()
+    ultimo_id = 0
+    while True:
+        linhas = conexao.execute(
+            sa.text(
+                "SELECT id, cliente_telefone FROM agendamento "
+                "WHERE cliente_telefone_normalizado IS NULL AND id > :ultimo_id "
+                "ORDER BY id LIMIT :limite"
+            ),
+            {"ultimo_id": ultimo_id, "limite": tamanho_lote}
+        ).fetchall()
+
+        if not linhas:
+            break
+
+        atualizacoes = [
+            {"id": agendamento_id, "telefone": normalizar_telefone(telefone)}
+            for agendamento_id, telefone in linhas
+        ]
+        atualizacoes = [item for item in atualizacoes if item["telefone"]]
+        if atualizacoes:
+            conexao.execute(
+                sa.text("UPDATE agendamento SET cliente_telefone_normalizado = :telefone WHERE id = :id"),
+                atualizacoes
+            )
+        ultimo_id = linhas[-1][0]
+
+
+def downgrade():
+    op.drop_table('mensagem_saida')
+    op.drop_table('agendamento')
+    op.drop_table('cliente')
+    op.drop_table('profissional_servico')
+    op.drop_table('servico')
+    op.drop_table('profissional')
@@ -0,0 +1,46 @@
+"""indices das consultas mais frequentes
+
+Revision ID: 0002_indices_consultas
+Revises: 0001_esquema_inicial
+Create Date: 2026-10-18 00:00:01
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002_indices_consultas'
+down_revision = '0001_esquema_inicial'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_agendamento_profissional_data_hora',
+        'agendamento',
+        ['profissional_id', 'data', 'hora_inicio']
+    )
+    op.create_index(
+        'ix_agendamento_lembrete',
+        'agendamento',
+        ['data', 'lembrete_whatsapp_ativo', 'lembrete_whatsapp_enviado_em']
+    )
+    op.create_index(
+        'ix_profissional_servico_profissional_servico',
+        'profissional_servico',
+        ['profissional_id', 'servico_id']
+    )
+    op.create_index(
+        'ix_profissional_servico_servico_profissional',
+        'profissional_servico',
+        ['servico_id', 'profissional_id']
+    )
+
+
+def downgrade():
+    op.drop_index('ix_profissional_servico_servico_profissional', table_name='profissional_servico')
+    op.drop_index('ix_profissional_servico_profissional_servico', table_name='profissional_servico')
+    op.drop_index('ix_agendamento_lembrete', table_name='agendamento')
+    op.drop_index('ix_agendamento_profissional_data_hora', table_name='agendamento')
@@ -0,0 +1,28 @@
+"""indice da listagem paginada de agendamentos
+
+Revision ID: 0003_indice_listagem
+Revises: 0002_indices_consultas
+Create Date: 2026-10-18 00:00:02
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003_indice_listagem'
+down_revision = '0002_indices_consultas'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_agendamento_data_hora_id',
+        'agendamento',
+        ['data', 'hora_inicio', 'id']
+    )
+
+
+def downgrade():
+    op.drop_index('ix_agendamento_data_hora_id', table_name='agendamento')
@@ -0,0 +1,30 @@
+"""versao compartilhada do cache de cadastros
+
+Revision ID: 0004_versao_cache
+Revises: 0003_indice_listagem
+Create Date: 2026-10-18 00:00:03
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004_versao_cache'
+down_revision = '0003_indice_listagem'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    versao_cache = op.create_table(
+        'versao_cache',
+        sa.Column('chave', sa.String(length=50), nullable=False),
+        sa.Column('versao', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('chave')
+    )
+    op.bulk_insert(versao_cache, [{'chave': 'referencia', 'versao': 1}])
+
+
+def downgrade():
+    op.drop_table('versao_cache')
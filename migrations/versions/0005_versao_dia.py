@@ -0,0 +1,29 @@
+"""versao por dia das grades de agenda
+
+Revision ID: 0005_versao_dia
+Revises: 0004_versao_cache
+Create Date: 2026-10-18 00:00:04
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005_versao_dia'
+down_revision = '0004_versao_cache'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'versao_dia',
+        sa.Column('data', sa.Date(), nullable=False),
+        sa.Column('versao', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('data')
+    )
+
+
+def downgrade():
+    op.drop_table('versao_dia')
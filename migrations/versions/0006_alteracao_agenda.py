@@ -0,0 +1,38 @@
+"""feed de alteracoes da agenda para eventos ao vivo
+
+Revision ID: 0006_alteracao_agenda
+Revises: 0005_versao_dia
+Create Date: 2026-10-18 00:00:05
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006_alteracao_agenda'
+down_revision = '0005_versao_dia'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'alteracao_agenda',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('data', sa.Date(), nullable=False),
+        sa.Column('profissional_id', sa.Integer(), nullable=True),
+        sa.Column('hora_inicio', sa.String(length=5), nullable=True),
+        sa.Column('acao', sa.String(length=20), nullable=False),
+        sa.Column('cliente_nome', sa.String(length=100), nullable=True),
+        sa.Column('cliente_telefone', sa.String(length=20), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.Column('criado_em', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_alteracao_agenda_data_id', 'alteracao_agenda', ['data', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_alteracao_agenda_data_id', table_name='alteracao_agenda')
+    op.drop_table('alteracao_agenda')
@@ -0,0 +1,38 @@
+"""caixa de entrada dos webhooks de WhatsApp
+
+Revision ID: 0007_evento_webhook
+Revises: 0006_alteracao_agenda
+Create Date: 2026-10-18 00:00:06
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007_evento_webhook'
+down_revision = '0006_alteracao_agenda'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'evento_webhook',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('provider', sa.String(length=20), nullable=False),
+        sa.Column('mensagem_id', sa.String(length=100), nullable=False),
+        sa.Column('remetente', sa.String(length=30), nullable=True),
+        sa.Column('texto', sa.Text(), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('recebido_em', sa.DateTime(), nullable=True),
+        sa.Column('processado_em', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('provider', 'mensagem_id', name='uq_evento_webhook_provider_mensagem')
+    )
+    op.create_index('ix_evento_webhook_status_id', 'evento_webhook', ['status', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_evento_webhook_status_id', table_name='evento_webhook')
+    op.drop_table('evento_webhook')
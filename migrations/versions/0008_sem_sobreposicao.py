@@ -0,0 +1,98 @@
+"""agendamentos do mesmo profissional nao se sobrepoem
+
+Revision ID: 0008_sem_sobreposicao
+Revises: 0007_evento_webhook
+Create Date: 2026-10-18 00:00:07
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008_sem_sobreposicao'
+down_revision = '0007_evento_webhook'
+branch_labels = None
+depends_on = None
+
+RESTRICAO = 'ex_agendamento_sem_sobreposicao'
+ERRO_SQLITE = 'conflito_horario_agendamento'
+
+# Intervalo [início, fim) no dia do agendamento; se o fim passar da
+# meia-noite, ele cai no dia seguinte.
+INTERVALO_POSTGRES = (
+    "tsrange(data + hora_inicio, "
+    "CASE WHEN hora_fim >= hora_inicio THEN data + hora_fim ELSE (data + 1) + hora_fim END)"
+)
+
+SOBREPOSICAO_SQLITE = """
+    SELECT RAISE(ABORT, '{erro}')
+    WHERE EXISTS (
+        SELECT 1 FROM agendamento
+        WHERE profissional_id = NEW.profissional_id
+          AND data = NEW.data
+          AND hora_inicio < NEW.hora_fim
+          AND hora_fim > NEW.hora_inicio
+          {filtro}
+    );
+"""
+
+
+def listar_sobreposicoes(bind, limite=20):
+    return bind.execute(sa.text(
+        "SELECT a.id, b.id FROM agendamento a "
+        "JOIN agendamento b ON b.profissional_id = a.profissional_id "
+        "AND b.data = a.data AND b.id > a.id "
+        "AND b.hora_inicio < a.hora_fim AND b.hora_fim > a.hora_inicio "
+        "ORDER BY a.id, b.id LIMIT :limite"
+    ), {"limite": limite}).all()
+
+
+def upgrade():
+    bind = op.get_bind()
+
+    if bind.dialect.name == 'postgresql':
+        # Restrições de exclusão não aceitam NOT VALID: sobreposições antigas
+        # precisam ser resolvidas antes, senão a criação falha no meio.
+        sobrepostos = listar_sobreposicoes(bind)
+        if sobrepostos:
+            pares = ", ".join(f"{a}/{b}" for a, b in sobrepostos)
+            raise RuntimeError(
+                "Existem agendamentos sobrepostos para o mesmo profissional "
+                f"(ids {pares}). Ajuste ou remova esses registros e rode a migração de novo."
+            )
+
+        op.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+        op.execute(
+            f"ALTER TABLE agendamento ADD CONSTRAINT {RESTRICAO} "
+            f"EXCLUDE USING gist (profissional_id WITH =, ({INTERVALO_POSTGRES}) WITH &&)"
+        )
+
+    elif bind.dialect.name == 'sqlite':
+        # O SQLite não tem restrição de exclusão. Os gatilhos rodam dentro do
+        # próprio INSERT/UPDATE, com o lock de escrita do banco já obtido, então
+        # a conferência e a gravação são atômicas. Registros antigos não são
+        # revalidados. Estes gatilhos só comparam o mesmo dia; a 0011 os
+        # refaz para agendamentos que passam da meia-noite.
+        op.execute(
+            "CREATE TRIGGER tg_agendamento_sem_sobreposicao_insert "
+            "BEFORE INSERT ON agendamento "
+            "WHEN NEW.profissional_id IS NOT NULL "
+            "BEGIN" + SOBREPOSICAO_SQLITE.format(erro=ERRO_SQLITE, filtro="") + "END"
+        )
+        op.execute(
+            "CREATE TRIGGER tg_agendamento_sem_sobreposicao_update "
+            "BEFORE UPDATE OF profissional_id, data, hora_inicio, hora_fim ON agendamento "
+            "WHEN NEW.profissional_id IS NOT NULL "
+            "BEGIN" + SOBREPOSICAO_SQLITE.format(erro=ERRO_SQLITE, filtro="AND id <> NEW.id") + "END"
+        )
+
+
+def downgrade():
+    bind = op.get_bind()
+
+    if bind.dialect.name == 'postgresql':
+        op.execute(f"ALTER TABLE agendamento DROP CONSTRAINT IF EXISTS {RESTRICAO}")
+    elif bind.dialect.name == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS tg_agendamento_sem_sobreposicao_update")
+        op.execute("DROP TRIGGER IF EXISTS tg_agendamento_sem_sobreposicao_insert")
@@ -0,0 +1,37 @@
+"""fila de lembretes por horario de envio
+
+Revision ID: 0009_lembrete_agendado
+Revises: 0008_sem_sobreposicao
+Create Date: 2026-10-18 00:00:08
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0009_lembrete_agendado'
+down_revision = '0008_sem_sobreposicao'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'lembrete_agendado',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('agendamento_id', sa.Integer(), nullable=False),
+        sa.Column('antecedencia_min', sa.Integer(), nullable=False),
+        sa.Column('enviar_em', sa.DateTime(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('enfileirado_em', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['agendamento_id'], ['agendamento.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('agendamento_id', 'antecedencia_min', name='uq_lembrete_agendado_agendamento_antecedencia')
+    )
+    op.create_index('ix_lembrete_agendado_status_enviar_em', 'lembrete_agendado', ['status', 'enviar_em'])
+
+
+def downgrade():
+    op.drop_index('ix_lembrete_agendado_status_enviar_em', table_name='lembrete_agendado')
+    op.drop_table('lembrete_agendado')
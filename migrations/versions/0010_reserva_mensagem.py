@@ -0,0 +1,47 @@
+"""reserva com prazo na fila de saida
+
+Revision ID: 0010_reserva_mensagem
+Revises: 0009_lembrete_agendado
+Create Date: 2026-10-18 00:00:09
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0010_reserva_mensagem'
+down_revision = '0009_lembrete_agendado'
+branch_labels = None
+depends_on = None
+
+LEMBRETE_ATIVO_NA_FILA = "tipo = 'lembrete' AND status IN ('pendente', 'enviando')"
+
+
+def upgrade():
+    op.add_column('mensagem_saida', sa.Column('reservado_por', sa.String(length=32), nullable=True))
+    op.add_column('mensagem_saida', sa.Column('reservado_ate', sa.DateTime(), nullable=True))
+
+    # Processamentos simultâneos antigos podem ter deixado o mesmo lembrete
+    # duas vezes na fila; fica só o primeiro, senão o índice único não entra.
+    op.execute(
+        "UPDATE mensagem_saida SET status = 'falhou', ultimo_erro = 'Lembrete duplicado na fila.' "
+        f"WHERE {LEMBRETE_ATIVO_NA_FILA} AND agendamento_id IS NOT NULL AND id NOT IN ("
+        f"SELECT MIN(id) FROM mensagem_saida WHERE {LEMBRETE_ATIVO_NA_FILA} "
+        "AND agendamento_id IS NOT NULL GROUP BY agendamento_id)"
+    )
+    op.create_index(
+        'uq_mensagem_saida_lembrete_ativo',
+        'mensagem_saida',
+        ['agendamento_id'],
+        unique=True,
+        sqlite_where=sa.text(LEMBRETE_ATIVO_NA_FILA),
+        postgresql_where=sa.text(LEMBRETE_ATIVO_NA_FILA)
+    )
+
+
+def downgrade():
+    op.drop_index('uq_mensagem_saida_lembrete_ativo', table_name='mensagem_saida')
+    with op.batch_alter_table('mensagem_saida') as batch_op:
+        batch_op.drop_column('reservado_ate')
+        batch_op.drop_column('reservado_por')
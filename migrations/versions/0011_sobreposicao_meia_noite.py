@@ -0,0 +1,97 @@
+"""sobreposicao no sqlite considera agendamentos que passam da meia-noite
+
+Revision ID: 0011_sobreposicao_meia_noite
+Revises: 0010_reserva_mensagem
+Create Date: 2026-10-18 00:00:10
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0011_sobreposicao_meia_noite'
+down_revision = '0010_reserva_mensagem'
+branch_labels = None
+depends_on = None
+
+ERRO_SQLITE = 'conflito_horario_agendamento'
+
+
+def segundos(hora):
+    # "HH:MM:SS[.ffffff]" (formato do SQLAlchemy no SQLite) em segundos.
+    return (
+        f"(CAST(substr({hora}, 1, 2) AS INTEGER) * 3600 + "
+        f"CAST(substr({hora}, 4, 2) AS INTEGER) * 60 + "
+        f"CAST(substr({hora}, 7, 2) AS INTEGER))"
+    )
+
+
+def intervalo(prefixo):
+    # Mesmo intervalo da restrição do Postgres (0008): [início, fim) em
+    # segundos absolutos; fim antes do início cai no dia seguinte.
+    dia = f"CAST(julianday({prefixo}data) + 0.5 AS INTEGER) * 86400"
+    inicio = f"({dia} + {segundos(prefixo + 'hora_inicio')})"
+    fim = (
+        f"({dia} + {segundos(prefixo + 'hora_fim')} + "
+        f"CASE WHEN {prefixo}hora_fim < {prefixo}hora_inicio THEN 86400 ELSE 0 END)"
+    )
+    return inicio, fim
+
+
+def sobreposicao(filtro):
+    inicio_novo, fim_novo = intervalo("NEW.")
+    inicio, fim = intervalo("")
+    # Intervalo vazio (fim igual ao início) não conflita, como no tsrange.
+    return f"""
+    SELECT RAISE(ABORT, '{ERRO_SQLITE}')
+    WHERE NEW.hora_fim <> NEW.hora_inicio AND EXISTS (
+        SELECT 1 FROM agendamento
+        WHERE profissional_id = NEW.profissional_id
+          AND data BETWEEN date(NEW.data, '-1 day') AND date(NEW.data, '+1 day')
+          AND hora_fim <> hora_inicio
+          AND {inicio} < {fim_novo}
+          AND {fim} > {inicio_novo}
+          {filtro}
+    );
+"""
+
+
+SOBREPOSICAO_MESMO_DIA = """
+    SELECT RAISE(ABORT, '{erro}')
+    WHERE EXISTS (
+        SELECT 1 FROM agendamento
+        WHERE profissional_id = NEW.profissional_id
+          AND data = NEW.data
+          AND hora_inicio < NEW.hora_fim
+          AND hora_fim > NEW.hora_inicio
+          {filtro}
+    );
+"""
+
+
+def recriar_gatilhos(corpo):
+    op.execute("DROP TRIGGER IF EXISTS tg_agendamento_sem_sobreposicao_update")
+    op.execute("DROP TRIGGER IF EXISTS tg_agendamento_sem_sobreposicao_insert")
+    op.execute(
+        "CREATE TRIGGER tg_agendamento_sem_sobreposicao_insert "
+        "BEFORE INSERT ON agendamento "
+        "WHEN NEW.profissional_id IS NOT NULL "
+        "BEGIN" + corpo("") + "END"
+    )
+    op.execute(
+        "CREATE TRIGGER tg_agendamento_sem_sobreposicao_update "
+        "BEFORE UPDATE OF profissional_id, data, hora_inicio, hora_fim ON agendamento "
+        "WHEN NEW.profissional_id IS NOT NULL "
+        "BEGIN" + corpo("AND id <> NEW.id") + "END"
+    )
+
+
+def upgrade():
+    # No Postgres a restrição de exclusão da 0008 já trata a virada do dia.
+    if op.get_bind().dialect.name == 'sqlite':
+        recriar_gatilhos(sobreposicao)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        recriar_gatilhos(lambda filtro: SOBREPOSICAO_MESMO_DIA.format(erro=ERRO_SQLITE, filtro=filtro))
@@ -1,5 +1,8 @@
 from database import db
 from datetime import datetime
+from sqlalchemy import text
+from sqlalchemy.orm import validates
+from utils import normalizar_telefone
 
 class Profissional(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -17,6 +20,62 @@ class ProfissionalServico(db.Model):
     profissional_id = db.Column(db.Integer, db.ForeignKey('profissional.id'))
     servico_id = db.Column(db.Integer, db.ForeignKey('servico.id'))
 
+    __table_args__ = (
+        db.Index('ix_profissional_servico_profissional_servico', 'profissional_id', 'servico_id'),
+        db.Index('ix_profissional_servico_servico_profissional', 'servico_id', 'profissional_id'),
+    )
+
+class VersaoCache(db.Model):
+    chave = db.Column(db.String(50), primary_key=True)
+    versao = db.Column(db.Integer, nullable=False, default=0)
+
+class VersaoDia(db.Model):
+    data = db.Column(db.Date, primary_key=True)
+    versao = db.Column(db.Integer, nullable=False, default=0)
+
+class AlteracaoAgenda(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    data = db.Column(db.Date, nullable=False)
+    profissional_id = db.Column(db.Integer)
+    hora_inicio = db.Column(db.String(5))
+    acao = db.Column(db.String(20), nullable=False)
+    cliente_nome = db.Column(db.String(100))
+    cliente_telefone = db.Column(db.String(20))
+    status = db.Column(db.String(20))
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_alteracao_agenda_data_id', 'data', 'id'),
+    )
+
+class EventoWebhook(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    provider = db.Column(db.String(20), nullable=False)
+    mensagem_id = db.Column(db.String(100), nullable=False)
+    remetente = db.Column(db.String(30))
+    texto = db.Column(db.Text)
+    status = db.Column(db.String(20), nullable=False, default='pendente')
+    recebido_em = db.Column(db.DateTime, default=datetime.utcnow)
+    processado_em = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.UniqueConstraint('provider', 'mensagem_id', name='uq_evento_webhook_provider_mensagem'),
+        db.Index('ix_evento_webhook_status_id', 'status', 'id'),
+    )
+
+class LembreteAgendado(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    agendamento_id = db.Column(db.Integer, db.ForeignKey('agendamento.id'), nullable=False)
+    antecedencia_min = db.Column(db.Integer, nullable=False)
+    enviar_em = db.Column(db.DateTime, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='agendado')
+    enfileirado_em = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.UniqueConstraint('agendamento_id', 'antecedencia_min', name='uq_lembrete_agendado_agendamento_antecedencia'),
+        db.Index('ix_lembrete_agendado_status_enviar_em', 'status', 'enviar_em'),
+    )
+
 class Cliente(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     nome = db.Column(db.String(100))
@@ -32,4 +91,54 @@ class Agendamento(db.Model):
     hora_inicio = db.Column(db.Time, nullable=False)
     hora_fim = db.Column(db.Time, nullable=False)
     status = db.Column(db.String(20), default='agendado')
-    criado_em = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow)
+    lembrete_whatsapp_ativo = db.Column(db.Boolean, nullable=False, default=False)
+    lembrete_whatsapp_enviado_em = db.Column(db.DateTime)
+    cliente_telefone_normalizado = db.Column(db.String(20))
+
+    # A proibição de sobreposição por profissional depende do dialeto
+    # (restrição de exclusão no Postgres, gatilhos no SQLite) e fica só na
+    # migração 0008_sem_sobreposicao.
+    __table_args__ = (
+        db.Index('ix_agendamento_profissional_data_hora', 'profissional_id', 'data', 'hora_inicio'),
+        db.Index('ix_agendamento_data_hora_id', 'data', 'hora_inicio', 'id'),
+        db.Index('ix_agendamento_lembrete', 'data', 'lembrete_whatsapp_ativo', 'lembrete_whatsapp_enviado_em'),
+        db.Index('ix_agendamento_telefone_normalizado_data', 'cliente_telefone_normalizado', 'data'),
+    )
+
+    @validates('cliente_telefone')
+    def _normalizar_cliente_telefone(self, chave, valor):
+        self.cliente_telefone_normalizado = normalizar_telefone(valor) or None
+        return valor
+
+# No máximo um lembrete ativo na fila por agendamento (índice parcial).
+LEMBRETE_ATIVO_NA_FILA = "tipo = 'lembrete' AND status IN ('pendente', 'enviando')"
+
+class MensagemSaida(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    agendamento_id = db.Column(db.Integer, db.ForeignKey('agendamento.id'), index=True)
+    lote_id = db.Column(db.String(32), index=True)
+    tipo = db.Column(db.String(20), nullable=False, default='lembrete')
+    telefone = db.Column(db.String(20), nullable=False)
+    mensagem = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pendente')
+    tentativas = db.Column(db.Integer, nullable=False, default=0)
+    proxima_tentativa_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    resposta_provider = db.Column(db.Text)
+    provider_message_id = db.Column(db.String(100), index=True)
+    ultimo_erro = db.Column(db.Text)
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow)
+    enviado_em = db.Column(db.DateTime)
+    reservado_por = db.Column(db.String(32))
+    reservado_ate = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_mensagem_saida_status_proxima_tentativa', 'status', 'proxima_tentativa_em'),
+        db.Index(
+            'uq_mensagem_saida_lembrete_ativo',
+            'agendamento_id',
+            unique=True,
+            sqlite_where=text(LEMBRETE_ATIVO_NA_FILA),
+            postgresql_where=text(LEMBRETE_ATIVO_NA_FILA)
+        ),
+    )
@@ -0,0 +1,178 @@
+import os
+import sys
+import time
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from flask import g, request
+from sqlalchemy import event
+from utils import ler_env
+
+# Perfil de consultas para desenvolvimento e testes: conta e cronometra cada
+# comando SQL da requisição e aponta comandos idênticos repetidos (N+1) com a
+# linha do código que os disparou. Com PERFIL_CONSULTAS=1 cada resposta ganha
+# os cabeçalhos X-Consultas-SQL* e uma linha de log; orcamento_de_consultas()
+# faz o mesmo dentro de um bloco e falha se passar do orçamento.
+
+RAIZ_PROJETO = os.path.dirname(os.path.abspath(__file__))
+ARQUIVOS_IGNORADOS = {os.path.abspath(__file__), os.path.join(RAIZ_PROJETO, "metricas.py")}
+
+_local = threading.local()
+
+
+def perfil_ativo():
+    return ler_env("PERFIL_CONSULTAS", "0") == "1"
+
+
+def repeticao_suspeita():
+    return int(ler_env("PERFIL_CONSULTAS_REPETICAO", "3") or 3)
+
+
+class ColetorConsultas:
+    def __init__(self):
+        self.consultas = []
+
+    def registrar(self, comando, duracao, origem):
+        self.consultas.append((comando, duracao, origem))
+
+    @property
+    def total(self):
+        return len(self.consultas)
+
+    @property
+    def tempo_total(self):
+        return sum(duracao for _, duracao, _ in self.consultas)
+
+    def repetidas(self, minimo=None):
+        # Mesmo texto SQL (os parâmetros ficam fora dele) executado várias
+        # vezes na mesma requisição: quase sempre uma consulta dentro de laço.
+        minimo = minimo or repeticao_suspeita()
+        contagem = Counter(comando for comando, _, _ in self.consultas)
+        repetidas = []
+        for comando, quantidade in contagem.most_common():
+            if quantidade < minimo:
+                break
+            origens = Counter(origem for texto, _, origem in self.consultas if texto == comando)
+            repetidas.append((comando, quantidade, origens))
+        return repetidas
+
+    def relatorio(self, minimo=None):
+        linhas = [f"{self.total} consultas SQL, {self.tempo_total * 1000:.2f} ms"]
+        for comando, quantidade, origens in self.repetidas(minimo):
+            locais = ", ".join(f"{origem} ({vezes}x)" for origem, vezes in origens.most_common(3))
+            linhas.append(f"  repetida {quantidade}x em {locais}: {resumir_comando(comando)}")
+        return "\n".join(linhas)
+
+
+def resumir_comando(comando, limite=160):
+    comando = " ".join(comando.split())
+    return comando if len(comando) <= limite else f"{comando[:limite]}..."
+
+
+def _coletores():
+    coletores = getattr(_local, "coletores", None)
+    if coletores is None:
+        coletores = _local.coletores = []
+    return coletores
+
+
+def linha_de_origem():
+    # Primeiro quadro da pilha que é código do projeto (fora deste módulo,
+    # das métricas e das bibliotecas instaladas).
+    quadro = sys._getframe(2)
+    while quadro is not None:
+        arquivo = quadro.f_code.co_filename
+        # Funções geradas pelo SQLAlchemy aparecem como "<...>".
+        arquivo = "" if arquivo.startswith("<") else os.path.abspath(arquivo)
+        if (
+            arquivo.startswith(RAIZ_PROJETO)
+            and arquivo not in ARQUIVOS_IGNORADOS
+            and "site-packages" not in arquivo
+        ):
+            return f"{os.path.relpath(arquivo, RAIZ_PROJETO)}:{quadro.f_lineno} ({quadro.f_code.co_name})"
+        quadro = quadro.f_back
+    return "desconhecida"
+
+
+@contextmanager
+def coletar_consultas():
+    """Registra os comandos SQL executados na thread durante o bloco."""
+    coletor = ColetorConsultas()
+    coletores = _coletores()
+    coletores.append(coletor)
+    try:
+        yield coletor
+    finally:
+        coletores.remove(coletor)
+
+
+@contextmanager
+def orcamento_de_consultas(maximo, repeticao_maxima=None):
+    """Falha (AssertionError) se o bloco passar de `maximo` comandos SQL ou
+    repetir o mesmo comando mais de `repeticao_maxima` vezes.
+
+        with orcamento_de_consultas(6, repeticao_maxima=1):
+            cliente.get("/agenda/manual?data=2026-10-20")
+    """
+    with coletar_consultas() as coletor:
+        yield coletor
+
+    minimo_repeticao = repeticao_maxima + 1 if repeticao_maxima is not None else None
+    problemas = []
+    if coletor.total > maximo:
+        problemas.append(f"orçamento de {maximo} consultas estourado")
+    if minimo_repeticao and coletor.repetidas(minimo_repeticao):
+        problemas.append(f"comando repetido mais de {repeticao_maxima}x")
+    if problemas:
+        raise AssertionError(f"{'; '.join(problemas)}\n{coletor.relatorio(minimo_repeticao)}")
+
+
+def instalar_perfil_consultas(app, engine):
+    # Os ouvintes do engine ficam sempre instalados (para o orçamento em
+    # testes), mas só trabalham se houver um coletor ativo na thread.
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def marcar_inicio(conexao, _cursor, _comando, _parametros, _contexto, _executemany):
+        if _coletores():
+            conexao.info.setdefault("perfil_inicio", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def registrar_consulta(conexao, _cursor, comando, _parametros, _contexto, _executemany):
+        coletores = _coletores()
+        inicios = conexao.info.get("perfil_inicio")
+        if not coletores or not inicios:
+            return
+        duracao = time.perf_counter() - inicios.pop()
+        origem = linha_de_origem()
+        for coletor in coletores:
+            coletor.registrar(comando, duracao, origem)
+
+    if not perfil_ativo():
+        return
+
+    @app.before_request
+    def iniciar_perfil():
+        g.perfil_consultas = ColetorConsultas()
+        _coletores().append(g.perfil_consultas)
+
+    @app.after_request
+    def anexar_perfil(resposta):
+        coletor = g.pop("perfil_consultas", None)
+        if coletor is None:
+            return resposta
+        if coletor in _coletores():
+            _coletores().remove(coletor)
+
+        repetidas = coletor.repetidas()
+        resposta.headers["X-Consultas-SQL"] = str(coletor.total)
+        resposta.headers["X-Consultas-SQL-Tempo-Ms"] = f"{coletor.tempo_total * 1000:.2f}"
+        resposta.headers["X-Consultas-SQL-Repetidas"] = str(len(repetidas))
+        print(f"[PERFIL SQL] {request.method} {request.path}: {coletor.relatorio()}")
+        return resposta
+
+    @app.teardown_request
+    def descartar_perfil(_erro):
+        # Requisição que terminou em exceção não passa pelo after_request.
+        coletor = g.pop("perfil_consultas", None)
+        if coletor is not None and coletor in _coletores():
+            _coletores().remove(coletor)
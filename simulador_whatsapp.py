@@ -0,0 +1,261 @@
+import re
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlencode
+from urllib import request as urllib_request
+
+# Simulador local dos provedores de WhatsApp para testes e benchmarks:
+#   Twilio:  POST /2010-04-01/Accounts/<sid>/Messages.json  (form)
+#   Meta:    POST /<versao>/<phone_number_id>/messages      (JSON)
+#   Genérico: qualquer outro POST                           (JSON)
+# Estatísticas em GET /_estatisticas.
+
+ROTA_TWILIO = re.compile(r"^/2010-04-01/Accounts/[^/]+/Messages\.json$")
+ROTA_META = re.compile(r"^/v[\d.]+/[^/]+/messages$")
+
+
+class EstadoSimulador:
+    def __init__(self, latencia_ms=0, variacao_ms=0, taxa_erro=0.0, limite_por_segundo=0,
+                 rajada_429_a_cada=0, rajada_429_tamanho=0, retry_after=1,
+                 webhook_url="", webhook_modo="meta", taxa_resposta=0.0, atraso_webhook_ms=200, semente=None):
+        self.latencia_ms = latencia_ms
+        self.variacao_ms = variacao_ms
+        self.taxa_erro = taxa_erro
+        self.limite_por_segundo = limite_por_segundo
+        self.rajada_429_a_cada = rajada_429_a_cada
+        self.rajada_429_tamanho = rajada_429_tamanho
+        self.retry_after = retry_after
+        self.webhook_url = webhook_url
+        self.webhook_modo = webhook_modo
+        self.taxa_resposta = taxa_resposta
+        self.atraso_webhook_ms = atraso_webhook_ms
+
+        self.aleatorio = random.Random(semente)
+        self.trava = threading.Lock()
+        self.recentes = deque()
+        self.rajada_restante = 0
+        self.estatisticas = {
+            "requisicoes": 0,
+            "aceitas": 0,
+            "erros": 0,
+            "limitadas_429": 0,
+            "webhooks_enviados": 0,
+            "webhooks_falharam": 0
+        }
+
+    def decidir(self):
+        # Retorna (status, retry_after) para a próxima requisição.
+        with self.trava:
+            self.estatisticas["requisicoes"] += 1
+            numero = self.estatisticas["requisicoes"]
+            agora = time.monotonic()
+
+            if self.rajada_429_a_cada and numero % self.rajada_429_a_cada == 0:
+                self.rajada_restante = self.rajada_429_tamanho
+
+            if self.rajada_restante > 0:
+                self.rajada_restante -= 1
+                self.estatisticas["limitadas_429"] += 1
+                return 429, self.retry_after
+
+            if self.limite_por_segundo:
+                while self.recentes and agora - self.recentes[0] >= 1.0:
+                    self.recentes.popleft()
+                if len(self.recentes) >= self.limite_por_segundo:
+                    self.estatisticas["limitadas_429"] += 1
+                    return 429, self.retry_after
+                self.recentes.append(agora)
+
+            if self.taxa_erro and self.aleatorio.random() < self.taxa_erro:
+                self.estatisticas["erros"] += 1
+                return 500, None
+
+            self.estatisticas["aceitas"] += 1
+            return 200, None
+
+    def latencia(self):
+        with self.trava:
+            variacao = self.aleatorio.uniform(-self.variacao_ms, self.variacao_ms) if self.variacao_ms else 0
+        return max(0.0, (self.latencia_ms + variacao) / 1000.0)
+
+    def agendar_webhook(self, telefone):
+        if not self.webhook_url:
+            return
+
+        with self.trava:
+            if self.aleatorio.random() >= self.taxa_resposta:
+                return
+            resposta = self.aleatorio.choice(["1", "2"])
+
+        threading.Timer(self.atraso_webhook_ms / 1000.0, self.enviar_webhook, args=(telefone, resposta)).start()
+
+    def enviar_webhook(self, telefone, resposta):
+        digitos = re.sub(r"\D", "", telefone or "")
+        if self.webhook_modo == "twilio":
+            corpo = urlencode({
+                "From": f"whatsapp:+{digitos}",
+                "Body": resposta,
+                "MessageSid": f"SM{uuid.uuid4().hex}"
+            }).encode("utf-8")
+            tipo = "application/x-www-form-urlencoded"
+        else:
+            corpo = json.dumps({
+                "object": "whatsapp_business_account",
+                "entry": [{
+                    "id": "simulador",
+                    "changes": [{
+                        "field": "messages",
+                        "value": {
+                            "messaging_product": "whatsapp",
+                            "messages": [{
+                                "from": digitos,
+                                "id": f"wamid.{uuid.uuid4().hex}",
+                                "timestamp": str(int(time.time())),
+                                "type": "text",
+                                "text": {"body": resposta}
+                            }]
+                        }
+                    }]
+                }]
+            }).encode("utf-8")
+            tipo = "application/json"
+
+        req = urllib_request.Request(self.webhook_url, data=corpo, headers={"Content-Type": tipo}, method="POST")
+        try:
+            with urllib_request.urlopen(req, timeout=10):
+                pass
+            chave = "webhooks_enviados"
+        except Exception:
+            chave = "webhooks_falharam"
+
+        with self.trava:
+            self.estatisticas[chave] += 1
+
+
+class ManipuladorSimulador(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, formato, *args):
+        pass
+
+    def responder(self, status, corpo, cabecalhos=None):
+        dados = json.dumps(corpo).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(dados)))
+        for nome, valor in (cabecalhos or {}).items():
+            self.send_header(nome, valor)
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def do_GET(self):
+        if self.path == "/_estatisticas":
+            with self.server.estado.trava:
+                self.responder(200, dict(self.server.estado.estatisticas))
+            return
+        self.responder(404, {"erro": "rota desconhecida"})
+
+    def do_POST(self):
+        estado = self.server.estado
+        tamanho = int(self.headers.get("Content-Length") or 0)
+        bruto = self.rfile.read(tamanho).decode("utf-8", errors="replace")
+
+        time.sleep(estado.latencia())
+        status, retry_after = estado.decidir()
+
+        if status == 429:
+            self.responder(429, {"erro": "limite de envio excedido"}, {"Retry-After": str(retry_after)})
+            return
+        if status >= 500:
+            self.responder(status, {"erro": "falha simulada"})
+            return
+
+        caminho = self.path.split("?", 1)[0]
+        if ROTA_TWILIO.match(caminho):
+            dados = {chave: valores[0] for chave, valores in parse_qs(bruto).items()}
+            telefone = dados.get("To", "").split(":", 1)[-1]
+            self.responder(201, {"sid": f"SM{uuid.uuid4().hex}", "status": "queued", "to": dados.get("To")})
+        elif ROTA_META.match(caminho):
+            dados = json.loads(bruto or "{}")
+            telefone = dados.get("to", "")
+            self.responder(200, {
+                "messaging_product": "whatsapp",
+                "contacts": [{"input": telefone, "wa_id": telefone}],
+                "messages": [{"id": f"wamid.{uuid.uuid4().hex}"}]
+            })
+        else:
+            dados = json.loads(bruto or "{}")
+            telefone = dados.get("phone", "")
+            self.responder(200, {"id": uuid.uuid4().hex})
+
+        estado.agendar_webhook(telefone)
+
+
+def criar_servidor(host="127.0.0.1", porta=0, **opcoes):
+    servidor = ThreadingHTTPServer((host, porta), ManipuladorSimulador)
+    servidor.daemon_threads = True
+    servidor.estado = EstadoSimulador(**opcoes)
+    return servidor
+
+
+def iniciar_em_segundo_plano(host="127.0.0.1", porta=0, **opcoes):
+    servidor = criar_servidor(host, porta, **opcoes)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+def adicionar_argumentos(parser):
+    parser.add_argument("--latencia-ms", type=float, default=50, help="Latência média por requisição.")
+    parser.add_argument("--variacao-ms", type=float, default=0, help="Variação (+/-) da latência.")
+    parser.add_argument("--taxa-erro", type=float, default=0.0, help="Fração de respostas HTTP 500.")
+    parser.add_argument("--limite-por-segundo", type=int, default=0, help="Responde 429 acima desta taxa.")
+    parser.add_argument("--rajada-429-a-cada", type=int, default=0, help="Inicia uma rajada de 429 a cada N requisições.")
+    parser.add_argument("--rajada-429-tamanho", type=int, default=0, help="Quantidade de 429 em cada rajada.")
+    parser.add_argument("--retry-after", type=float, default=1, help="Valor do cabeçalho Retry-After.")
+    parser.add_argument("--webhook-url", default="", help="URL de /webhooks/whatsapp para simular respostas.")
+    parser.add_argument("--webhook-modo", choices=["meta", "twilio"], default="meta")
+    parser.add_argument("--taxa-resposta", type=float, default=0.0, help="Fração de mensagens que recebem resposta.")
+    parser.add_argument("--atraso-webhook-ms", type=float, default=200)
+    parser.add_argument("--semente", type=int, default=None)
+
+
+def opcoes_do_args(args):
+    return {
+        "latencia_ms": args.latencia_ms,
+        "variacao_ms": args.variacao_ms,
+        "taxa_erro": args.taxa_erro,
+        "limite_por_segundo": args.limite_por_segundo,
+        "rajada_429_a_cada": args.rajada_429_a_cada,
+        "rajada_429_tamanho": args.rajada_429_tamanho,
+        "retry_after": args.retry_after,
+        "webhook_url": args.webhook_url,
+        "webhook_modo": args.webhook_modo,
+        "taxa_resposta": args.taxa_resposta,
+        "atraso_webhook_ms": args.atraso_webhook_ms,
+        "semente": args.semente
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulador local de provedores de WhatsApp.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8099)
+    adicionar_argumentos(parser)
+    args = parser.parse_args()
+
+    servidor = criar_servidor(args.host, args.porta, **opcoes_do_args(args))
+    print(f"[SIMULADOR WHATSAPP] Ouvindo em http://{args.host}:{servidor.server_port}")
+    print(f"  TWILIO_API_BASE_URL=http://{args.host}:{servidor.server_port}")
+    print(f"  WHATSAPP_GRAPH_BASE_URL=http://{args.host}:{servidor.server_port}")
+    print(f"  WHATSAPP_API_URL=http://{args.host}:{servidor.server_port}/enviar")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,156 @@
+import ssl
+import socket
+import threading
+import http.client
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from utils import ler_env
+
+ERROS_CONEXAO_REAPROVEITADA = (
+    http.client.RemoteDisconnected,
+    http.client.CannotSendRequest,
+    BrokenPipeError,
+    ConnectionResetError
+)
+
+
+class PoolConexoes:
+    # Conexões HTTP/1.1 keep-alive reaproveitadas por (esquema, host, porta).
+    def __init__(self, max_por_host=10, timeout_conexao=5.0, timeout_leitura=20.0):
+        self.max_por_host = max_por_host
+        self.timeout_conexao = timeout_conexao
+        self.timeout_leitura = timeout_leitura
+        self._livres = {}
+        self._trava = threading.Lock()
+        self._local = threading.local()
+        self._contexto_ssl = ssl.create_default_context()
+
+    def _nova_conexao(self, chave):
+        esquema, host, porta = chave
+        if esquema == "https":
+            conexao = http.client.HTTPSConnection(
+                host, porta, timeout=self.timeout_conexao, context=self._contexto_ssl
+            )
+        else:
+            conexao = http.client.HTTPConnection(host, porta, timeout=self.timeout_conexao)
+
+        conexao.connect()
+        # Cabeçalho e corpo saem em writes separados; sem TCP_NODELAY o
+        # Nagle segura o corpo até o ACK atrasado do servidor.
+        conexao.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conexao.sock.settimeout(self.timeout_leitura)
+        return conexao
+
+    def _obter(self, chave):
+        fixadas = getattr(self._local, "fixadas", None)
+        if fixadas is not None and chave in fixadas:
+            return fixadas[chave], True
+
+        with self._trava:
+            livres = self._livres.get(chave)
+            if livres:
+                return livres.pop(), True
+
+        return self._nova_conexao(chave), False
+
+    def _devolver(self, chave, conexao):
+        fixadas = getattr(self._local, "fixadas", None)
+        if fixadas is not None:
+            fixadas[chave] = conexao
+            return
+
+        with self._trava:
+            livres = self._livres.setdefault(chave, [])
+            if len(livres) < self.max_por_host:
+                livres.append(conexao)
+                return
+
+        conexao.close()
+
+    def _descartar(self, chave, conexao):
+        fixadas = getattr(self._local, "fixadas", None)
+        if fixadas is not None and fixadas.get(chave) is conexao:
+            del fixadas[chave]
+        conexao.close()
+
+    def requisitar(self, metodo, url, corpo=None, cabecalhos=None):
+        partes = urlsplit(url)
+        esquema = partes.scheme.lower()
+        porta = partes.port or (443 if esquema == "https" else 80)
+        chave = (esquema, partes.hostname, porta)
+        caminho = partes.path or "/"
+        if partes.query:
+            caminho = f"{caminho}?{partes.query}"
+
+        # Uma conexão ociosa pode ter sido fechada pelo servidor; nesse caso
+        # repete uma vez com conexão nova.
+        for tentativa in range(2):
+            conexao, reaproveitada = self._obter(chave)
+            try:
+                conexao.request(metodo, caminho, body=corpo, headers=cabecalhos or {})
+                resposta = conexao.getresponse()
+                conteudo = resposta.read()
+            except ERROS_CONEXAO_REAPROVEITADA:
+                self._descartar(chave, conexao)
+                if reaproveitada and tentativa == 0:
+                    continue
+                raise
+            except Exception:
+                self._descartar(chave, conexao)
+                raise
+
+            if resposta.will_close:
+                self._descartar(chave, conexao)
+            else:
+                self._devolver(chave, conexao)
+
+            return (
+                resposta.status,
+                {nome.lower(): valor for nome, valor in resposta.getheaders()},
+                conteudo.decode("utf-8", errors="replace")
+            )
+
+    @contextmanager
+    def sessao(self):
+        # Fixa uma conexão por host para a thread atual: envios em massa
+        # reaproveitam o mesmo socket do início ao fim.
+        if getattr(self._local, "fixadas", None) is not None:
+            yield self
+            return
+
+        self._local.fixadas = {}
+        try:
+            yield self
+        finally:
+            fixadas = self._local.fixadas
+            self._local.fixadas = None
+            for chave, conexao in fixadas.items():
+                self._devolver(chave, conexao)
+
+    def fechar(self):
+        with self._trava:
+            livres, self._livres = self._livres, {}
+        for conexoes in livres.values():
+            for conexao in conexoes:
+                conexao.close()
+
+
+_pool_padrao = None
+_trava_pool = threading.Lock()
+
+
+def obter_pool():
+    global _pool_padrao
+    if _pool_padrao is None:
+        with _trava_pool:
+            if _pool_padrao is None:
+                _pool_padrao = PoolConexoes(
+                    max_por_host=int(ler_env("WHATSAPP_POOL_MAX_POR_HOST", "10") or 10),
+                    timeout_conexao=float(ler_env("WHATSAPP_TIMEOUT_CONEXAO", "5") or 5),
+                    timeout_leitura=float(ler_env("WHATSAPP_TIMEOUT_LEITURA", "20") or 20)
+                )
+    return _pool_padrao
+
+
+def eh_timeout(erro):
+    return isinstance(erro, (socket.timeout, TimeoutError))
@@ -0,0 +1,26 @@
+import os
+import re
+
+
+def normalizar_telefone(telefone):
+    digitos = re.sub(r"\D", "", telefone or "")
+    if not digitos:
+        return ""
+
+    if digitos.startswith("55"):
+        return digitos
+
+    if len(digitos) in (10, 11):
+        return f"55{digitos}"
+
+    return digitos
+
+
+def ler_env(nome, padrao=""):
+    valor = os.environ.get(nome, padrao)
+    if valor is None:
+        return ""
+    texto = str(valor).strip()
+    if len(texto) >= 2 and ((texto[0] == '"' and texto[-1] == '"') or (texto[0] == "'" and texto[-1] == "'")):
+        texto = texto[1:-1].strip()
+    return texto
@@ -0,0 +1,178 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from itertools import chain
+from sqlalchemy import delete, event, func, inspect, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from database import db
+from models import Agendamento, AlteracaoAgenda, VersaoDia
+from utils import ler_env
+
+# =========================
+# VERSÃO POR DIA
+# =========================
+
+
+def incrementar_versoes_dias(session, datas):
+    # Usa a conexão direto (Core), então pode rodar dentro de um flush.
+    datas = sorted({data for data in datas if data is not None})
+    if not datas:
+        return
+
+    conexao = session.connection()
+    tabela = VersaoDia.__table__
+    dialeto = conexao.dialect.name
+
+    if dialeto in ("sqlite", "postgresql"):
+        modulo = sqlite if dialeto == "sqlite" else postgresql
+        comando = modulo.insert(tabela).values([{"data": data, "versao": 1} for data in datas])
+        comando = comando.on_conflict_do_update(
+            index_elements=[tabela.c.data],
+            set_={"versao": tabela.c.versao + 1}
+        )
+        conexao.execute(comando)
+        return
+
+    conexao.execute(
+        update(tabela).where(tabela.c.data.in_(datas)).values(versao=tabela.c.versao + 1)
+    )
+    existentes = set(conexao.execute(select(tabela.c.data).where(tabela.c.data.in_(datas))).scalars())
+    faltando = [{"data": data, "versao": 1} for data in datas if data not in existentes]
+    if faltando:
+        conexao.execute(tabela.insert(), faltando)
+
+
+def hora_texto(valor):
+    return valor.strftime("%H:%M") if valor is not None else None
+
+
+def alteracao_de(agendamento, acao, data=None, profissional_id=None, hora_inicio=None):
+    return {
+        "data": data or agendamento.data,
+        "profissional_id": profissional_id or agendamento.profissional_id,
+        "hora_inicio": hora_texto(hora_inicio or agendamento.hora_inicio),
+        "acao": acao,
+        "cliente_nome": None if acao == "removido" else agendamento.cliente_nome,
+        "cliente_telefone": None if acao == "removido" else agendamento.cliente_telefone,
+        "status": None if acao == "removido" else agendamento.status
+    }
+
+
+def coletar_alteracoes(session):
+    alteracoes = []
+    for objeto in chain(session.new, session.dirty, session.deleted):
+        if not isinstance(objeto, Agendamento):
+            continue
+
+        if objeto in session.new:
+            alteracoes.append(alteracao_de(objeto, "criado"))
+        elif objeto in session.deleted:
+            alteracoes.append(alteracao_de(objeto, "removido"))
+        elif session.is_modified(objeto):
+            # Se a célula mudou (dia, profissional ou horário), a antiga fica
+            # vazia e a nova recebe o agendamento.
+            estado = inspect(objeto).attrs
+            anteriores = {
+                campo: (getattr(estado, campo).history.deleted or [None])[0]
+                for campo in ("data", "profissional_id", "hora_inicio")
+            }
+            if any(valor is not None for valor in anteriores.values()):
+                alteracoes.append(alteracao_de(
+                    objeto,
+                    "removido",
+                    data=anteriores["data"],
+                    profissional_id=anteriores["profissional_id"],
+                    hora_inicio=anteriores["hora_inicio"]
+                ))
+                alteracoes.append(alteracao_de(objeto, "criado"))
+            else:
+                alteracoes.append(alteracao_de(objeto, "atualizado"))
+
+    return alteracoes
+
+
+def registrar_alteracoes(session, alteracoes):
+    # Grava o feed e incrementa a versão dos dias na mesma transação da
+    # escrita: quem vê a versão nova também vê os eventos.
+    if not alteracoes:
+        return
+
+    agora = datetime.utcnow()
+    session.connection().execute(
+        AlteracaoAgenda.__table__.insert(),
+        [dict(alteracao, criado_em=agora) for alteracao in alteracoes]
+    )
+    incrementar_versoes_dias(session, {alteracao["data"] for alteracao in alteracoes})
+
+
+@event.listens_for(db.session, "before_flush")
+def marcar_dias_alterados(session, _contexto, _instancias):
+    # Toda escrita de Agendamento pela sessão (rotas, webhook) passa por
+    # aqui. Escritas em massa por Core chamam registrar_alteracoes direto;
+    # o registro de envio de lembretes não aparece nas grades e fica de
+    # fora de propósito.
+    registrar_alteracoes(session, coletar_alteracoes(session))
+
+
+def ler_versao_dia(data):
+    return db.session.execute(
+        select(VersaoDia.versao).where(VersaoDia.data == data)
+    ).scalar() or 0
+
+
+def ultimo_id_alteracao(data):
+    return db.session.execute(
+        select(func.max(AlteracaoAgenda.id)).where(AlteracaoAgenda.data == data)
+    ).scalar() or 0
+
+
+def carregar_alteracoes(data, depois_de_id, limite=500):
+    linhas = db.session.execute(
+        select(
+            AlteracaoAgenda.id,
+            AlteracaoAgenda.profissional_id,
+            AlteracaoAgenda.hora_inicio,
+            AlteracaoAgenda.acao,
+            AlteracaoAgenda.cliente_nome,
+            AlteracaoAgenda.cliente_telefone,
+            AlteracaoAgenda.status
+        )
+        .where(AlteracaoAgenda.data == data, AlteracaoAgenda.id > depois_de_id)
+        .order_by(AlteracaoAgenda.id.asc())
+        .limit(limite)
+    ).all()
+    return [linha._asdict() for linha in linhas]
+
+
+def limpar_alteracoes_antigas(dias=7):
+    limite = datetime.utcnow() - timedelta(days=dias)
+    resultado = db.session.execute(
+        delete(AlteracaoAgenda).where(AlteracaoAgenda.criado_em < limite)
+    )
+    db.session.commit()
+    return resultado.rowcount
+
+
+# =========================
+# CACHE DO HTML DAS GRADES
+# =========================
+
+_html_por_chave = OrderedDict()
+_trava_html = threading.Lock()
+
+
+def obter_html_em_cache(chave):
+    with _trava_html:
+        html = _html_por_chave.get(chave)
+        if html is not None:
+            _html_por_chave.move_to_end(chave)
+        return html
+
+
+def guardar_html_em_cache(chave, html):
+    limite = int(ler_env("AGENDA_CACHE_HTML_MAX", "256") or 256)
+    with _trava_html:
+        _html_por_chave[chave] = html
+        _html_por_chave.move_to_end(chave)
+        while len(_html_por_chave) > limite:
+            _html_por_chave.popitem(last=False)
@@ -0,0 +1,212 @@
+import json
+import time
+import base64
+from urllib.parse import urlencode
+from limitador import obter_limitador, interpretar_retry_after
+from metricas import incrementar, observar
+from transporte_http import obter_pool, eh_timeout
+from utils import ler_env, normalizar_telefone
+
+
+def resultado_envio(ok, status_http=None, resposta="", message_id=None, erro=None, tentar_novamente=False, retry_after=None):
+    return {
+        "ok": ok,
+        "status_http": status_http,
+        "resposta": resposta,
+        "message_id": message_id,
+        "erro": erro,
+        "tentar_novamente": tentar_novamente,
+        "retry_after": retry_after
+    }
+
+
+def telefone_para_twilio(telefone):
+    digitos = normalizar_telefone(telefone)
+    if not digitos:
+        return ""
+    return f"+{digitos}"
+
+
+def montar_mensagem_confirmacao(agendamento):
+    return (
+        f"Olá, {agendamento.cliente_nome}! "
+        f"Lembrete do seu agendamento no dia {agendamento.data.strftime('%d/%m/%Y')}, "
+        f"às {agendamento.hora_inicio.strftime('%H:%M')}. "
+        "Responda 1 para confirmar ou 2 para cancelar."
+    )
+
+
+def extrair_message_id(corpo):
+    try:
+        dados = json.loads(corpo or "{}")
+    except ValueError:
+        return None
+
+    if not isinstance(dados, dict):
+        return None
+
+    if dados.get("sid"):
+        return dados["sid"]
+
+    mensagens = dados.get("messages")
+    if isinstance(mensagens, list) and mensagens and isinstance(mensagens[0], dict):
+        return mensagens[0].get("id")
+
+    return dados.get("id") or dados.get("message_id")
+
+
+def requisitar_provedor(url, corpo, cabecalhos):
+    try:
+        status, cabecalhos_resposta, resposta = obter_pool().requisitar("POST", url, corpo, cabecalhos)
+    except Exception as erro_geral:
+        if eh_timeout(erro_geral):
+            return resultado_envio(False, erro="Tempo esgotado na comunicação com o provedor.", tentar_novamente=True)
+        return resultado_envio(False, erro=f"Falha de conexão: {erro_geral}", tentar_novamente=True)
+
+    if 200 <= status < 300:
+        return resultado_envio(
+            True,
+            status_http=status,
+            resposta=resposta,
+            message_id=extrair_message_id(resposta)
+        )
+
+    return resultado_envio(
+        False,
+        status_http=status,
+        resposta=resposta,
+        erro=f"HTTP {status}",
+        tentar_novamente=status == 429 or status >= 500,
+        retry_after=interpretar_retry_after(cabecalhos_resposta.get("retry-after"))
+    )
+
+
+def executar_requisicao(url, corpo, cabecalhos, provider, remetente):
+    # Respostas 429/503 não queimam a mensagem: o limitador do remetente
+    # reduz a taxa, espera o Retry-After e repete, até um teto de espera.
+    limitador = obter_limitador(provider, remetente)
+    repeticoes = int(ler_env("WHATSAPP_LIMITE_REPETICOES", "3") or 3)
+    espera_maxima = float(ler_env("WHATSAPP_LIMITE_ESPERA_MAXIMA", "30") or 30)
+
+    for tentativa in range(repeticoes + 1):
+        limitador.aguardar()
+        inicio = time.perf_counter()
+        resultado = requisitar_provedor(url, corpo, cabecalhos)
+        status = resultado["status_http"]
+        observar("agenda_whatsapp_envio_segundos", time.perf_counter() - inicio, provider=provider)
+        incrementar(
+            "agenda_whatsapp_envios_total",
+            provider=provider,
+            resultado="limitado" if status == 429 else ("sucesso" if resultado["ok"] else "falha")
+        )
+
+        if status in (429, 503):
+            # Acima da espera máxima o resultado sai como está (tentar de
+            # novo, com retry_after) e processar_fila devolve a mensagem para
+            # a fila com proxima_tentativa_em depois do Retry-After.
+            limitador.registrar_limitacao(resultado["retry_after"], espera_maxima)
+            if tentativa < repeticoes and (resultado["retry_after"] or 0) <= espera_maxima:
+                continue
+        elif status is not None and status < 500:
+            limitador.registrar_sucesso()
+
+        return resultado
+
+
+def enviar_whatsapp_cloud_api(telefone, mensagem, api_token, phone_number_id):
+    api_version = ler_env("WHATSAPP_API_VERSION", "v21.0")
+    base_url = ler_env("WHATSAPP_GRAPH_BASE_URL", "https://graph.facebook.com").rstrip("/")
+    api_url = f"{base_url}/{api_version}/{phone_number_id}/messages"
+
+    payload = json.dumps({
+        "messaging_product": "whatsapp",
+        "to": telefone,
+        "type": "text",
+        "text": {"body": mensagem}
+    }).encode("utf-8")
+
+    return executar_requisicao(api_url, payload, {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_token}"
+    }, "meta", phone_number_id)
+
+
+def enviar_whatsapp_twilio(telefone, mensagem):
+    account_sid = ler_env("TWILIO_ACCOUNT_SID")
+    auth_token = ler_env("TWILIO_AUTH_TOKEN")
+    numero_origem = ler_env("TWILIO_WHATSAPP_FROM")
+
+    if not account_sid or not auth_token or not numero_origem:
+        return resultado_envio(False, erro="Twilio não configurado.")
+
+    destino = telefone_para_twilio(telefone)
+    if not destino:
+        return resultado_envio(False, erro="Telefone inválido.")
+
+    base_url = ler_env("TWILIO_API_BASE_URL", "https://api.twilio.com").rstrip("/")
+    api_url = f"{base_url}/2010-04-01/Accounts/{account_sid}/Messages.json"
+    payload = urlencode({
+        "To": f"whatsapp:{destino}",
+        "From": numero_origem,
+        "Body": mensagem
+    }).encode("utf-8")
+
+    credenciais = f"{account_sid}:{auth_token}".encode("utf-8")
+    auth_header = base64.b64encode(credenciais).decode("utf-8")
+
+    return executar_requisicao(api_url, payload, {
+        "Content-Type": "application/x-www-form-urlencoded",
+        "Authorization": f"Basic {auth_header}"
+    }, "twilio", numero_origem)
+
+
+def enviar_whatsapp(telefone, mensagem):
+    modo_simulado = ler_env("WHATSAPP_SIMULADO", "1") == "1"
+    provider = ler_env("WHATSAPP_PROVIDER", "").lower()
+
+    twilio_configurado = bool(
+        ler_env("TWILIO_ACCOUNT_SID") and
+        ler_env("TWILIO_AUTH_TOKEN") and
+        ler_env("TWILIO_WHATSAPP_FROM")
+    )
+
+    if not provider:
+        provider = "twilio" if twilio_configurado else "meta"
+
+    if not telefone:
+        return resultado_envio(False, erro="Telefone inválido.")
+
+    if modo_simulado:
+        print(f"[WHATSAPP SIMULADO] Para: {telefone} | Msg: {mensagem}")
+        incrementar("agenda_whatsapp_envios_total", provider="simulado", resultado="sucesso")
+        return resultado_envio(True)
+
+    if provider == "twilio":
+        return enviar_whatsapp_twilio(telefone, mensagem)
+
+    api_url = ler_env("WHATSAPP_API_URL")
+    api_token = ler_env("WHATSAPP_API_TOKEN")
+    phone_number_id = ler_env("WHATSAPP_PHONE_NUMBER_ID")
+
+    if phone_number_id and api_token:
+        return enviar_whatsapp_cloud_api(telefone, mensagem, api_token, phone_number_id)
+
+    if not api_url or not api_token:
+        return resultado_envio(False, erro="API de WhatsApp não configurada.")
+
+    payload = json.dumps({
+        "phone": telefone,
+        "message": mensagem
+    }).encode("utf-8")
+
+    return executar_requisicao(api_url, payload, {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_token}"
+    }, "api", api_url)
+
+
+def enviar_whatsapp_confirmacao(agendamento):
+    return enviar_whatsapp(
+        normalizar_telefone(agendamento.cliente_telefone),
+        montar_mensagem_confirmacao(agendamento)
+    )
@@ -0,0 +1,13 @@
+from app import create_app
+from fila_whatsapp import executar_worker
+from utils import ler_env
+
+app = create_app()
+
+if __name__ == "__main__":
+    executar_worker(
+        app,
+        continuo=True,
+        intervalo=float(ler_env("WHATSAPP_FILA_INTERVALO", "5") or 5),
+        tamanho_lote=int(ler_env("WHATSAPP_FILA_LOTE", "50") or 50)
+    )